@@ -0,0 +1,331 @@
+# -*- coding: utf8 -*-
+# 书籍文本与识别结果的对齐
+# 以两边都只出现一次的"稀有词"为锚点（patience diff），在锚点之间递归寻找新的锚点，
+# 只有找不到锚点的小区段才做带状动态规划，整体复杂度接近线性。
+# 输出结构与数据库函数 batch_insert_alignment_data 的参数一致。
+import re
+import sys
+import json
+import time
+import argparse
+from bisect import bisect_left
+import numpy as np
+
+# 英文单词（含缩写）或单个汉字
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:['’][A-Za-z0-9]+)*|[一-鿿]")
+# 句末标点后接空白处断句，句末可带右引号/括号
+SENTENCE_END_RE = re.compile(r'(?<=[.!?。！？…])["\'”’）)]*\s+')
+HTML_TAG_RE = re.compile(r'<[^>]*>')
+MD_IMAGE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+MD_LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+
+# 无锚点区段做完整DP的单元格上限，超过后改用带状DP
+MAX_FULL_DP_CELLS = 250000
+# 带状DP在对角线两侧的最小宽度
+MIN_BAND = 32
+
+
+def normalize(token):
+    return token.lower().replace('’', "'")
+
+
+def clean_text(text):
+    """去掉HTML标签和Markdown图片/链接，保留可朗读的文字"""
+    text = HTML_TAG_RE.sub('', text or '')
+    text = MD_IMAGE_RE.sub('', text)
+    text = MD_LINK_RE.sub(r'\1', text)
+    return text.replace('**', '').replace('`', '')
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_END_RE.split(text) if s.strip()]
+
+
+def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    """在两个区段中找出各只出现一次的相同词，返回单调递增的锚点对"""
+    count_a = {}
+    for i in range(a_lo, a_hi):
+        tok = a[i]
+        count_a[tok] = count_a.get(tok, 0) + 1
+    pos_b = {}
+    for j in range(b_lo, b_hi):
+        tok = b[j]
+        if count_a.get(tok) == 1:
+            pos_b[tok] = -1 if tok in pos_b else j
+    candidates = [(i, pos_b[a[i]]) for i in range(a_lo, a_hi)
+                  if count_a[a[i]] == 1 and pos_b.get(a[i], -1) >= 0]
+    if not candidates:
+        return []
+
+    # 最长递增子序列，保证锚点在两边顺序一致
+    tails = []
+    tail_idx = []
+    prev = [-1] * len(candidates)
+    for k, (_, j) in enumerate(candidates):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(k)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = k
+        prev[k] = tail_idx[pos - 1] if pos > 0 else -1
+    chain = []
+    k = tail_idx[-1]
+    while k >= 0:
+        chain.append(candidates[k])
+        k = prev[k]
+    chain.reverse()
+    return chain
+
+
+def _banded_lcs(a, b, a_lo, a_hi, b_lo, b_hi):
+    """在无锚点的小区段上做最长公共子序列，区段过大时只计算对角线附近的带状区域"""
+    n, m = a_hi - a_lo, b_hi - b_lo
+    if n == 0 or m == 0:
+        return []
+    if n * m <= MAX_FULL_DP_CELLS:
+        band = m
+    else:
+        band = max(MIN_BAND, abs(n - m) + MIN_BAND, MAX_FULL_DP_CELLS // max(n, 1))
+
+    # score[i][j - lo_i]，只保存带内的值
+    rows = []
+    lows = []
+    prev_row, prev_lo = None, 0
+    for i in range(n + 1):
+        center = i * m // n
+        lo = max(0, center - band)
+        hi = min(m, center + band)
+        row = [0] * (hi - lo + 1)
+        if i > 0:
+            tok = a[a_lo + i - 1]
+            prev_hi = prev_lo + len(prev_row) - 1
+            for j in range(lo, hi + 1):
+                # 带外的格子按0处理，得到的是下界
+                best = row[j - lo - 1] if j > lo else 0
+                if prev_lo <= j <= prev_hi and prev_row[j - prev_lo] > best:
+                    best = prev_row[j - prev_lo]
+                if prev_lo <= j - 1 <= prev_hi and b[b_lo + j - 1] == tok:
+                    diag = prev_row[j - 1 - prev_lo] + 1
+                    if diag > best:
+                        best = diag
+                row[j - lo] = best
+        rows.append(row)
+        lows.append(lo)
+        prev_row, prev_lo = row, lo
+
+    def score(i, j):
+        lo = lows[i]
+        if lo <= j < lo + len(rows[i]):
+            return rows[i][j - lo]
+        return -1
+
+    # 回溯
+    pairs = []
+    i, j = n, min(m, lows[n] + len(rows[n]) - 1)
+    while i > 0 and j > 0:
+        cur = score(i, j)
+        if a[a_lo + i - 1] == b[b_lo + j - 1] and score(i - 1, j - 1) == cur - 1:
+            pairs.append((a_lo + i - 1, b_lo + j - 1))
+            i -= 1
+            j -= 1
+        elif score(i - 1, j) == cur or j - 1 < lows[i]:
+            i -= 1
+        else:
+            j -= 1
+    pairs.reverse()
+    return pairs
+
+
+def align_tokens(a, b):
+    """对齐两个词序列，返回匹配的下标对 [(i, j), ...]，按 i 递增"""
+    pairs = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        # 去掉公共前缀和后缀
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            pairs.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            pairs.append((a_hi - 1, b_hi - 1))
+            a_hi -= 1
+            b_hi -= 1
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if not anchors:
+            pairs.extend(_banded_lcs(a, b, a_lo, a_hi, b_lo, b_hi))
+            continue
+
+        # 锚点之间的区段继续递归
+        last_i, last_j = a_lo, b_lo
+        for i, j in anchors:
+            pairs.append((i, j))
+            stack.append((last_i, i, last_j, j))
+            last_i, last_j = i + 1, j + 1
+        stack.append((last_i, a_hi, last_j, b_hi))
+
+    pairs.sort()
+    return pairs
+
+
+def tokenize_blocks(blocks):
+    """把语境块切成句子和词
+
+    返回 (tokens, sentences)：tokens 为规范化后的词列表，
+    sentences 为 [(block_index, text, first_token, token_texts), ...]
+    """
+    tokens = []
+    sentences = []
+    for block_index, block in enumerate(blocks):
+        for text in split_sentences(clean_text(block['content'])):
+            words = TOKEN_RE.findall(text)
+            if not words:
+                continue
+            sentences.append((block_index, text, len(tokens), words))
+            tokens.extend(normalize(w) for w in words)
+    return tokens, sentences
+
+
+def tokenize_transcript(words):
+    """把识别结果的词展开为规范化词序列，返回 (tokens, owner)，owner 为每个词所属的原始词下标"""
+    tokens = []
+    owner = []
+    for index, word in enumerate(words):
+        for tok in TOKEN_RE.findall(word['word']):
+            tokens.append(normalize(tok))
+            owner.append(index)
+    return tokens, owner
+
+
+def align_chapter(words, blocks, speech_id):
+    """对齐识别结果与一章书的语境块
+
+    words: ResultStorage._process_result 产出的词（word、begin_time、end_time）
+    blocks: [{'id': 语境块ID, 'content': 文本}, ...]，按章节顺序排列
+    返回可直接传给 batch_insert_alignment_data 的字典
+    """
+    book_tokens, sentences = tokenize_blocks(blocks)
+    speech_tokens, owner = tokenize_transcript(words)
+    if not book_tokens:
+        raise ValueError("语境块中没有可对齐的文本")
+    if not speech_tokens:
+        raise ValueError("识别结果中没有词")
+
+    pairs = align_tokens(book_tokens, speech_tokens)
+    if not pairs:
+        raise ValueError("文本与识别结果无法对齐")
+
+    word_begin = np.fromiter((w['begin_time'] for w in words), dtype=np.float64, count=len(words))
+    word_end = np.fromiter((w['end_time'] for w in words), dtype=np.float64, count=len(words))
+    matched = np.array([i for i, _ in pairs], dtype=np.int64)
+    source = np.array([owner[j] for _, j in pairs], dtype=np.int64)
+
+    # 未匹配的书中词按前后匹配词的时间线性插值
+    positions = np.arange(len(book_tokens))
+    token_begin = np.interp(positions, matched, word_begin[source]).round().astype(np.int64)
+    token_end = np.interp(positions, matched, word_end[source]).round().astype(np.int64)
+    token_end = np.maximum(token_end, token_begin)
+
+    result_blocks = [{
+        'blockId': block['id'],
+        'originalContent': block['content'],
+        'sentences': []
+    } for block in blocks]
+    order = 1
+    total_words = 0
+    for block_index, text, first, token_texts in sentences:
+        last = first + len(token_texts) - 1
+        block_sentences = result_blocks[block_index]['sentences']
+        block_sentences.append({
+            'order': order,
+            'textContent': text,
+            'beginTime': int(token_begin[first]),
+            'endTime': int(token_end[last]),
+            'orderInBlock': len(block_sentences) + 1,
+            'words': [{
+                'word': word,
+                'beginTime': int(b),
+                'endTime': int(e)
+            } for word, b, e in zip(token_texts,
+                                    token_begin[first:last + 1].tolist(),
+                                    token_end[first:last + 1].tolist())]
+        })
+        order += 1
+        total_words += len(token_texts)
+
+    return {
+        'speechId': speech_id,
+        'blocks': [b for b in result_blocks if b['sentences']],
+        'totalSentences': order - 1,
+        'totalWords': total_words,
+        'matchedWords': len(pairs)
+    }
+
+
+def _synthetic_chapter(n_words, seed=0):
+    """生成基准测试用的章节：Zipf分布的词表，识别结果带随机增删改"""
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(20000)]
+    ids = np.minimum(rng.zipf(1.3, n_words), len(vocab)) - 1
+    book = [vocab[i] for i in ids]
+
+    transcript = []
+    t = 0
+    for word in book:
+        r = rng.random()
+        if r < 0.03:
+            continue  # 漏识别
+        if r < 0.06:
+            word = vocab[rng.integers(len(vocab))]  # 识别错误
+        transcript.append({'word': word, 'begin_time': t, 'end_time': t + 250})
+        t += 300
+        if r > 0.98:
+            transcript.append({'word': 'um', 'begin_time': t, 'end_time': t + 200})  # 多识别
+            t += 250
+
+    blocks = []
+    per_block = 120
+    for k in range(0, n_words, per_block):
+        chunk = book[k:k + per_block]
+        text = ' '.join(' '.join(chunk[s:s + 15]) + '.' for s in range(0, len(chunk), 15))
+        blocks.append({'id': f"block-{k // per_block}", 'content': text})
+    return transcript, blocks
+
+
+def benchmark(sizes=(5000, 20000, 80000)):
+    for n in sizes:
+        transcript, blocks = _synthetic_chapter(n)
+        start = time.perf_counter()
+        aligned = align_chapter(transcript, blocks, 'benchmark')
+        elapsed = time.perf_counter() - start
+        print(f"{n:>7} 词: {elapsed * 1000:8.1f} ms, "
+              f"匹配 {aligned['matchedWords']}/{aligned['totalWords']}, "
+              f"{aligned['totalSentences']} 句")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='书籍文本与识别结果对齐')
+    parser.add_argument('--result', help='ResultStorage 保存的 JSON 结果文件')
+    parser.add_argument('--blocks', help='语境块 JSON 文件：[{"id": ..., "content": ...}]')
+    parser.add_argument('--speech_id', help='speech_results 记录ID')
+    parser.add_argument('--benchmark', action='store_true', help='在合成的整章数据上测试对齐耗时')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        sys.exit(0)
+    if not (args.result and args.blocks and args.speech_id):
+        parser.error('需要 --result、--blocks 和 --speech_id')
+
+    with open(args.result, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    with open(args.blocks, 'r', encoding='utf-8') as f:
+        blocks = json.load(f)
+
+    aligned = align_chapter(result['words'], blocks, args.speech_id)
+    print(json.dumps(aligned, ensure_ascii=False))
@@ -0,0 +1,51 @@
+import subprocess
+import numpy as np
+
+# 统一的解码参数：单声道 16kHz，和识别服务的采样率保持一致
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_BLOCK_SECONDS = 10.0
+
+
+def iter_pcm_blocks(source, sample_rate=DEFAULT_SAMPLE_RATE, block_seconds=DEFAULT_BLOCK_SECONDS):
+    """用ffmpeg流式解码音频（本地路径或URL），逐块产出float32单声道PCM
+
+    每块最多 block_seconds 秒，内存占用只和块大小有关，与音频总时长无关
+    """
+    block_samples = int(sample_rate * block_seconds)
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error',
+        '-i', str(source),
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ac', '1', '-ar', str(sample_rate),
+        '-'
+    ]
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("未找到ffmpeg，请先安装ffmpeg并加入PATH")
+
+    try:
+        while True:
+            raw = process.stdout.read(block_samples * 2)
+            if not raw:
+                break
+            # 奇数字节只可能出现在流末尾，丢弃半个采样
+            usable = len(raw) - (len(raw) % 2)
+            block = np.frombuffer(raw[:usable], dtype='<i2').astype(np.float32)
+            block *= 1.0 / 32768.0
+            yield block
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode('utf-8', errors='replace')
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"音频解码失败 ({returncode})：{stderr.strip()}")
+
+
+def analyze(source, consumers, sample_rate=DEFAULT_SAMPLE_RATE, block_seconds=DEFAULT_BLOCK_SECONDS):
+    """只解码一次音频，把每个PCM块依次交给多个分析器（带 add(block) 方法，如语音区间、波形峰值）"""
+    for block in iter_pcm_blocks(source, sample_rate, block_seconds):
+        for consumer in consumers:
+            consumer.add(block)
+    return consumers
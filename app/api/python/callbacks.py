@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 未被领取的回调最多保留多久（秒），防止无人等待的回调无限堆积
+UNCLAIMED_TTL = 3600
+
+
+class CallbackRegistry:
+    """按 TaskId 唤醒正在等待识别完成的 fileTrans
+
+    回调接口没有鉴权，回调内容不可信，只用作"该去查询了"的信号，结果一律由 fileTrans
+    通过 GetTaskResult 向识别服务查询；回调可能早于等待方注册到达（任务很短时），所以先到的会暂存
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._arrived = {}
+
+    def resolve(self, task_id):
+        with self._cond:
+            self._expire()
+            self._arrived[task_id] = time.time()
+            self._cond.notify_all()
+
+    def wait(self, task_id, timeout):
+        """等待某个任务的回调，收到返回True，超时返回False；领取后即从暂存中移除"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while task_id not in self._arrived:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            del self._arrived[task_id]
+            return True
+
+    def _expire(self):
+        cutoff = time.time() - UNCLAIMED_TTL
+        for task_id in [k for k, ts in self._arrived.items() if ts < cutoff]:
+            del self._arrived[task_id]
+
+
+# 进程内共享的回调表，FastAPI 回调路由和 fileTrans 都使用它
+registry = CallbackRegistry()
+
+
+def handle_callback(payload):
+    """处理识别服务推送的回调：只唤醒等待该 TaskId 的 fileTrans，不采用回调中的结果；返回是否找到 TaskId"""
+    task_id = payload.get('TaskId') if isinstance(payload, dict) else None
+    if not task_id or not isinstance(task_id, str):
+        return False
+    registry.resolve(task_id)
+    return True
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            ok = handle_callback(payload)
+        except ValueError:
+            ok = False
+        self.send_response(200 if ok else 400)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_receiver(host='0.0.0.0', port=0):
+    """在后台线程启动一个独立的回调接收服务（命令行模式下使用），返回 server"""
+    server = ThreadingHTTPServer((host, port), _CallbackHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
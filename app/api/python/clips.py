@@ -0,0 +1,308 @@
+# -*- coding: utf8 -*-
+# 逐句音频片段：只解码一次章节音频，按识别结果的 begin_time/end_time 在同一次流式遍历中切出每一句，
+# 用进程池并行编码，写成一个带偏移索引的 .clips 打包文件。
+# 前端读取一次文件头和索引（HEADER_SIZE + ENTRY_SIZE×句数 字节）后，每句只需一次 Range 请求。
+#
+# 文件格式（小端）：
+#   头部   magic 'LFCL' | version u16 | 句数 u32 | 采样率 u32 | 编码名 8s
+#   索引   每句（与结果中 sentences 的顺序相同）：
+#          句子ID（UUID）16s | 片段开始毫秒 u32 | 片段结束毫秒 u32 | 数据偏移 u64 | 数据长度 u32
+#   数据   每句一个完整的音频文件（可单独播放），按开始时间顺序排列，相邻句子可合并为一次请求
+import os
+import sys
+import json
+import time
+import uuid
+import struct
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.audio import iter_pcm_blocks
+
+MAGIC = b'LFCL'
+VERSION = 1
+_HEADER = struct.Struct('<4sHII8s')
+_ENTRY = struct.Struct('<16sIIQI')
+HEADER_SIZE = _HEADER.size
+ENTRY_SIZE = _ENTRY.size
+ENTRY_DTYPE = np.dtype([('id', 'S16'), ('begin', '<u4'), ('end', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+CLIPS_SUFFIX = '.clips'
+# 跟读练习比识别需要更高的频宽，片段按 24kHz 单声道解码
+CLIP_SAMPLE_RATE = 24000
+# 句子前后各多留的毫秒数，避免切掉首尾的辅音
+PAD_MS = 80
+# 编码名 -> (ffmpeg编码器, 容器格式, 码率)
+CODECS = {
+    'mp3': ('libmp3lame', 'mp3', '48k'),
+    'opus': ('libopus', 'ogg', '32k'),
+    'aac': ('aac', 'adts', '48k'),
+}
+DEFAULT_CODEC = 'mp3'
+# 每个进程同时排队的片段数上限，限制待编码PCM占用的内存
+IN_FLIGHT_PER_WORKER = 4
+
+
+class SentenceSlicer:
+    """逐块接收PCM，某一句的结束位置已解码到时即切出该句
+
+    只保留尚未切出的句子所需的采样，内存与最长的一句加一个块有关，与章节时长无关
+    starts/stops 为每句的采样区间 [start, stop)
+    """
+
+    def __init__(self, starts, stops):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.stops = np.asarray(stops, dtype=np.int64)
+        self._pending = np.argsort(self.starts, kind='stable').tolist()
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0
+
+    def add(self, block):
+        """返回本块之后可以切出的 [(句子下标, float32 PCM), ...]"""
+        self._buffer = np.concatenate([self._buffer, block]) if self._buffer.size else block
+        end = self._buffer_start + self._buffer.size
+        ready = []
+        keep = []
+        k = 0
+        while k < len(self._pending) and self.starts[self._pending[k]] < end:
+            i = self._pending[k]
+            if self.stops[i] <= end:
+                ready.append((i, self._slice(i)))
+            else:
+                keep.append(i)
+            k += 1
+        self._pending = keep + self._pending[k:]
+
+        # 丢掉剩余句子都用不到的采样
+        first = min(self.starts[self._pending[0]], end) if self._pending else end
+        drop = first - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start = first
+        return ready
+
+    @property
+    def done(self):
+        return not self._pending
+
+    def finish(self):
+        """音频结束：剩下的句子截到音频末尾"""
+        ready = [(i, self._slice(i)) for i in self._pending]
+        self._pending = []
+        return ready
+
+    def _slice(self, i):
+        a = max(self.starts[i] - self._buffer_start, 0)
+        b = max(self.stops[i] - self._buffer_start, a)
+        return self._buffer[a:b]
+
+
+def _to_s16le(pcm):
+    return np.clip(np.round(pcm * 32768.0), -32768, 32767).astype('<i2').tobytes()
+
+
+def encode_clip(pcm, sample_rate=CLIP_SAMPLE_RATE, codec=DEFAULT_CODEC):
+    """把一段 s16le 单声道PCM编码成完整的音频文件（bytes）"""
+    if not pcm:
+        return b''
+    encoder, container, bitrate = CODECS[codec]
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', '-',
+        '-map_metadata', '-1', '-c:a', encoder, '-b:a', bitrate,
+        '-f', container, '-'
+    ]
+    if container == 'mp3':
+        cmd[-3:-3] = ['-id3v2_version', '0']
+    try:
+        completed = subprocess.run(cmd, input=pcm, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("未找到ffmpeg，请先安装ffmpeg并加入PATH")
+    if completed.returncode != 0:
+        raise RuntimeError(f"片段编码失败 ({completed.returncode})："
+                           f"{completed.stderr.decode('utf-8', errors='replace').strip()}")
+    return completed.stdout
+
+
+def clip_ranges(sentences, sample_rate=CLIP_SAMPLE_RATE, pad_ms=PAD_MS):
+    """每句加上前后余量后的采样区间 (starts, stops)"""
+    begin = np.fromiter((s['begin_time'] for s in sentences), dtype=np.int64, count=len(sentences))
+    end = np.fromiter((s['end_time'] for s in sentences), dtype=np.int64, count=len(sentences))
+    begin = np.maximum(begin - pad_ms, 0)
+    end = np.maximum(end + pad_ms, begin)
+    return begin * sample_rate // 1000, end * sample_rate // 1000
+
+
+class _InlineExecutor:
+    """单进程时直接在当前进程编码（例如已在 reprocess.py 的进程池中运行）"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def extract_clips(source, sentences, path, sample_rate=CLIP_SAMPLE_RATE, codec=DEFAULT_CODEC,
+                  workers=None, pad_ms=PAD_MS):
+    """解码 source 一次，把 sentences（_process_result 生成的行）逐句编码写入 .clips 打包文件
+
+    workers 为编码进程数（默认CPU核数，1 表示在当前进程编码）
+    """
+    if codec not in CODECS:
+        raise ValueError(f"不支持的编码：{codec}，可选 {', '.join(CODECS)}")
+    path = Path(path)
+    n = len(sentences)
+    starts, stops = clip_ranges(sentences, sample_rate, pad_ms)
+    slicer = SentenceSlicer(starts, stops)
+    # 数据按开始时间顺序写出
+    write_order = np.argsort(starts, kind='stable').tolist()
+    locations = [(0, 0)] * n
+    encoded = {}
+    next_write = 0
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * IN_FLIGHT_PER_WORKER
+    in_flight = {}
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else _InlineExecutor()
+    with open(tmp_path, 'wb') as f, executor:
+        f.seek(HEADER_SIZE + ENTRY_SIZE * n)
+
+        def collect(futures):
+            nonlocal next_write
+            for future in futures:
+                encoded[in_flight.pop(future)] = future.result()
+            while next_write < n and write_order[next_write] in encoded:
+                i = write_order[next_write]
+                data = encoded.pop(i)
+                locations[i] = (f.tell(), len(data))
+                f.write(data)
+                next_write += 1
+
+        def submit(ready):
+            for i, pcm in ready:
+                in_flight[executor.submit(encode_clip, _to_s16le(pcm), sample_rate, codec)] = i
+            while len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        for block in iter_pcm_blocks(source, sample_rate):
+            submit(slicer.add(block))
+            # 最后一句之后的音频不必再解码
+            if slicer.done:
+                break
+        submit(slicer.finish())
+        collect(list(in_flight))
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, n, sample_rate, codec.encode('ascii')))
+        f.write(b''.join(
+            _ENTRY.pack(uuid.UUID(str(s['id'])).bytes, int(starts[i] * 1000 // sample_rate),
+                        int(stops[i] * 1000 // sample_rate), *locations[i])
+            for i, s in enumerate(sentences)))
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_index(path):
+    """读取文件头和索引：{'sample_rate', 'codec', 'entries': ENTRY_DTYPE 数组}"""
+    with open(path, 'rb') as f:
+        magic, version, n, sample_rate, codec = _HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError(f"不是句子片段文件：{path}")
+        entries = np.frombuffer(f.read(ENTRY_SIZE * n), dtype=ENTRY_DTYPE)
+    return {'version': version, 'sample_rate': sample_rate, 'codec': codec.rstrip(b'\0').decode('ascii'),
+            'entries': entries}
+
+
+def find_entry(index, key):
+    """按句子下标（int）或句子ID（str）找到索引项的下标"""
+    if isinstance(key, int):
+        return key
+    matches = np.flatnonzero(index['entries']['id'] == uuid.UUID(key).bytes)
+    if not matches.size:
+        raise KeyError(key)
+    return int(matches[0])
+
+
+def read_clip(path, key, index=None):
+    """读取某一句的音频（与前端的 Range 请求等价）"""
+    index = index or read_index(path)
+    entry = index['entries'][find_entry(index, key)]
+    with open(path, 'rb') as f:
+        f.seek(int(entry['offset']))
+        return f.read(int(entry['length']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='逐句音频片段打包')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='为已保存的识别结果生成 .clips')
+    build.add_argument('task_id', help='识别任务ID，或识别结果JSON文件')
+    build.add_argument('--audio', help='音频文件或URL（默认为结果中的 audio_url）')
+    build.add_argument('--output', help='输出文件（默认与结果保存在同一位置）')
+    build.add_argument('--results_dir', default='results', help='结果目录')
+    build.add_argument('--codec', choices=sorted(CODECS), default=DEFAULT_CODEC, help='片段编码')
+    build.add_argument('--workers', type=int, default=os.cpu_count(), help='编码进程数')
+
+    show = subparsers.add_parser('show', help='查看 .clips 的索引，或取出一句')
+    show.add_argument('archive', help='.clips 文件')
+    show.add_argument('--sentence', help='句子下标或句子ID')
+    show.add_argument('--output', help='--sentence 取出的音频写入的文件')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        index = read_index(args.archive)
+        entries = index['entries']
+        if args.sentence is None:
+            print(f"{args.archive}：{entries.size} 句，{index['codec']} {index['sample_rate']}Hz，"
+                  f"{os.path.getsize(args.archive)} 字节")
+            sys.exit(0)
+        key = int(args.sentence) if args.sentence.isdigit() else args.sentence
+        data = read_clip(args.archive, key, index)
+        output = args.output or f"sentence_{args.sentence}.{CODECS[index['codec']][1]}"
+        Path(output).write_bytes(data)
+        print(f"已写出 {output}（{len(data)} 字节）")
+        sys.exit(0)
+
+    from app.api.python.storage import ResultStorage
+
+    storage = ResultStorage(args.results_dir)
+    target = args.output
+    if os.path.isfile(args.task_id):
+        with open(args.task_id, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        target = target or Path(args.task_id).with_suffix(CLIPS_SUFFIX)
+    else:
+        data = storage.load(args.task_id)
+        if data is None:
+            parser.error(f"找不到识别结果：{args.task_id}")
+    source = args.audio or data.get('audio_url')
+    if not source:
+        parser.error('结果中没有 audio_url，请指定 --audio')
+
+    start = time.time()
+    if target:
+        path = extract_clips(source, data['sentences'], target, codec=args.codec, workers=args.workers)
+    else:
+        path = storage._save_clips(data, storage.store.find(args.task_id)[0], source,
+                                   codec=args.codec, workers=args.workers)
+    print(f"{path}：{len(data['sentences'])} 句，{os.path.getsize(path)} 字节，用时 {time.time() - start:.1f}s")
@@ -0,0 +1,228 @@
+import csv
+import numpy as np
+
+from app.api.python.streamjson import dump
+
+# 可导出的文件格式 -> 后缀
+EXPORT_SUFFIXES = {
+    'json': '.json',
+    'csv': '.csv',
+    'srt': '.srt',
+    'vtt': '.vtt',
+    'tsv': '.tsv',
+}
+
+
+def format_timestamps(milliseconds, decimal_mark=','):
+    """批量把毫秒格式化为 HH:MM:SS,mmm（SRT）或 HH:MM:SS.mmm（WebVTT）
+
+    时分秒用 numpy 一次算完，再用一次字符串格式化生成全部结果
+    """
+    ms = np.maximum(np.asarray(milliseconds, dtype=np.int64), 0)
+    if not ms.size:
+        return []
+    hours, rest = np.divmod(ms, 3600000)
+    minutes, rest = np.divmod(rest, 60000)
+    seconds, millis = np.divmod(rest, 1000)
+    fields = tuple(np.stack([hours, minutes, seconds, millis], axis=1).ravel().tolist())
+    template = f"%02d:%02d:%02d{decimal_mark}%03d\n"
+    return (template * ms.size % fields).split('\n')[:-1]
+
+
+# 时间戳按块格式化，流式结果导出时内存里只保留一块
+STAMP_CHUNK = 4096
+
+
+def group_words(sentences, words):
+    """一次遍历把词按 sentence_id 分组，返回与 sentences 对齐的词列表"""
+    by_sentence = {s['id']: [] for s in sentences}
+    for word in words:
+        bucket = by_sentence.get(word['sentence_id'])
+        if bucket is not None:
+            bucket.append(word)
+    return [by_sentence[s['id']] for s in sentences]
+
+
+def iter_groups(sentences, words):
+    """逐句产出 (句子, 该句的词列表)
+
+    words 带有 sentence_positions（每个词所属句子的下标，见 storage._ProcessedRows）且按句子
+    顺序排列时，边读边分组，不把全部词载入内存；否则退回 group_words 整体分组
+    """
+    positions = getattr(words, 'sentence_positions', None)
+    if positions is None or np.any(np.diff(positions) < 0):
+        return zip(sentences, group_words(sentences, words))
+    return _merge_groups(sentences, words, positions)
+
+
+def _merge_groups(sentences, words, positions):
+    words = iter(words)
+    k = 0
+    for i, sentence in enumerate(sentences):
+        group = []
+        # 没有所属句子（-1）的词跳过，与 group_words 一致
+        while k < positions.size and positions[k] <= i:
+            word = next(words)
+            if positions[k] == i:
+                group.append(word)
+            k += 1
+        yield sentence, group
+
+
+class _Stamps:
+    """按下标取格式化后的时间戳，按需分块格式化（写入器顺序访问时每块只格式化一次）"""
+
+    def __init__(self, milliseconds, decimal_mark):
+        self.milliseconds = milliseconds
+        self.decimal_mark = decimal_mark
+        self._start = -1
+        self._chunk = []
+
+    def __getitem__(self, i):
+        start = i - i % STAMP_CHUNK
+        if start != self._start:
+            self._chunk = format_timestamps(self.milliseconds[start:start + STAMP_CHUNK], self.decimal_mark)
+            self._start = start
+        return self._chunk[i - start]
+
+
+def _time_column(sentences, key):
+    column = getattr(sentences, 'columns', {}).get(key)
+    if column is None:
+        column = np.fromiter((s[key] for s in sentences), dtype=np.int64, count=len(sentences))
+    return column
+
+
+def _one_line(text):
+    return ' '.join(str(text).split())
+
+
+class _JsonWriter:
+    """完整结果（含原始返回）在结尾一次写出"""
+
+    def __init__(self, f, stamps):
+        self.f = f
+
+    def sentence(self, i, sentence, words):
+        pass
+
+    def end(self, data):
+        dump(data, self.f, ensure_ascii=False, indent=2)
+
+
+class _CsvWriter:
+    """句子 × 词的明细表，没有词的句子单独占一行"""
+
+    def __init__(self, f, stamps):
+        self.writer = csv.writer(f)
+        self.writer.writerow([
+            "句子ID", "开始时间(ms)", "结束时间(ms)", "文本内容",
+            "语速(字/分)", "情感值", "词ID", "词内容", "词开始时间", "词结束时间"
+        ])
+
+    def sentence(self, i, sentence, words):
+        head = [
+            sentence['id'],
+            sentence['begin_time'],
+            sentence['end_time'],
+            sentence['text_content'],
+            sentence.get('speech_rate', 'N/A'),
+            sentence.get('emotion_value', 'N/A'),
+        ]
+        if words:
+            self.writer.writerows(
+                head + [w['id'], w['word'], w['begin_time'], w['end_time']] for w in words)
+        else:
+            self.writer.writerow(head + ['', '', '', ''])
+
+    def end(self, data):
+        pass
+
+
+class _SrtWriter:
+    def __init__(self, f, stamps):
+        self.f = f
+        self.begins, self.ends = stamps[',']
+
+    def sentence(self, i, sentence, words):
+        self.f.write(f"{i + 1}\n{self.begins[i]} --> {self.ends[i]}\n"
+                     f"{_one_line(sentence['text_content'])}\n\n")
+
+    def end(self, data):
+        pass
+
+
+class _VttWriter:
+    def __init__(self, f, stamps):
+        self.f = f
+        self.begins, self.ends = stamps['.']
+        f.write("WEBVTT\n\n")
+
+    def sentence(self, i, sentence, words):
+        self.f.write(f"{self.begins[i]} --> {self.ends[i]}\n"
+                     f"{_one_line(sentence['text_content'])}\n\n")
+
+    def end(self, data):
+        pass
+
+
+class _TsvWriter:
+    """句子级制表符分隔文本：start / end（毫秒）/ text"""
+
+    def __init__(self, f, stamps):
+        self.f = f
+        f.write("start\tend\ttext\n")
+
+    def sentence(self, i, sentence, words):
+        self.f.write(f"{sentence['begin_time']}\t{sentence['end_time']}\t"
+                     f"{_one_line(sentence['text_content'])}\n")
+
+    def end(self, data):
+        pass
+
+
+_WRITERS = {
+    'json': _JsonWriter,
+    'csv': _CsvWriter,
+    'srt': _SrtWriter,
+    'vtt': _VttWriter,
+    'tsv': _TsvWriter,
+}
+# 各格式需要的时间戳小数点
+_DECIMAL_MARKS = {'srt': ',', 'vtt': '.'}
+
+
+def export(data, targets):
+    """把处理后的结果（见 ResultStorage._process_result）一次遍历写成多种格式
+
+    targets 为 {格式: 文件路径}；句子、词分组和时间戳格式化都只做一次，各写入器共享；
+    句子和词为流式结果的 LazyArray 时边读边写
+    """
+    unknown = set(targets) - set(_WRITERS)
+    if unknown:
+        raise ValueError(f"不支持的导出格式：{', '.join(sorted(unknown))}")
+
+    sentences = data['sentences']
+    stamps = {}
+    for fmt in targets:
+        mark = _DECIMAL_MARKS.get(fmt)
+        if mark is not None and mark not in stamps:
+            stamps[mark] = (_Stamps(_time_column(sentences, 'begin_time'), mark),
+                            _Stamps(_time_column(sentences, 'end_time'), mark))
+
+    files = []
+    writers = []
+    try:
+        for fmt, path in targets.items():
+            f = open(path, 'w', newline='' if fmt == 'csv' else None, encoding='utf-8')
+            files.append(f)
+            writers.append(_WRITERS[fmt](f, stamps))
+        for i, (sentence, words) in enumerate(iter_groups(sentences, data['words'])):
+            for writer in writers:
+                writer.sentence(i, sentence, words)
+        for writer in writers:
+            writer.end(data)
+    finally:
+        for f in files:
+            f.close()
+    return dict(targets)
@@ -0,0 +1,205 @@
+# -*- coding: utf8 -*-
+# 本地模拟的录音文件识别服务，实现 SubmitTask / GetTaskResult，
+# 任务完成时可按 callback_url 推送回调，用于离线测试 fileTrans；
+# 可注入请求延迟和错误，用于测试超时、对冲、熔断和故障转移（见 resilience.py）
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from urllib.request import Request, urlopen
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATUS_CODE_SUCCESS = 21050000
+STATUS_CODE_RUNNING = 21050001
+STATUS_CODE_QUEUEING = 21050002
+
+
+def make_result(n_sentences=20, words_per_sentence=8):
+    """生成形状与真实返回一致的识别结果"""
+    sentences = []
+    words = []
+    t = 0
+    for i in range(n_sentences):
+        begin = t
+        for j in range(words_per_sentence):
+            words.append({'Word': f" word{j}", 'BeginTime': t, 'EndTime': t + 240, 'ChannelId': 0})
+            t += 300
+        sentences.append({
+            'Text': ' '.join(f"word{j}" for j in range(words_per_sentence)) + '.',
+            'BeginTime': begin,
+            'EndTime': t - 60,
+            'SpeechRate': 160,
+            'EmotionValue': 6.5,
+            'SilenceDuration': 0,
+            'ChannelId': 0,
+        })
+        t += 500
+    return {'Sentences': sentences, 'Words': words}
+
+
+class FakeFiletrans:
+    """模拟识别服务
+
+    queue_seconds / run_seconds 可以是数值或无参函数（用于按分布抽样）
+    故障注入：latency 为每个请求响应前的额外延迟（数值或无参函数），error_rate 为
+    返回 HTTP 500 的概率；两者都可在运行中修改
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, queue_seconds=0.0, run_seconds=1.0,
+                 n_sentences=20, words_per_sentence=8, latency=0.0, error_rate=0.0, seed=None):
+        self.queue_seconds = queue_seconds
+        self.run_seconds = run_seconds
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.error_count = 0
+        self.result = make_result(n_sentences, words_per_sentence)
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.submit_count = 0
+        self.query_count = 0
+        self.callback_count = 0
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def domain(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _sample(value):
+        return value() if callable(value) else value
+
+    def submit(self, task):
+        queue = self._sample(self.queue_seconds)
+        run = self._sample(self.run_seconds)
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.submit_count += 1
+            self.tasks[task_id] = {'start': now + queue, 'done': now + queue + run, 'task': task}
+        if task.get('enable_callback') and task.get('callback_url'):
+            timer = threading.Timer(queue + run, self._fire_callback, (task_id, task['callback_url']))
+            timer.daemon = True
+            timer.start()
+        return {'TaskId': task_id, 'RequestId': uuid.uuid4().hex,
+                'StatusCode': STATUS_CODE_SUCCESS, 'StatusText': 'SUCCESS'}
+
+    def query(self, task_id):
+        with self.lock:
+            self.query_count += 1
+            entry = self.tasks.get(task_id)
+        if entry is None:
+            return {'TaskId': task_id, 'StatusCode': 41050002, 'StatusText': 'REQUEST_INVALID_TASK_ID'}
+        now = time.time()
+        response = {'TaskId': task_id, 'RequestId': uuid.uuid4().hex}
+        if now < entry['start']:
+            response.update(StatusCode=STATUS_CODE_QUEUEING, StatusText='QUEUEING')
+        elif now < entry['done']:
+            # 运行中按进度返回部分句子，模拟中间结果
+            progress = (now - entry['start']) / max(entry['done'] - entry['start'], 1e-6)
+            n = int(len(self.result['Sentences']) * progress)
+            response.update(StatusCode=STATUS_CODE_RUNNING, StatusText='RUNNING',
+                            Result={'Sentences': self.result['Sentences'][:n]})
+        else:
+            response.update(StatusCode=STATUS_CODE_SUCCESS, StatusText='SUCCESS',
+                            Result=self.result, BizDuration=self.result['Sentences'][-1]['EndTime'])
+        return response
+
+    def _callback_payload(self, task_id):
+        response = self.query(task_id)
+        with self.lock:
+            self.query_count -= 1  # 回调内部生成结果不计入查询次数
+        return response
+
+    def _fire_callback(self, task_id, callback_url):
+        body = json.dumps(self._callback_payload(task_id)).encode('utf-8')
+        with self.lock:
+            self.callback_count += 1
+        try:
+            urlopen(Request(callback_url, data=body, headers={'Content-Type': 'application/json'}), timeout=10)
+        except OSError:
+            pass
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _params(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    body = self.rfile.read(length).decode('utf-8')
+                    params.update({k: v[0] for k, v in parse_qs(body).items()})
+                return params
+
+            def _handle(self):
+                params = self._params()
+                action = params.get('Action')
+                delay = fake._sample(fake.latency)
+                if delay:
+                    time.sleep(delay)
+                if fake.error_rate and fake.rng.random() < fake.error_rate:
+                    with fake.lock:
+                        fake.error_count += 1
+                    self.send_response(500)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if action == 'SubmitTask':
+                    response = fake.submit(json.loads(params.get('Task', '{}')))
+                elif action == 'GetTaskResult':
+                    response = fake.query(params.get('TaskId'))
+                else:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                body = json.dumps(response).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 客户端已读超时断开
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟录音文件识别服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--queue_seconds', type=float, default=0.0, help='排队时长')
+    parser.add_argument('--run_seconds', type=float, default=5.0, help='识别时长')
+    parser.add_argument('--sentences', type=int, default=20, help='结果句子数')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的额外延迟（秒）')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='返回HTTP 500的概率')
+    args = parser.parse_args()
+
+    fake = FakeFiletrans(args.host, args.port, args.queue_seconds, args.run_seconds, args.sentences,
+                         latency=args.latency, error_rate=args.error_rate)
+    print(f"模拟识别服务已启动：NLS_FILETRANS_DOMAIN={fake.domain}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
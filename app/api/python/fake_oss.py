@@ -0,0 +1,202 @@
+# -*- coding: utf8 -*-
+# 本地模拟的OSS服务（路径风格 /bucket/key），实现简单上传、分片上传
+# （初始化 / 上传分片 / 列出分片 / 完成 / 取消）和带 Range 的下载，用于离线测试 upload.py；
+# 可注入分片上传的错误，用于测试重试和断点续传
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+def _etag(data):
+    return hashlib.md5(data).hexdigest().upper()
+
+
+class FakeOSS:
+    """模拟OSS
+
+    error_rate 为分片上传返回 HTTP 500 的概率，latency 为每个请求的额外延迟（秒），
+    两者都可在运行中修改；签名不做校验，只检查签名URL的 Expires
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.part_count = 0
+        self.error_count = 0
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('x-oss-request-id', uuid.uuid4().hex)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _error(self, status, code, message=''):
+                body = (f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code>"
+                        f"<Message>{escape(message)}</Message><RequestId>{uuid.uuid4().hex}</RequestId>"
+                        f"</Error>").encode('utf-8')
+                self._reply(status, body, {'Content-Type': 'application/xml'})
+
+            def _xml(self, body):
+                self._reply(200, ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode('utf-8'),
+                            {'Content-Type': 'application/xml'})
+
+            def _parse(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if fake.latency:
+                    time.sleep(fake.latency)
+                return unquote(url.path), params, body
+
+            def do_PUT(self):
+                path, params, body = self._parse()
+                if 'uploadId' in params:
+                    upload = fake.uploads.get(params['uploadId'])
+                    if upload is None:
+                        return self._error(404, 'NoSuchUpload')
+                    with fake.lock:
+                        fake.part_count += 1
+                        failed = fake.error_rate and fake.rng.random() < fake.error_rate
+                        if failed:
+                            fake.error_count += 1
+                    if failed:
+                        return self._error(500, 'InternalError', '注入的错误')
+                    digest = self.headers.get('Content-MD5')
+                    if digest and base64.b64decode(digest) != hashlib.md5(body).digest():
+                        return self._error(400, 'InvalidDigest', '分片内容与 Content-MD5 不一致')
+                    etag = _etag(body)
+                    with fake.lock:
+                        upload['parts'][int(params['partNumber'])] = (body, etag, time.time())
+                    return self._reply(200, headers={'ETag': f'"{etag}"'})
+                with fake.lock:
+                    fake.objects[path] = body
+                self._reply(200, headers={'ETag': f'"{_etag(body)}"'})
+
+            def do_POST(self):
+                path, params, body = self._parse()
+                if 'uploads' in params:
+                    upload_id = uuid.uuid4().hex.upper()
+                    with fake.lock:
+                        fake.uploads[upload_id] = {'path': path, 'parts': {}}
+                    bucket, _, key = path.lstrip('/').partition('/')
+                    return self._xml(f"<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>"
+                                     f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                                     f"</InitiateMultipartUploadResult>")
+                if 'uploadId' in params:
+                    with fake.lock:
+                        upload = fake.uploads.get(params['uploadId'])
+                    if upload is None:
+                        return self._error(404, 'NoSuchUpload')
+                    requested = [(int(p.findtext('PartNumber')), p.findtext('ETag').strip('"'))
+                                 for p in ElementTree.fromstring(body).iter('Part')]
+                    chunks = []
+                    for number, etag in requested:
+                        part = upload['parts'].get(number)
+                        if part is None or part[1] != etag:
+                            return self._error(400, 'InvalidPart', f'分片 {number} 不存在或ETag不符')
+                        chunks.append(part[0])
+                    data = b''.join(chunks)
+                    with fake.lock:
+                        fake.objects[path] = data
+                        del fake.uploads[params['uploadId']]
+                    return self._xml(f"<CompleteMultipartUploadResult><Key>{escape(path)}</Key>"
+                                     f"<ETag>\"{_etag(data)}-{len(chunks)}\"</ETag>"
+                                     f"</CompleteMultipartUploadResult>")
+                self._error(400, 'InvalidRequest')
+
+            def do_GET(self):
+                path, params, _ = self._parse()
+                if 'uploadId' in params:
+                    upload = fake.uploads.get(params['uploadId'])
+                    if upload is None:
+                        return self._error(404, 'NoSuchUpload')
+                    parts = ''.join(
+                        f"<Part><PartNumber>{n}</PartNumber><ETag>\"{etag}\"</ETag><Size>{len(data)}</Size>"
+                        f"<LastModified>{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(mtime))}</LastModified></Part>"
+                        for n, (data, etag, mtime) in sorted(upload['parts'].items()))
+                    return self._xml(f"<ListPartsResult><UploadId>{params['uploadId']}</UploadId>"
+                                     f"<IsTruncated>false</IsTruncated><NextPartNumberMarker>0</NextPartNumberMarker>"
+                                     f"{parts}</ListPartsResult>")
+                if 'Expires' in params and int(params['Expires']) < time.time():
+                    return self._error(403, 'AccessDenied', '签名URL已过期')
+                data = fake.objects.get(path)
+                if data is None:
+                    return self._error(404, 'NoSuchKey')
+                ranged = self.headers.get('Range')
+                if ranged and ranged.startswith('bytes='):
+                    start, _, end = ranged[6:].partition('-')
+                    start = int(start or 0)
+                    end = min(int(end) if end else len(data) - 1, len(data) - 1)
+                    return self._reply(206, data[start:end + 1],
+                                       {'Content-Range': f"bytes {start}-{end}/{len(data)}"})
+                self._reply(200, data, {'ETag': f'"{_etag(data)}"'})
+
+            do_HEAD = do_GET
+
+            def do_DELETE(self):
+                path, params, _ = self._parse()
+                with fake.lock:
+                    if 'uploadId' in params:
+                        fake.uploads.pop(params['uploadId'], None)
+                    else:
+                        fake.objects.pop(path, None)
+                self._reply(204)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟OSS服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的额外延迟（秒）')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='分片上传返回HTTP 500的概率')
+    args = parser.parse_args()
+
+    fake = FakeOSS(args.host, args.port, args.latency, args.error_rate)
+    print(f"模拟OSS已启动：OSS_ENDPOINT={fake.endpoint}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
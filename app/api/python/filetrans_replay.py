@@ -0,0 +1,391 @@
+# -*- coding: utf8 -*-
+# 录音文件识别接口的录制与回放，用于在没有网络和密钥的机器上复现真实的返回：
+# 录制：本地代理把 SubmitTask / GetTaskResult 原样转发给真实服务，记录每次响应（含中间的
+#      QUEUEING/RUNNING 结果）、请求耗时和相对提交时刻的时间，每个任务一个夹具文件 <TaskId>.json
+# 回放：ReplayFiletrans 按夹具中的时间线返回响应，可按倍数压缩时间；也可按查询次数逐条返回，
+#      结果与轮询间隔无关
+#
+# 夹具格式：{'version', 'task'（去掉 appkey 和链接中的签名）, 'submit': {'latency', 'response'},
+#           'polls': [{'t'（相对提交的秒数）, 'latency', 'response'}, ...]}
+# 运行中响应的句子若是最终结果的前缀，只记录句子数（Result.SentencesPrefix），
+# 否则长音频的夹具会随轮询次数平方增长
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from bisect import bisect_right
+from pathlib import Path
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.fake_filetrans import FakeFiletrans
+from app.api.python.resilience import DEFAULT_DOMAIN
+
+FIXTURE_VERSION = 1
+FIXTURE_SUFFIX = '.json'
+# 未结束的状态，其余状态（成功或失败）都视为任务结束
+PENDING_STATUSES = ('QUEUEING', 'RUNNING')
+REPLAY_MODES = ('timeline', 'sequence')
+UPSTREAM_TIMEOUT = (10, 120)
+
+
+def _scrub_task(task):
+    """夹具中不保存 appkey 和文件链接的签名参数"""
+    task = {k: v for k, v in task.items() if k != 'appkey'}
+    if task.get('file_link'):
+        parts = urlsplit(task['file_link'])
+        task['file_link'] = urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+    return task
+
+
+def compact_fixture(fixture):
+    """把运行中响应里与最终结果相同的句子前缀替换为句子数"""
+    polls = fixture['polls']
+    if not polls or polls[-1]['response'].get('StatusText') in PENDING_STATUSES:
+        return fixture
+    final = (polls[-1]['response'].get('Result') or {}).get('Sentences') or []
+    for poll in polls[:-1]:
+        result = poll['response'].get('Result')
+        sentences = result.get('Sentences') if isinstance(result, dict) else None
+        if sentences is not None and sentences == final[:len(sentences)]:
+            result = {k: v for k, v in result.items() if k != 'Sentences'}
+            result['SentencesPrefix'] = len(sentences)
+            poll['response'] = {**poll['response'], 'Result': result}
+    return fixture
+
+
+def load_fixture(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    if fixture.get('version') != FIXTURE_VERSION:
+        raise ValueError(f"不支持的夹具版本：{path}")
+    if not fixture['polls']:
+        raise ValueError(f"夹具中没有查询记录：{path}")
+    fixture['name'] = Path(path).stem
+    fixture['times'] = [poll['t'] for poll in fixture['polls']]
+    final = fixture['polls'][-1]['response']
+    fixture['final_sentences'] = (final.get('Result') or {}).get('Sentences') or []
+    return fixture
+
+
+def load_fixtures(paths):
+    """夹具文件或目录（目录下全部 *.json），按名称排序"""
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(sorted(path.glob(f'*{FIXTURE_SUFFIX}')) if path.is_dir() else [path])
+    if not files:
+        raise ValueError("没有找到夹具文件")
+    return [load_fixture(p) for p in files]
+
+
+def expand_response(fixture, response):
+    """还原记录时压缩掉的句子前缀"""
+    result = response.get('Result')
+    if isinstance(result, dict) and 'SentencesPrefix' in result:
+        result = {k: v for k, v in result.items() if k != 'SentencesPrefix'}
+        result['Sentences'] = fixture['final_sentences'][:response['Result']['SentencesPrefix']]
+        response = {**response, 'Result': result}
+    return response
+
+
+class FiletransRecorder:
+    """录制代理：把 NLS_FILETRANS_DOMAIN 指向 domain，请求原样转发给 upstream 并记录响应
+
+    任务结束（成功或失败）时写出夹具；stop() 时未结束的任务也会写出
+    """
+
+    def __init__(self, fixture_dir, upstream=DEFAULT_DOMAIN, host='127.0.0.1', port=0, scheme='https'):
+        self.fixture_dir = Path(fixture_dir)
+        self.fixture_dir.mkdir(parents=True, exist_ok=True)
+        self.upstream = f"{scheme}://{upstream}"
+        self.tasks = {}
+        self.saved = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def domain(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            pending = list(self.tasks)
+        for task_id in pending:
+            self._save(task_id)
+
+    def _forward(self, method, path, body, content_type):
+        import requests
+        headers = {'Content-Type': content_type} if content_type else {}
+        return requests.request(method, self.upstream + path, data=body or None, headers=headers,
+                                timeout=UPSTREAM_TIMEOUT)
+
+    def _record(self, params, started, latency, payload):
+        action = params.get('Action')
+        if action == 'SubmitTask' and payload.get('TaskId'):
+            task = _scrub_task(json.loads(params.get('Task') or '{}'))
+            with self.lock:
+                self.tasks[payload['TaskId']] = {
+                    'version': FIXTURE_VERSION,
+                    'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'task': task,
+                    'submit': {'latency': round(latency, 4), 'response': payload},
+                    'polls': [],
+                    'start': started,
+                }
+        elif action == 'GetTaskResult':
+            task_id = params.get('TaskId')
+            with self.lock:
+                fixture = self.tasks.get(task_id)
+                if fixture is None:
+                    return
+                fixture['polls'].append({'t': round(started - fixture['start'], 4),
+                                         'latency': round(latency, 4), 'response': payload})
+            if payload.get('StatusText') not in PENDING_STATUSES:
+                self._save(task_id)
+
+    def _save(self, task_id):
+        with self.lock:
+            fixture = self.tasks.pop(task_id, None)
+        if fixture is None:
+            return None
+        fixture.pop('start')
+        compact_fixture(fixture)
+        path = self.fixture_dir / f"{task_id}{FIXTURE_SUFFIX}"
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(fixture, ensure_ascii=False))
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.saved.append(path)
+        return path
+
+    def _make_handler(self):
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if body:
+                    params.update({k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()})
+                started = time.time()
+                try:
+                    response = recorder._forward(self.command, self.path, body, self.headers.get('Content-Type'))
+                except Exception as e:
+                    message = str(e).encode('utf-8')
+                    self.send_response(502)
+                    self.send_header('Content-Length', str(len(message)))
+                    self.end_headers()
+                    self.wfile.write(message)
+                    return
+                latency = time.time() - started
+                content = response.content
+                # 只记录正常返回；HTTP错误由调用层重试，不进入夹具
+                if response.status_code == 200:
+                    try:
+                        recorder._record(params, started, latency, json.loads(content))
+                    except ValueError:
+                        pass
+                self.send_response(response.status_code)
+                self.send_header('Content-Type', response.headers.get('Content-Type', 'application/json'))
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class ReplayFiletrans(FakeFiletrans):
+    """按夹具回放的识别服务，HTTP接口、故障注入和回调与 FakeFiletrans 相同
+
+    time_scale：时间压缩倍数，夹具中第 t 秒的状态在回放开始后 t / time_scale 秒返回
+    mode：timeline 按经过的时间返回当时记录的状态；sequence 第 k 次查询返回第 k 条记录
+    replay_latency：按记录的请求耗时（同样压缩）延迟响应
+    提交时优先选 file_link 相同的夹具，否则按顺序轮流使用
+    """
+
+    def __init__(self, fixtures, time_scale=1.0, mode='timeline', replay_latency=False, host='127.0.0.1',
+                 port=0, latency=0.0, error_rate=0.0, seed=None):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"不支持的回放方式：{mode}，可选 {', '.join(REPLAY_MODES)}")
+        super().__init__(host, port, latency=latency, error_rate=error_rate, seed=seed)
+        self.fixtures = fixtures
+        self.time_scale = time_scale
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._by_link = {}
+        for fixture in fixtures:
+            self._by_link.setdefault(fixture['task'].get('file_link'), fixture)
+        self._next = 0
+
+    def _pick(self, task):
+        link = task.get('file_link')
+        if link:
+            parts = urlsplit(link)
+            fixture = self._by_link.get(urlunsplit((parts.scheme, parts.netloc, parts.path, '', '')))
+            if fixture is not None:
+                return fixture
+        fixture = self.fixtures[self._next % len(self.fixtures)]
+        self._next += 1
+        return fixture
+
+    def _sleep(self, latency):
+        if self.replay_latency and latency:
+            time.sleep(latency / self.time_scale)
+
+    def submit(self, task):
+        task_id = uuid.uuid4().hex
+        with self.lock:
+            self.submit_count += 1
+            fixture = self._pick(task)
+            self.tasks[task_id] = {'fixture': fixture, 'start': time.time(), 'queries': 0, 'task': task}
+        if task.get('enable_callback') and task.get('callback_url'):
+            timer = threading.Timer(fixture['times'][-1] / self.time_scale, self._fire_callback,
+                                    (task_id, task['callback_url']))
+            timer.daemon = True
+            timer.start()
+        self._sleep(fixture['submit']['latency'])
+        return {**fixture['submit']['response'], 'TaskId': task_id}
+
+    def query(self, task_id):
+        with self.lock:
+            self.query_count += 1
+            entry = self.tasks.get(task_id)
+            if entry is not None:
+                fixture = entry['fixture']
+                if self.mode == 'sequence':
+                    k = min(entry['queries'], len(fixture['polls']) - 1)
+                else:
+                    elapsed = (time.time() - entry['start']) * self.time_scale
+                    k = max(bisect_right(fixture['times'], elapsed) - 1, 0)
+                entry['queries'] += 1
+        if entry is None:
+            return {'TaskId': task_id, 'StatusCode': 41050002, 'StatusText': 'REQUEST_INVALID_TASK_ID'}
+        poll = fixture['polls'][k]
+        self._sleep(poll['latency'])
+        return {**expand_response(fixture, poll['response']), 'TaskId': task_id}
+
+    def _callback_payload(self, task_id):
+        with self.lock:
+            fixture = self.tasks[task_id]['fixture']
+        return {**expand_response(fixture, fixture['polls'][-1]['response']), 'TaskId': task_id}
+
+
+def check_fixtures(fixtures, time_scale=100.0, mode='timeline', storage_format='json', stream=False,
+                   poll_interval=None):
+    """用回放服务对每个夹具跑一次 fileTrans，核对结果并统计耗时，返回每个夹具一行统计"""
+    import app.api.python.speech as speech
+
+    fake = ReplayFiletrans(fixtures, time_scale, mode).start()
+    os.environ['NLS_FILETRANS_DOMAIN'] = fake.domain
+    os.environ.pop('NLS_FILETRANS_ENDPOINTS', None)
+    speech.POLL_INTERVAL_SECONDS = poll_interval if poll_interval is not None else \
+        speech.POLL_INTERVAL_SECONDS / time_scale
+    rows = []
+    try:
+        for fixture in fixtures:
+            final = fixture['polls'][-1]['response']
+            expected = final.get('Result') or {}
+            link = fixture['task'].get('file_link') or f"http://replay/{fixture['name']}.mp3"
+            queries = fake.query_count
+            start = time.perf_counter()
+            row = {'fixture': fixture['name'], 'recorded_s': fixture['times'][-1]}
+            try:
+                result = speech.fileTrans('replay', 'replay', 'replay', link, storage_format, stream=stream)
+                sentences = list(result['results'])
+                words = list(result['words'])
+                row.update(ok=(result['status'] == final.get('StatusText')
+                               and sentences == (expected.get('Sentences') or [])
+                               and words == (expected.get('Words') or [])),
+                           sentences=len(sentences), words=len(words))
+            except Exception as e:
+                row.update(ok=final.get('StatusText') not in ('SUCCESS',), error=str(e))
+            row.update(replay_s=round(time.perf_counter() - start, 3), queries=fake.query_count - queries)
+            rows.append(row)
+    finally:
+        fake.stop()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='录音文件识别接口的录制与回放')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help='启动录制代理，把 NLS_FILETRANS_DOMAIN 指向它后正常运行 speech.py')
+    record.add_argument('fixture_dir', help='夹具目录')
+    record.add_argument('--upstream', default=DEFAULT_DOMAIN, help='真实服务域名')
+    record.add_argument('--scheme', default='https', help='访问真实服务的协议')
+    record.add_argument('--host', default='127.0.0.1')
+    record.add_argument('--port', type=int, default=8767)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('fixtures', nargs='+', help='夹具文件或目录')
+    common.add_argument('--time_scale', type=float, default=1.0, help='时间压缩倍数')
+    common.add_argument('--mode', choices=REPLAY_MODES, default='timeline',
+                        help='timeline：按经过的时间回放；sequence：按查询次数逐条回放')
+
+    replay = subparsers.add_parser('replay', parents=[common], help='启动回放服务')
+    replay.add_argument('--host', default='127.0.0.1')
+    replay.add_argument('--port', type=int, default=8765)
+    replay.add_argument('--replay_latency', action='store_true', help='按记录的请求耗时延迟响应')
+
+    check = subparsers.add_parser('check', parents=[common], help='对每个夹具回放跑一次 fileTrans 并核对结果')
+    check.add_argument('--format', default='json', help='存储格式/后端，与 speech.py --format 相同')
+    check.add_argument('--stream', action='store_true', help='使用流式解析')
+    check.add_argument('--poll_interval', type=float, help='fileTrans 轮询间隔（秒，默认按压缩倍数缩短）')
+    check.add_argument('--workdir', help='结果写入目录（默认临时目录）')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        recorder = FiletransRecorder(args.fixture_dir, args.upstream, args.host, args.port, args.scheme)
+        print(f"录制代理已启动：NLS_FILETRANS_DOMAIN={recorder.domain}")
+        try:
+            recorder.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            recorder.stop()
+        print(f"已写出 {len(recorder.saved)} 个夹具到 {args.fixture_dir}")
+    elif args.command == 'replay':
+        fake = ReplayFiletrans(load_fixtures(args.fixtures), args.time_scale, args.mode, args.replay_latency,
+                               args.host, args.port)
+        print(f"回放服务已启动（{len(fake.fixtures)} 个夹具）：NLS_FILETRANS_DOMAIN={fake.domain}")
+        try:
+            fake.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        fixtures = load_fixtures(args.fixtures)
+        workdir = args.workdir or tempfile.mkdtemp(prefix='speech-replay-')
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)
+        rows = check_fixtures(fixtures, args.time_scale, args.mode, args.format, args.stream, args.poll_interval)
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+        sys.exit(0 if all(row['ok'] for row in rows) else 1)
@@ -0,0 +1,404 @@
+# -*- coding: utf8 -*-
+# 声学指纹去重：流式解码音频，取频谱峰值两两组成的地标哈希（landmark），
+# 压缩成固定长度的 MinHash 签名，用 LSH 分段索引在本地 SQLite 中查找相似音频。
+# 同一章节换文件名/URL/码率重新上传时，可以直接复用之前的识别结果。
+# 整段签名只用来找候选：原位重录十几秒对整段相似度几乎没有影响，因此另外按约10秒一个窗口
+# 各存一个小签名，所有窗口都一致才算同一音频；有窗口不一致的是改过的音频，不复用
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.audio import iter_pcm_blocks, DEFAULT_SAMPLE_RATE
+
+# 频谱帧长/帧移（采样数），16kHz 下为 64ms / 32ms
+FRAME_SIZE = 1024
+HOP_SIZE = 512
+# 只在语音主要能量所在的频段取峰值，对重新编码更稳定
+FREQ_MIN_HZ = 300
+FREQ_MAX_HZ = 4000
+# 频段按对数划分，每帧每个频段最多取一个峰值
+N_BANDS = 8
+# 峰值需比该帧各频段平均值高出的倍数（对数幅度差），过滤噪声
+PEAK_MARGIN = 0.5
+# 每个锚点与其后 MAX_DT 帧内的前 FANOUT 个峰值配对
+FANOUT = 4
+MAX_DT = 32
+# MinHash 签名长度与 LSH 分段：21段 × 每段3个值，约0.5相似度时命中率94%
+SIGNATURE_SIZE = 64
+LSH_BANDS = 21
+LSH_ROWS = 3
+# 候选音频：整段签名相似度阈值，时长相对误差上限
+CANDIDATE_THRESHOLD = 0.5
+DURATION_TOLERANCE = 0.02
+# 窗口签名：每窗口的帧数（16kHz 下约10秒）、签名长度（存为32位）和判定一致的相似度阈值。
+# 阈值按合成语音校准：mp3 32k/128k、8kHz mp3、aac、opus 24k 重新编码后最差的窗口为 0.56~0.84，
+# 替换其中10秒及以上音频的窗口不超过 0.09；短于几秒的改动低于这个分辨率
+WINDOW_FRAMES = 312
+WINDOW_SIGNATURE_SIZE = 32
+WINDOW_THRESHOLD = 0.5
+# 地标少于签名长度时（静音、解码失败、极短音频）签名大多是借位或空值，
+# 互相比较会得到虚高的相似度，这类音频不做去重
+MIN_LANDMARKS = SIGNATURE_SIZE
+DEFAULT_INDEX_PATH = "results/fingerprints.db"
+INDEX_ENV = "SPEECH_FINGERPRINT_DB"
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class Fingerprinter:
+    """逐块计算频谱峰值；块之间保留 FRAME_SIZE-HOP_SIZE 个采样的重叠"""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.total_samples = 0
+        self._window = np.hanning(FRAME_SIZE).astype(np.float32)
+        lo = int(FREQ_MIN_HZ * FRAME_SIZE / sample_rate)
+        hi = int(FREQ_MAX_HZ * FRAME_SIZE / sample_rate)
+        self._lo = lo
+        edges = np.unique(np.geomspace(lo, hi, N_BANDS + 1).astype(np.int64))
+        self._band_edges = edges - lo
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._frame_offset = 0
+        self._times = []
+        self._freqs = []
+
+    def add(self, block):
+        self.total_samples += block.size
+        if self._carry.size:
+            block = np.concatenate([self._carry, block])
+        if block.size < FRAME_SIZE:
+            self._carry = block
+            return
+        frames = np.lib.stride_tricks.sliding_window_view(block, FRAME_SIZE)[::HOP_SIZE]
+        n = frames.shape[0]
+        hi = self._lo + self._band_edges[-1]
+        spectrum = np.log1p(np.abs(np.fft.rfft(frames * self._window, axis=1))[:, self._lo:hi])
+
+        edges = self._band_edges
+        band_max = np.stack([spectrum[:, a:b].max(axis=1) for a, b in zip(edges[:-1], edges[1:])], axis=1)
+        band_arg = np.stack([spectrum[:, a:b].argmax(axis=1) + a for a, b in zip(edges[:-1], edges[1:])], axis=1)
+        strong = band_max > band_max.mean(axis=1, keepdims=True) + PEAK_MARGIN
+        t, band = np.nonzero(strong)
+        self._times.append((t + self._frame_offset).astype(np.int32))
+        self._freqs.append(band_arg[t, band].astype(np.int32))
+
+        self._frame_offset += n
+        self._carry = block[n * HOP_SIZE:]
+
+    def landmarks(self):
+        """把峰值两两配对成 32 位地标哈希：频率1(10位) | 频率2(10位) | 帧差(6位)"""
+        return np.unique(self._pairs()[0])
+
+    def _pairs(self):
+        """(地标哈希, 锚点帧号)，未去重"""
+        if not self._times:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64)
+        times = np.concatenate(self._times)
+        freqs = np.concatenate(self._freqs)
+        order = np.lexsort((freqs, times))
+        times, freqs = times[order], freqs[order]
+        # 每个峰值之后第一个不同帧的峰值位置
+        start = np.searchsorted(times, times + 1)
+        hashes = []
+        anchors = []
+        for k in range(FANOUT):
+            j = start + k
+            valid = j < times.size
+            i = np.flatnonzero(valid)
+            j = j[valid]
+            dt = times[j] - times[i]
+            ok = dt <= MAX_DT
+            i, j, dt = i[ok], j[ok], dt[ok]
+            hashes.append((freqs[i].astype(np.uint32) << 16) | (freqs[j].astype(np.uint32) << 6)
+                          | dt.astype(np.uint32))
+            anchors.append(times[i].astype(np.int64))
+        return np.concatenate(hashes), np.concatenate(anchors)
+
+    def window_signatures(self, hashes, anchors):
+        """按锚点所在窗口分组，每个窗口一个 WINDOW_SIGNATURE_SIZE 长的签名（uint32）；
+        末尾不足一个窗口的部分并入最后一个窗口"""
+        n = max(1, self._frame_offset // WINDOW_FRAMES)
+        window = np.minimum(anchors // WINDOW_FRAMES, n - 1)
+        order = np.argsort(window, kind='stable')
+        groups = np.split(hashes[order], np.searchsorted(window[order], np.arange(1, n)))
+        return np.stack([minhash(np.unique(group), WINDOW_SIGNATURE_SIZE) for group in groups]).astype(np.uint32)
+
+    def finish(self):
+        """返回 (MinHash签名, 时长秒, 窗口签名)；地标不足 MIN_LANDMARKS 个时返回None，不参与去重"""
+        hashes, anchors = self._pairs()
+        unique = np.unique(hashes)
+        if unique.size < MIN_LANDMARKS or not self.total_samples:
+            return None
+        return minhash(unique), self.total_samples / self.sample_rate, self.window_signatures(hashes, anchors)
+
+
+def minhash(hashes, size=SIGNATURE_SIZE):
+    """单次排列 MinHash（one permutation hashing）：混洗后按值分桶取每桶最小值，空桶向后借位"""
+    signature = np.full(size, np.iinfo(np.uint64).max, dtype=np.uint64)
+    if hashes.size == 0:
+        return signature
+    mixed = hashes.astype(np.uint64) * _MIX
+    mixed ^= mixed >> np.uint64(29)
+    bins = (mixed % np.uint64(size)).astype(np.int64)
+    np.minimum.at(signature, bins, mixed // np.uint64(size))
+    empty = signature == np.iinfo(np.uint64).max
+    if empty.any() and not empty.all():
+        filled = np.flatnonzero(~empty)
+        for b in np.flatnonzero(empty):
+            signature[b] = signature[filled[np.searchsorted(filled, b) % filled.size]]
+    return signature
+
+
+def similarity(a, b):
+    """两个签名的 Jaccard 相似度估计"""
+    return float(np.mean(a == b))
+
+
+def changed_ranges(windows, other, threshold=WINDOW_THRESHOLD):
+    """逐窗口比较两组窗口签名，返回不一致的区间 [[开始秒, 结束秒], ...]（相邻窗口合并）；
+    窗口数不同时多出的窗口都算改动"""
+    n = min(len(windows), len(other))
+    changed = np.flatnonzero(np.mean(windows[:n] == other[:n], axis=1) < threshold).tolist()
+    changed += list(range(n, max(len(windows), len(other))))
+    seconds = WINDOW_FRAMES * HOP_SIZE / DEFAULT_SAMPLE_RATE
+    ranges = []
+    for k in changed:
+        if ranges and ranges[-1][1] == k:
+            ranges[-1][1] = k + 1
+        else:
+            ranges.append([k, k + 1])
+    return [[round(a * seconds, 1), round(b * seconds, 1)] for a, b in ranges]
+
+
+def _lsh_keys(signature):
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def compute_fingerprint(source, sample_rate=DEFAULT_SAMPLE_RATE):
+    """解码音频并返回 (签名, 时长秒, 窗口签名)，无法取得可靠指纹时返回None"""
+    fingerprinter = Fingerprinter(sample_rate)
+    for block in iter_pcm_blocks(source, sample_rate):
+        fingerprinter.add(block)
+    return fingerprinter.finish()
+
+
+class FingerprintIndex:
+    """指纹 → 已有识别任务 的本地索引（SQLite），查找为一次带索引的查询加少量签名比对"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                id INTEGER PRIMARY KEY,
+                task_id TEXT NOT NULL,
+                audio_url TEXT,
+                duration REAL NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                windows BLOB
+            )
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(fingerprints)')}
+        if 'windows' not in columns:
+            # 旧索引没有窗口签名，其中的音频只能作为候选，不会被复用
+            self._conn.execute('ALTER TABLE fingerprints ADD COLUMN windows BLOB')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS lsh (
+                key INTEGER NOT NULL,
+                fingerprint_id INTEGER NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS lsh_key ON lsh (key)')
+
+    def add(self, signature, duration, task_id, audio_url=None, windows=None):
+        """登记一个指纹，返回其ID；时长为0的（解码失败）不登记，返回None"""
+        if not duration > 0:
+            return None
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._conn.execute(
+                    'INSERT INTO fingerprints (task_id, audio_url, duration, signature, created_at, windows) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (task_id, audio_url, duration, signature.astype('<u8').tobytes(), time.time(),
+                     windows.astype('<u4').tobytes() if windows is not None else None))
+                fingerprint_id = cursor.lastrowid
+                self._conn.executemany('INSERT INTO lsh (key, fingerprint_id) VALUES (?, ?)',
+                                       [(key, fingerprint_id) for key in _lsh_keys(signature)])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return fingerprint_id
+
+    def lookup(self, signature, duration, windows=None, threshold=CANDIDATE_THRESHOLD):
+        """查找最相似的已有音频，返回 {'task_id', 'audio_url', 'similarity', 'changed', ...} 或None
+
+        changed 为与该音频不一致的区间（秒），空列表表示逐窗口一致、可以复用；
+        任一方没有窗口签名时无法确认，为None
+        """
+        if not duration > 0:
+            return None
+        keys = _lsh_keys(signature)
+        placeholders = ','.join('?' * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT f.id, f.task_id, f.audio_url, f.duration, f.signature, f.windows FROM fingerprints f '
+                f'WHERE f.id IN (SELECT fingerprint_id FROM lsh WHERE key IN ({placeholders}))',
+                keys).fetchall()
+        best = None
+        for fingerprint_id, task_id, audio_url, other_duration, blob, window_blob in rows:
+            if not other_duration > 0 or abs(other_duration - duration) > DURATION_TOLERANCE * max(duration, other_duration, 1e-6):
+                continue
+            score = similarity(signature, np.frombuffer(blob, dtype='<u8'))
+            if score >= threshold and (best is None or score > best['similarity']):
+                best = {'id': fingerprint_id, 'task_id': task_id, 'audio_url': audio_url,
+                        'duration': other_duration, 'similarity': score, 'windows': window_blob}
+        if best is not None:
+            window_blob = best.pop('windows')
+            if windows is None or window_blob is None:
+                best['changed'] = None
+            else:
+                other = np.frombuffer(window_blob, dtype='<u4').reshape(-1, WINDOW_SIGNATURE_SIZE)
+                best['changed'] = changed_ranges(windows, other)
+        return best
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+
+def benchmark(entries=30000, queries=1000, landmarks=1000, seed=0):
+    """在临时索引中登记 entries 个随机指纹，分别测量命中（替换两成地标、时长略变）和
+    未命中查询的 lookup 耗时，返回 {'entries', 'hit_rate', 'false_hits', 'hit_ms', 'miss_ms'}，
+    耗时为 p50/p99/max 毫秒，不含解码和签名计算
+    """
+    def hashes_for(i):
+        return np.random.default_rng((seed, i)).integers(0, 1 << 32, size=landmarks, dtype=np.uint64)
+
+    def percentiles(samples):
+        p50, p99 = np.percentile(samples, [50, 99])
+        return {'p50': round(float(p50), 3), 'p99': round(float(p99), 3), 'max': round(float(max(samples)), 3)}
+
+    rng = np.random.default_rng(seed)
+    durations = rng.uniform(60, 3600, entries)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = FingerprintIndex(os.path.join(tmp, 'bench.db'))
+        for i in range(entries):
+            index.add(minhash(hashes_for(i)), durations[i], f"bench-{i}")
+
+        hit_ms, miss_ms = [], []
+        hits = false_hits = 0
+        for q in range(queries):
+            i = int(rng.integers(entries))
+            hashes = hashes_for(i)
+            replaced = rng.random(landmarks) < 0.2
+            hashes[replaced] = rng.integers(0, 1 << 32, size=int(replaced.sum()), dtype=np.uint64)
+            signature = minhash(hashes)
+            start = time.perf_counter()
+            match = index.lookup(signature, durations[i] * 1.005)
+            hit_ms.append((time.perf_counter() - start) * 1000)
+            hits += match is not None and match['task_id'] == f"bench-{i}"
+
+            signature = minhash(rng.integers(0, 1 << 32, size=landmarks, dtype=np.uint64))
+            start = time.perf_counter()
+            match = index.lookup(signature, durations[i])
+            miss_ms.append((time.perf_counter() - start) * 1000)
+            false_hits += match is not None
+        index._conn.close()
+    return {'entries': entries, 'hit_rate': hits / queries, 'false_hits': false_hits,
+            'hit_ms': percentiles(hit_ms), 'miss_ms': percentiles(miss_ms)}
+
+
+# 每个进程按路径复用一个索引连接
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path=None):
+    """取得进程内共享的指纹索引；path 默认读取 SPEECH_FINGERPRINT_DB"""
+    path = path or os.getenv(INDEX_ENV, DEFAULT_INDEX_PATH)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = FingerprintIndex(path)
+        return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='音频声学指纹：查重或登记')
+    parser.add_argument('command', choices=['lookup', 'add', 'compare', 'bench'])
+    parser.add_argument('sources', nargs='*', help='音频文件或URL')
+    parser.add_argument('--task_id', help='add：该音频对应的识别任务ID')
+    parser.add_argument('--index', help=f'指纹索引路径（默认读取 {INDEX_ENV}，未设置时为 {DEFAULT_INDEX_PATH}）')
+    parser.add_argument('--entries', type=int, default=30000, help='bench：临时索引中的指纹数')
+    parser.add_argument('--queries', type=int, default=1000, help='bench：命中/未命中查询各多少次')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        start = time.perf_counter()
+        stats = benchmark(args.entries, args.queries)
+        print(f"{stats['entries']} 个指纹：命中率 {stats['hit_rate']:.1%}，误命中 {stats['false_hits']} 次")
+        for key, label in (('hit_ms', '命中'), ('miss_ms', '未命中')):
+            ms = stats[key]
+            print(f"{label}查找：p50 {ms['p50']}ms，p99 {ms['p99']}ms，最大 {ms['max']}ms")
+        print(f"用时 {time.perf_counter() - start:.1f}s")
+        sys.exit(0)
+    if not args.sources:
+        parser.error('缺少音频文件或URL')
+
+    if args.command == 'compare':
+        signatures = [compute_fingerprint(source) for source in args.sources]
+        if signatures[0] is None:
+            sys.exit(f"{args.sources[0]}：无法取得可靠指纹（静音或解码失败）")
+        base, base_duration, base_windows = signatures[0]
+        for source, fingerprint in zip(args.sources[1:], signatures[1:]):
+            if fingerprint is None:
+                print(f"{source}：无法取得可靠指纹（静音或解码失败）")
+                continue
+            signature, duration, windows = fingerprint
+            scores = np.mean(base_windows[:len(windows)] == windows[:len(base_windows)], axis=1)
+            changed = changed_ranges(base_windows, windows)
+            print(f"{source}：相似度 {similarity(base, signature):.2f}，最差窗口 {scores.min():.2f}，"
+                  f"时长 {duration:.1f}s / {base_duration:.1f}s，"
+                  f"{'改动区间 ' + str(changed) if changed else '逐窗口一致'}")
+        sys.exit(0)
+
+    index = get_index(args.index)
+    for source in args.sources:
+        fingerprint = compute_fingerprint(source)
+        if fingerprint is None:
+            print(f"{source}：无法取得可靠指纹（静音或解码失败），跳过")
+            continue
+        signature, duration, windows = fingerprint
+        if args.command == 'add':
+            if not args.task_id:
+                parser.error('add 需要 --task_id')
+            index.add(signature, duration, args.task_id, source, windows)
+            print(f"已登记：{source} → {args.task_id}")
+        else:
+            start = time.perf_counter()
+            match = index.lookup(signature, duration, windows)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{source}：{match if match else '无重复'}（查找 {elapsed:.2f}ms）")
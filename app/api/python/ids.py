@@ -0,0 +1,51 @@
+import os
+import uuid
+from hashlib import sha1
+
+# 确定性ID的根命名空间，改动会导致所有已生成的ID失效
+ROOT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'lingflow:speech-results')
+
+# random：每行 uuid4（默认，与旧行为一致）
+# deterministic：由 taskId + 行类型 + 序号 派生的 uuid5，重复处理同一任务得到相同ID，可直接 upsert
+# fast：一次读取整批随机字节生成 uuid4 格式ID，避免逐行系统调用
+ID_STRATEGIES = ('random', 'deterministic', 'fast')
+
+
+def _format_hex(h, count):
+    return [f"{h[k:k + 8]}-{h[k + 8:k + 12]}-{h[k + 12:k + 16]}-{h[k + 16:k + 20]}-{h[k + 20:k + 32]}"
+            for k in range(0, 32 * count, 32)]
+
+
+class IdGenerator:
+    def __init__(self, strategy='random', task_id=None):
+        if strategy not in ID_STRATEGIES:
+            raise ValueError(f"不支持的ID策略：{strategy}，可选 {', '.join(ID_STRATEGIES)}")
+        if strategy == 'deterministic' and not task_id:
+            raise ValueError("确定性ID需要taskId")
+        self.strategy = strategy
+        self.task_id = task_id
+        if strategy == 'deterministic':
+            self._namespace = uuid.uuid5(ROOT_NAMESPACE, str(task_id))
+
+    def batch(self, kind, count, start=0):
+        """生成 count 个某类行（sentence/word/speech/speech_result）的ID"""
+        if count <= 0:
+            return []
+        if self.strategy == 'deterministic':
+            # 与 uuid.uuid5 结果相同，省去逐个构造 UUID 对象
+            ns = self._namespace.bytes
+            raw = bytearray(b''.join(sha1(ns + f"{kind}:{i}".encode()).digest()[:16]
+                                     for i in range(start, start + count)))
+            raw[6::16] = bytes((x & 0x0F) | 0x50 for x in raw[6::16])
+            raw[8::16] = bytes((x & 0x3F) | 0x80 for x in raw[8::16])
+            return _format_hex(raw.hex(), count)
+        if self.strategy == 'fast':
+            raw = bytearray(os.urandom(16 * count))
+            # 设置 uuid4 的版本位和变体位
+            raw[6::16] = bytes((x & 0x0F) | 0x40 for x in raw[6::16])
+            raw[8::16] = bytes((x & 0x3F) | 0x80 for x in raw[8::16])
+            return _format_hex(raw.hex(), count)
+        return [str(uuid.uuid4()) for _ in range(count)]
+
+    def one(self, kind, index=0):
+        return self.batch(kind, 1, start=index)[0]
@@ -0,0 +1,54 @@
+import re
+import subprocess
+import sys
+import time
+
+# -X importtime 输出行：import time:   self [us] | cumulative | imported package
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)')
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块, 自身us, 累计us, 层级), ...]"""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def profile_startup(script, extra_args=('--import-check',), required_modules=()):
+    """以全新进程运行脚本的冷启动路径，返回墙钟耗时和各模块导入耗时
+
+    required_modules 为冷启动路径必须导入的模块；缺少任何一个时说明测量的不是真实路径，抛出 RuntimeError
+    """
+    cmd = [sys.executable, '-X', 'importtime', script, *extra_args]
+    start = time.perf_counter()
+    completed = subprocess.run(cmd, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"冷启动失败 ({completed.returncode})：{completed.stderr.strip()[-2000:]}")
+    entries = parse_importtime(completed.stderr)
+    imported = {e[0] for e in entries}
+    missing = [name for name in required_modules if name not in imported]
+    if missing:
+        raise RuntimeError(f"冷启动路径未导入 {', '.join(missing)}，测量结果不代表真实任务")
+    return {
+        'wall_ms': wall_ms,
+        'import_ms': sum(e[1] for e in entries) / 1000,
+        'modules': entries,
+    }
+
+
+def print_report(report, top=20, budget_ms=None):
+    """打印耗时最多的顶层导入"""
+    top_level = sorted((e for e in report['modules'] if e[3] == 0), key=lambda e: e[2], reverse=True)
+    print(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+    for name, self_us, cumulative_us, _ in top_level[:top]:
+        print(f"{cumulative_us / 1000:10.1f} {self_us / 1000:10.1f}  {name}")
+    print(f"导入合计 {report['import_ms']:.1f} ms，{len(report['modules'])} 个模块；"
+          f"进程冷启动 {report['wall_ms']:.1f} ms")
+    if budget_ms is not None:
+        verdict = '超出' if report['wall_ms'] > budget_ms else '未超出'
+        print(f"预算 {budget_ms:.0f} ms：{verdict}")
@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+# 任务状态，与 speech_results.status 的取值保持一致
+STATUS_QUEUED = 'idle'
+STATUS_PROCESSING = 'processing'
+STATUS_COMPLETED = 'completed'
+STATUS_ERROR = 'error'
+TERMINAL_STATUSES = (STATUS_COMPLETED, STATUS_ERROR)
+# 内存中最多保留多少个已结束的任务（含结果和事件），更早的只能从SQLite读取状态
+MAX_FINISHED_IN_MEMORY = 200
+# 任务在线程池中执行，进程退出后不会继续；启动时把上次遗留的未结束任务标记为失败
+INTERRUPTED_ERROR = '服务重启时任务尚未完成，请重新提交'
+_JOB_COLUMNS = ('id', 'status', 'audio_url', 'storage_format', 'task_id', 'sentence_count',
+                'error_message', 'created_at', 'updated_at')
+
+
+def _status_event(job):
+    """任务状态变化对应的 SSE 事件；结束状态带上任务ID或错误信息"""
+    data = {'status': job['status']}
+    if job['status'] == STATUS_COMPLETED:
+        data['taskId'] = job['task_id']
+    elif job['status'] == STATUS_ERROR:
+        data['error'] = job['error_message']
+    return 'status', data
+
+
+class JobStore:
+    """识别任务表：内存中保存进行中的任务和事件，SQLite 持久化状态供重启后查询"""
+
+    def __init__(self, db_path="results/jobs.db"):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._listeners = {}
+        self._finished = deque()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                audio_url TEXT NOT NULL,
+                storage_format TEXT NOT NULL,
+                task_id TEXT,
+                sentence_count INTEGER NOT NULL DEFAULT 0,
+                error_message TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            'UPDATE jobs SET status = ?, error_message = ?, updated_at = ? WHERE status IN (?, ?)',
+            (STATUS_ERROR, INTERRUPTED_ERROR, datetime.now().isoformat(), STATUS_QUEUED, STATUS_PROCESSING)
+        )
+        self._conn.commit()
+
+    def create(self, audio_url, storage_format='json'):
+        now = datetime.now().isoformat()
+        job = {
+            'id': str(uuid.uuid4()),
+            'status': STATUS_QUEUED,
+            'audio_url': audio_url,
+            'storage_format': storage_format,
+            'task_id': None,
+            'sentence_count': 0,
+            'error_message': None,
+            'created_at': now,
+            'updated_at': now,
+            'events': [],
+            'result': None,
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            self._persist(job)
+        return job['id']
+
+    def get(self, job_id):
+        """读取任务状态；内存中没有时（例如服务重启后）回退到SQLite"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return {k: v for k, v in job.items() if k != 'events'}
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**dict(zip(_JOB_COLUMNS, row)), 'result': None}
+
+    def events_since(self, job_id, cursor):
+        """返回 (cursor之后的新事件, 新cursor, 是否已结束)
+
+        任务已不在内存中（已淘汰或服务重启过）时，按SQLite中的状态补发一个最终状态事件，
+        保证事件流总以状态事件结束
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                events = job['events'][cursor:]
+                return events, cursor + len(events), job['status'] in TERMINAL_STATUSES
+        job = self.get(job_id)
+        if job is None:
+            return [], cursor, True
+        return [_status_event(job)], cursor + 1, True
+
+    def subscribe(self, job_id, callback):
+        """注册事件通知回调（在写入线程中调用），返回取消订阅的函数"""
+        with self._lock:
+            self._listeners.setdefault(job_id, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                listeners = self._listeners.get(job_id, [])
+                if callback in listeners:
+                    listeners.remove(callback)
+                if not listeners:
+                    self._listeners.pop(job_id, None)
+        return unsubscribe
+
+    def mark_processing(self, job_id):
+        self._update(job_id, {'status': STATUS_PROCESSING})
+
+    def add_sentences(self, job_id, sentences):
+        with self._lock:
+            count = self._jobs[job_id]['sentence_count'] + len(sentences)
+        self._update(job_id, {'sentence_count': count}, ('sentences', sentences))
+
+    def complete(self, job_id, result):
+        fields = {
+            'status': STATUS_COMPLETED,
+            'task_id': result.get('taskId'),
+            'sentence_count': len(result.get('results', [])),
+            'result': result,
+        }
+        self._update(job_id, fields)
+
+    def fail(self, job_id, message):
+        self._update(job_id, {'status': STATUS_ERROR, 'error_message': message})
+
+    def _update(self, job_id, fields, event=None):
+        """更新任务字段并追加事件；不指定事件时追加当前状态事件"""
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job['updated_at'] = datetime.now().isoformat()
+            job['events'].append(event or _status_event(job))
+            self._persist(job)
+            if job['status'] in TERMINAL_STATUSES:
+                self._finished.append(job_id)
+                while len(self._finished) > MAX_FINISHED_IN_MEMORY:
+                    self._jobs.pop(self._finished.popleft(), None)
+            listeners = list(self._listeners.get(job_id, []))
+        for callback in listeners:
+            callback()
+
+    def _persist(self, job):
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO jobs ({', '.join(_JOB_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_JOB_COLUMNS))})",
+            tuple(job[key] for key in _JOB_COLUMNS)
+        )
+        self._conn.commit()
+
+
+def format_sse(event, data):
+    """格式化为 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,271 @@
+# -*- coding: utf8 -*-
+# 离线压测：在子进程中启动模拟识别服务（fake_filetrans.py），以不同并发度跑完整的
+# fileTrans → ResultStorage.save → 存储后端 流程，输出吞吐、延迟分位数、CPU、RSS 和连接数，
+# 用于找出Python识别链路在单机上的饱和点。排队/识别时长按可复现的随机分布抽样
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+# 资源采样间隔（秒）
+SAMPLE_INTERVAL_SECONDS = 0.2
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def make_distribution(spec, rng):
+    """把分布描述转成无参抽样函数
+
+    const:1.5 | uniform:0.5,3 | exp:2（均值） | lognormal:mu,sigma
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+    if kind == 'const':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == 'exp':
+        return lambda: rng.expovariate(1.0 / values[0])
+    if kind == 'lognormal':
+        return lambda: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"不支持的分布：{spec}")
+
+
+def _serve_fake(conn, queue_spec, run_spec, seed, n_sentences, words_per_sentence,
+                latency_spec='const:0', error_rate=0.0, fixtures=None, time_scale=1.0):
+    from app.api.python.fake_filetrans import FakeFiletrans
+
+    rng = random.Random(seed)
+    if fixtures:
+        # 回放录制的真实返回（见 filetrans_replay.py），排队/识别时长和结果形状都来自夹具
+        from app.api.python.filetrans_replay import ReplayFiletrans, load_fixtures
+        fake = ReplayFiletrans(load_fixtures(fixtures), time_scale,
+                               latency=make_distribution(latency_spec, rng), error_rate=error_rate,
+                               seed=seed).start()
+    else:
+        fake = FakeFiletrans(queue_seconds=make_distribution(queue_spec, rng),
+                             run_seconds=make_distribution(run_spec, rng),
+                             n_sentences=n_sentences, words_per_sentence=words_per_sentence,
+                             latency=make_distribution(latency_spec, rng), error_rate=error_rate,
+                             seed=seed).start()
+    conn.send(fake.domain)
+    conn.recv()  # 等待主进程通知结束
+    fake.stop()
+
+
+def start_fake_server(queue_spec, run_spec, seed, n_sentences, words_per_sentence,
+                      latency_spec='const:0', error_rate=0.0, fixtures=None, time_scale=1.0):
+    """在独立进程中运行模拟服务，避免它的CPU和连接计入被测进程，返回 (进程, 通知管道, 地址)"""
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve_fake, args=(child, queue_spec, run_spec, seed, n_sentences, words_per_sentence,
+                                  latency_spec, error_rate, fixtures, time_scale),
+        daemon=True)
+    process.start()
+    domain = parent.recv()
+    return process, parent, domain
+
+
+def _count_fds():
+    """(打开的文件描述符数, 其中的socket数)"""
+    fds = os.listdir('/proc/self/fd')
+    sockets = 0
+    for fd in fds:
+        try:
+            if os.readlink(f'/proc/self/fd/{fd}').startswith('socket:'):
+                sockets += 1
+        except OSError:
+            pass
+    return len(fds), sockets
+
+
+def _rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * _PAGE_SIZE
+
+
+class ResourceSampler:
+    """后台线程定时采样本进程的RSS、文件描述符和socket数"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            fds, sockets = _count_fds()
+            self.samples.append((_rss_bytes(), fds, sockets))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return {}
+        rss, fds, sockets = zip(*self.samples)
+        return {
+            'rss_mb_max': round(max(rss) / 1048576, 1),
+            'rss_mb_mean': round(sum(rss) / len(rss) / 1048576, 1),
+            'fds_max': max(fds),
+            'sockets_max': max(sockets),
+            'sockets_mean': round(sum(sockets) / len(sockets), 1),
+        }
+
+
+def percentile(values, q):
+    """线性插值分位数（values 已排序）"""
+    if not values:
+        return None
+    pos = (len(values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def _timed_save(save, timings):
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return save(self, *args, **kwargs)
+        finally:
+            timings.append(time.perf_counter() - start)
+    return wrapper
+
+
+def run_level(concurrency, jobs, storage_format, stream=False):
+    """以给定并发度跑 jobs 个任务，返回该并发度下的统计
+
+    每个并发度开始前重置共享调用层，熔断状态、接入点延迟和调用统计不会带到下一个并发度
+    """
+    from app.api.python.speech import fileTrans
+    from app.api.python.storage import ResultStorage
+    from app.api.python.resilience import metrics_snapshot, reset_callers
+
+    reset_callers()
+    latencies = []
+    errors = []
+    save_timings = []
+    original_save = ResultStorage.save
+    ResultStorage.save = _timed_save(original_save, save_timings)
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            fileTrans('load-test', 'load-test', 'load-test', f'http://load-test/{i}.mp3',
+                      storage_format=storage_format, id_strategy='fast', stream=stream)
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(str(e))
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+    try:
+        with ResourceSampler() as sampler, ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(jobs)))
+    finally:
+        ResultStorage.save = original_save
+    wall = time.perf_counter() - wall_start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    latencies.sort()
+    save_timings.sort()
+    ms = lambda v: round(v * 1000, 1) if v is not None else None
+    return {
+        'concurrency': concurrency,
+        'jobs': jobs,
+        'errors': len(errors),
+        'wall_s': round(wall, 2),
+        'throughput_jobs_s': round(len(latencies) / wall, 2) if wall > 0 else 0,
+        'latency_p50_ms': ms(percentile(latencies, 0.5)),
+        'latency_p90_ms': ms(percentile(latencies, 0.9)),
+        'latency_p99_ms': ms(percentile(latencies, 0.99)),
+        'save_p50_ms': ms(percentile(save_timings, 0.5)),
+        'save_p99_ms': ms(percentile(save_timings, 0.99)),
+        'cpu_s': round(cpu, 2),
+        'cpu_cores': round(cpu / wall, 2) if wall > 0 else 0,
+        'rss_mb_peak_process': round(usage_after.ru_maxrss / 1024, 1),
+        **sampler.summary(),
+        'first_error': errors[0] if errors else None,
+        'asr_endpoints': metrics_snapshot(),
+    }
+
+
+_COLUMNS = ('concurrency', 'throughput_jobs_s', 'latency_p50_ms', 'latency_p90_ms', 'latency_p99_ms',
+            'save_p50_ms', 'cpu_cores', 'rss_mb_max', 'sockets_max', 'errors')
+
+
+def print_table(rows):
+    print('  '.join(f"{c:>18}" for c in _COLUMNS))
+    for row in rows:
+        print('  '.join(f"{str(row.get(c)):>18}" for c in _COLUMNS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='识别链路离线压测（使用模拟识别服务）')
+    parser.add_argument('--concurrency', default='1,2,4,8,16',
+                        help='并发度，逗号分隔时依次测量，得到扩展曲线')
+    parser.add_argument('--jobs', type=int, default=32, help='每个并发度跑的任务数')
+    parser.add_argument('--queue', default='exp:0.5', help='排队时长分布（秒）：const:x / uniform:a,b / exp:mean / lognormal:mu,sigma')
+    parser.add_argument('--run', default='uniform:1,3', help='识别时长分布（秒），格式同 --queue')
+    parser.add_argument('--latency', default='const:0', help='模拟服务每个请求的额外延迟分布（秒），格式同 --queue')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='模拟服务返回HTTP 500的概率')
+    parser.add_argument('--sentences', type=int, default=200, help='每个结果的句子数')
+    parser.add_argument('--words_per_sentence', type=int, default=12, help='每句词数')
+    parser.add_argument('--fixtures', nargs='+', help='改为回放录制的夹具（文件或目录，见 filetrans_replay.py）')
+    parser.add_argument('--time_scale', type=float, default=1.0, help='回放夹具时的时间压缩倍数')
+    parser.add_argument('--poll_interval', type=float, default=0.5, help='fileTrans 轮询间隔（秒）')
+    parser.add_argument('--format', default='json', help='存储格式/后端，与 speech.py --format 相同')
+    parser.add_argument('--stream', action='store_true', help='使用流式解析')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，保证结果可复现')
+    parser.add_argument('--workdir', help='结果写入目录（默认临时目录）')
+    parser.add_argument('--output', help='把全部统计写入该JSON文件')
+    args = parser.parse_args()
+
+    process, control, domain = start_fake_server(args.queue, args.run, args.seed,
+                                                 args.sentences, args.words_per_sentence,
+                                                 args.latency, args.error_rate,
+                                                 args.fixtures, args.time_scale)
+    os.environ['NLS_FILETRANS_DOMAIN'] = domain
+    # 模拟服务不校验签名，未配置 .env 时也能跑
+    import app.api.python.speech as speech
+    speech.POLL_INTERVAL_SECONDS = args.poll_interval
+    workdir = args.workdir or tempfile.mkdtemp(prefix='speech-loadtest-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    print(f"模拟服务：{domain}，结果目录：{workdir}", file=sys.stderr)
+
+    rows = []
+    try:
+        for level in [int(c) for c in args.concurrency.split(',')]:
+            row = run_level(level, args.jobs, args.format, args.stream)
+            rows.append(row)
+            print(f"并发 {level}：{row['throughput_jobs_s']} 个/秒，p99 {row['latency_p99_ms']}ms",
+                  file=sys.stderr)
+    finally:
+        control.send('stop')
+        process.join(timeout=5)
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'levels': rows}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,36 @@
+# 跨进程文件锁：索引目录下的 .lock 文件加排他锁，同一目录的读改写在多个进程间串行执行。
+# Linux/macOS 用 fcntl.flock，Windows（Node 代理用 Windows 版 Python 运行脚本）用 msvcrt.locking
+import os
+import time
+from contextlib import contextmanager
+
+# msvcrt.locking 的 LK_LOCK 最多重试10次（约10秒）后抛出 OSError，这里继续等待
+_WINDOWS_RETRY_SECONDS = 0.1
+
+
+@contextmanager
+def locked(path):
+    """持有 path 文件的排他锁，期间其他进程的 locked(path) 会阻塞"""
+    with open(path, 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            # 锁住文件开头的1个字节（文件为空时也可以锁）
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(_WINDOWS_RETRY_SECONDS)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,208 @@
+# -*- coding: utf8 -*-
+# 波形峰值金字塔：流式解码音频一次，按块向量化计算每个时间桶的 min/max，
+# 再逐级两两合并得到多分辨率金字塔，写成紧凑的二进制 .peaks 文件。
+# 前端先读文件头（HEADER_SIZE + 16×层数 字节），再按需要的缩放级别对该层做 Range 请求。
+#
+# 文件格式（小端）：
+#   头部   magic 'LFPK' | version u16 | 层数 u16 | 采样率 u32 | 总采样数 u64
+#   层表   每层：每桶采样数 u32 | 桶数 u32 | 数据偏移 u64   （第0层最细）
+#   数据   每层为 int8 交错的 [min, max, min, max, ...]，取值 -127..127
+import os
+import sys
+import time
+import struct
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.audio import analyze, DEFAULT_SAMPLE_RATE
+
+MAGIC = b'LFPK'
+VERSION = 1
+_HEADER = struct.Struct('<4sHHIQ')
+_LEVEL = struct.Struct('<IIQ')
+HEADER_SIZE = _HEADER.size
+# 最细一层每个桶的采样数（16kHz 下每秒125个桶）
+BASE_SAMPLES_PER_PEAK = 128
+# 逐级减半，直到桶数不超过该值
+MIN_LEVEL_PEAKS = 256
+PEAKS_SUFFIX = '.peaks'
+# 批量生成时识别的音频扩展名
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.aac', '.ogg', '.opus', '.flac', '.webm'}
+
+
+class PeakPyramid:
+    """逐块累计最细一层的 min/max，finish() 时生成整个金字塔"""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, samples_per_peak=BASE_SAMPLES_PER_PEAK):
+        self.sample_rate = sample_rate
+        self.samples_per_peak = samples_per_peak
+        self.total_samples = 0
+        self._mins = []
+        self._maxs = []
+        self._carry = np.zeros(0, dtype=np.float32)
+
+    def add(self, block):
+        self.total_samples += block.size
+        if self._carry.size:
+            block = np.concatenate([self._carry, block])
+        spp = self.samples_per_peak
+        n = block.size // spp
+        if n:
+            buckets = block[:n * spp].reshape(n, spp)
+            self._mins.append(buckets.min(axis=1))
+            self._maxs.append(buckets.max(axis=1))
+        self._carry = block[n * spp:]
+
+    def finish(self):
+        """返回 [(每桶采样数, int8 的 (n, 2) min/max 数组), ...]，第0层最细"""
+        mins, maxs = list(self._mins), list(self._maxs)
+        if self._carry.size:
+            mins.append(np.array([self._carry.min()], dtype=np.float32))
+            maxs.append(np.array([self._carry.max()], dtype=np.float32))
+        if mins:
+            lo = np.concatenate(mins)
+            hi = np.concatenate(maxs)
+        else:
+            lo = hi = np.zeros(0, dtype=np.float32)
+
+        levels = []
+        spp = self.samples_per_peak
+        while True:
+            levels.append((spp, _quantize(lo, hi)))
+            if lo.size <= MIN_LEVEL_PEAKS:
+                break
+            if lo.size % 2:
+                lo = np.append(lo, lo[-1])
+                hi = np.append(hi, hi[-1])
+            lo = lo.reshape(-1, 2).min(axis=1)
+            hi = hi.reshape(-1, 2).max(axis=1)
+            spp *= 2
+        return levels
+
+
+def _quantize(lo, hi):
+    # min 向下、max 向上取整，缩小后的波形不会比实际更矮
+    pair = np.empty((lo.size, 2), dtype=np.int8)
+    pair[:, 0] = np.clip(np.floor(lo * 127.0), -127, 127)
+    pair[:, 1] = np.clip(np.ceil(hi * 127.0), -127, 127)
+    return pair
+
+
+def write_peaks(path, levels, sample_rate, total_samples):
+    """写出 .peaks 文件（先写临时文件再改名，读取方不会看到写了一半的文件）"""
+    path = Path(path)
+    offset = HEADER_SIZE + _LEVEL.size * len(levels)
+    table = []
+    for spp, data in levels:
+        table.append(_LEVEL.pack(spp, len(data), offset))
+        offset += data.nbytes
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(levels), sample_rate, total_samples))
+        f.write(b''.join(table))
+        for _, data in levels:
+            f.write(data.tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_header(path):
+    """读取文件头和层表：{'sample_rate', 'total_samples', 'levels': [(每桶采样数, 桶数, 偏移), ...]}"""
+    with open(path, 'rb') as f:
+        magic, version, n_levels, sample_rate, total_samples = _HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError(f"不是波形峰值文件：{path}")
+        levels = [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(n_levels)]
+    return {'version': version, 'sample_rate': sample_rate, 'total_samples': total_samples, 'levels': levels}
+
+
+def read_level(path, level, start=0, count=None):
+    """读取某一层从第 start 个桶起的 count 个 min/max（与前端 Range 请求等价）"""
+    header = read_header(path)
+    spp, n, offset = header['levels'][level]
+    count = n - start if count is None else min(count, n - start)
+    with open(path, 'rb') as f:
+        f.seek(offset + start * 2)
+        data = f.read(max(count, 0) * 2)
+    return np.frombuffer(data, dtype=np.int8).reshape(-1, 2)
+
+
+def compute_peaks(source, sample_rate=DEFAULT_SAMPLE_RATE):
+    """解码音频并返回 PeakPyramid（已累计完毕）"""
+    pyramid = PeakPyramid(sample_rate)
+    analyze(source, [pyramid], sample_rate)
+    return pyramid
+
+
+def save_pyramid(pyramid, path):
+    return write_peaks(path, pyramid.finish(), pyramid.sample_rate, pyramid.total_samples)
+
+
+def _build_one(source, target):
+    save_pyramid(compute_peaks(source), target)
+    return str(target)
+
+
+def build_directory(audio_dir, output_dir=None, workers=None, force=False):
+    """用进程池为目录下所有音频生成 .peaks（与音频同名），已是最新的跳过
+
+    返回 (生成数, 失败列表)
+    """
+    audio_dir = Path(audio_dir)
+    output_dir = Path(output_dir) if output_dir else audio_dir
+    jobs = []
+    for source in sorted(audio_dir.rglob('*')):
+        if source.suffix.lower() not in AUDIO_EXTENSIONS or not source.is_file():
+            continue
+        target = output_dir / source.relative_to(audio_dir).with_suffix(PEAKS_SUFFIX)
+        if not force and target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        jobs.append((source, target))
+    if not jobs:
+        return 0, []
+
+    built = 0
+    failed = []
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_build_one, str(s), str(t)): s for s, t in jobs}
+        for n, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+                built += 1
+            except Exception as e:
+                failed.append((futures[future].name, str(e)))
+            rate = n / max(time.time() - start, 1e-6)
+            print(f"[{n}/{len(jobs)}] {rate:.1f} 个/秒，失败 {len(failed)}", file=sys.stderr)
+    return built, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成音频波形峰值金字塔（.peaks）')
+    parser.add_argument('source', help='音频文件/URL，或包含音频的目录（如 voice_demos/）')
+    parser.add_argument('--output', help='输出文件（单个音频）或输出目录（目录模式，默认与音频同目录）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='目录模式的进程数')
+    parser.add_argument('--force', action='store_true', help='目录模式下重新生成已是最新的文件')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        built, failed = build_directory(args.source, args.output, args.workers, args.force)
+        for name, error in failed:
+            print(f"失败：{name}：{error}", file=sys.stderr)
+        print(f"生成 {built} 个，失败 {len(failed)} 个")
+        sys.exit(1 if failed else 0)
+    else:
+        target = args.output or Path(args.source).with_suffix(PEAKS_SUFFIX).name
+        _build_one(args.source, target)
+        header = read_header(target)
+        print(f"{target}：{len(header['levels'])} 层，"
+              f"最细 {header['levels'][0][1]} 桶，{os.path.getsize(target)} 字节")
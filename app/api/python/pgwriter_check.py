@@ -0,0 +1,174 @@
+# -*- coding: utf8 -*-
+# 对真实的 Postgres 跑一遍 pgwriter.py：在临时 schema 里按 supabase 迁移建最小的
+# speech_results / sentences / words 表，依次检查二进制 COPY 写入、ON COMMIT DELETE ROWS
+# 暂存表、ON CONFLICT 覆盖写、removed_rows 删除和出错回滚，结束后删掉 schema。
+#   python pgwriter_check.py --dsn postgresql://postgres@127.0.0.1:5432/postgres
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.fake_filetrans import make_result
+from app.api.python.pgwriter import DSN_ENV, PostgresWriter
+from app.api.python.storage import ResultStorage
+
+# 与 supabase/整理后文件夹/05_音频处理/02_表定义.sql 中写入器用到的列和约束一致
+_SCHEMA_DDL = (
+    '''
+    CREATE TABLE speech_results (
+        id uuid PRIMARY KEY,
+        task_id text NOT NULL,
+        audio_url text NOT NULL,
+        user_id uuid NULL,
+        status text NULL DEFAULT 'idle'
+    )
+    ''',
+    '''
+    CREATE TABLE sentences (
+        id uuid PRIMARY KEY,
+        speech_id uuid NULL REFERENCES speech_results (id),
+        begin_time integer NOT NULL,
+        end_time integer NOT NULL,
+        text_content text NOT NULL,
+        speech_rate integer NULL,
+        emotion_value double precision NULL,
+        "order" integer NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE words (
+        id uuid PRIMARY KEY,
+        sentence_id uuid NULL REFERENCES sentences (id),
+        word text NOT NULL,
+        begin_time integer NOT NULL,
+        end_time integer NOT NULL
+    )
+    ''',
+)
+
+
+def _processed(n_sentences, words_per_sentence, task_id):
+    raw = make_result(n_sentences, words_per_sentence)
+    result = {'taskId': task_id, 'audio_url': f'http://check/{task_id}.mp3',
+              'results': raw['Sentences'], 'words': raw['Words']}
+    with tempfile.TemporaryDirectory() as tmp:
+        return ResultStorage(tmp, id_strategy='deterministic')._process_result(result)
+
+
+def _rows(conn, sql, params=()):
+    return conn.execute(sql, params).fetchall()
+
+
+def _table_state(conn, speech_id):
+    sentences = _rows(conn, 'SELECT id::text, begin_time, end_time, text_content, "order" FROM sentences '
+                            'WHERE speech_id = %s ORDER BY "order"', (speech_id,))
+    words = _rows(conn, 'SELECT w.id::text, w.sentence_id::text, w.word, w.begin_time, w.end_time FROM words w '
+                        'JOIN sentences s ON s.id = w.sentence_id WHERE s.speech_id = %s '
+                        'ORDER BY w.begin_time, w.id', (speech_id,))
+    return sentences, words
+
+
+def _expected(data):
+    sentences = [(s['id'], int(s['begin_time']), int(s['end_time']), s['text_content'], order)
+                 for order, s in enumerate(data['sentences'])]
+    words = sorted(((w['id'], w['sentence_id'], w['word'], int(w['begin_time']), int(w['end_time']))
+                    for w in data['words']), key=lambda w: (w[3], w[0]))
+    return sentences, words
+
+
+def run_checks(dsn, n_sentences=500, words_per_sentence=10):
+    """逐项检查并返回 [(检查项, 是否通过, 说明)]；schema 用完即删"""
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+
+    schema = f"pgwriter_check_{uuid.uuid4().hex[:8]}"
+    admin = psycopg.connect(dsn, autocommit=True)
+    admin.execute(f'CREATE SCHEMA "{schema}"')
+    # pool_size=1 保证所有写入落在同一个会话上，才能检查暂存表在提交后被清空
+    writer = PostgresWriter(make_conninfo(dsn, options=f'-c search_path={schema}'), pool_size=1)
+    checks = []
+
+    def check(name, ok, detail=''):
+        checks.append((name, bool(ok), detail))
+
+    try:
+        with writer.pool.connection() as conn:
+            for ddl in _SCHEMA_DDL:
+                conn.execute(ddl)
+
+        data = _processed(n_sentences, words_per_sentence, uuid.uuid4().hex)
+        speech_id = data['speech_results'][0]['id']
+        stats = writer.write(data)
+        with writer.pool.connection() as conn:
+            state = _table_state(conn, speech_id)
+            staged = _rows(conn, 'SELECT (SELECT count(*) FROM stage_sentences), (SELECT count(*) FROM stage_words)')[0]
+        check('COPY 写入', state == _expected(data),
+              f"{stats['sentences']} 句 / {stats['words']} 词，用时 {stats['seconds']}s")
+        check('暂存表提交后清空', staged == (0, 0), f'stage_sentences/stage_words = {staged}')
+
+        # 同一批ID再写一次：改动的字段被覆盖，不产生重复行
+        for s in data['sentences'][::7]:
+            s['text_content'] = s['text_content'].upper()
+        for w in data['words'][::5]:
+            w['end_time'] = int(w['end_time']) + 1
+        writer.write(data)
+        with writer.pool.connection() as conn:
+            state = _table_state(conn, speech_id)
+            total = _rows(conn, 'SELECT (SELECT count(*) FROM sentences), (SELECT count(*) FROM words)')[0]
+        check('ON CONFLICT 覆盖写', state == _expected(data) and total == (len(data['sentences']), len(data['words'])),
+              f'表中共 {total[0]} 句 / {total[1]} 词')
+
+        # removed_rows：删掉前 10 句及其词，另外单独删一个保留句子中的词
+        removed_sentences = {s['id'] for s in data['sentences'][:10]}
+        kept_words = [w for w in data['words'] if w['sentence_id'] not in removed_sentences]
+        data['removed_rows'] = {'sentences': sorted(removed_sentences), 'words': [kept_words[0]['id']]}
+        data['sentences'] = data['sentences'][10:]
+        data['words'] = kept_words[1:]
+        writer.write(data)
+        with writer.pool.connection() as conn:
+            state = _table_state(conn, speech_id)
+        check('removed_rows 删除', state == _expected(data),
+              f"删除 {len(removed_sentences)} 句，剩 {len(state[0])} 句 / {len(state[1])} 词")
+
+        # 词引用不存在的句子时整个事务回滚，已有数据不变
+        before = state
+        broken = {**data, 'removed_rows': None,
+                  'sentences': [dict(s, text_content='rolled back') for s in data['sentences']],
+                  'words': data['words'] + [dict(data['words'][0], id=str(uuid.uuid4()), sentence_id=str(uuid.uuid4()))]}
+        try:
+            writer.write(broken)
+            raised = None
+        except psycopg.Error as e:
+            raised = type(e).__name__
+        with writer.pool.connection() as conn:
+            state = _table_state(conn, speech_id)
+        check('出错回滚', raised and state == before, f'异常 {raised}')
+    finally:
+        writer.close()
+        admin.execute(f'DROP SCHEMA "{schema}" CASCADE')
+        admin.close()
+    return checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='对真实Postgres检查 pgwriter.py 的写入、覆盖、删除和回滚')
+    parser.add_argument('--dsn', default=os.getenv(DSN_ENV), help=f'Postgres连接串（默认读取 {DSN_ENV}）')
+    parser.add_argument('--sentences', type=int, default=500, help='测试结果的句子数')
+    parser.add_argument('--words', type=int, default=10, help='每句词数')
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error(f'缺少 --dsn 或 {DSN_ENV}')
+
+    started = time.time()
+    checks = run_checks(args.dsn, args.sentences, args.words)
+    for name, ok, detail in checks:
+        print(f"{'OK  ' if ok else 'FAIL'} {name}  {detail}")
+    print(f"用时 {time.time() - started:.2f}s")
+    sys.exit(0 if all(ok for _, ok, _ in checks) else 1)
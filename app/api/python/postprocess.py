@@ -0,0 +1,164 @@
+import numpy as np
+
+# 相邻两个词之间小于该间隔（毫秒）的空隙直接补齐
+GAP_MS = 60
+
+
+def fix_overlaps(begin, end, gap_ms=GAP_MS, groups=None):
+    """按列修正时间段：裁掉与下一段重叠的部分，补齐过小的空隙
+
+    begin/end 需已按开始时间排序，返回新的 end 数组
+    groups 为每段所属的组（如词所属的句子）时，只在同组的相邻两段之间补齐空隙，
+    避免把句末的词延长进下一句；重叠总会裁掉
+    """
+    begin = np.asarray(begin, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64).copy()
+    if begin.size < 2:
+        return np.maximum(end, begin)
+
+    next_begin = begin[1:]
+    # 重叠：结束时间晚于下一段开始，裁到下一段开始处
+    # 小空隙：结束时间到下一段开始的距离不超过 gap_ms，延长到下一段开始
+    gap = next_begin - end[:-1]
+    close = gap <= gap_ms
+    if groups is not None:
+        groups = np.asarray(groups)
+        close &= (gap <= 0) | (groups[1:] == groups[:-1])
+    end[:-1] = np.where(close, next_begin, end[:-1])
+    return np.maximum(end, begin)
+
+
+def assign_sentences(word_begin, sent_begin, sent_end):
+    """为每个词找到所属句子的下标
+
+    词的开始时间落在句子区间内即归属该句；落在句间空隙的孤立词归给距离最近的句子
+    句子需已按开始时间排序；没有句子时返回全 -1
+    """
+    word_begin = np.asarray(word_begin, dtype=np.int64)
+    sent_begin = np.asarray(sent_begin, dtype=np.int64)
+    sent_end = np.asarray(sent_end, dtype=np.int64)
+    if sent_begin.size == 0:
+        return np.full(word_begin.size, -1, dtype=np.int64)
+
+    last = sent_begin.size - 1
+    # 开始时间不晚于该词的最后一个句子
+    left = np.clip(np.searchsorted(sent_begin, word_begin, side='right') - 1, 0, last)
+    right = np.clip(left + 1, 0, last)
+
+    # 到句子区间的距离（在区间内为0）
+    dist_left = np.maximum(word_begin - sent_end[left], 0) + np.maximum(sent_begin[left] - word_begin, 0)
+    dist_right = np.maximum(sent_begin[right] - word_begin, 0)
+    return np.where(dist_left <= dist_right, left, right)
+
+
+def sentence_stats(word_sentence, word_begin, word_end, n_sentences):
+    """按句统计词数、语速（词/分钟）和停顿
+
+    word_sentence 为每个词所属句子的下标，词需已按开始时间排序
+    返回 dict，各项均为长度 n_sentences 的数组
+    """
+    word_sentence = np.asarray(word_sentence, dtype=np.int64)
+    word_begin = np.asarray(word_begin, dtype=np.int64)
+    word_end = np.asarray(word_end, dtype=np.int64)
+    valid = word_sentence >= 0
+    idx = word_sentence[valid]
+    wb, we = word_begin[valid], word_end[valid]
+
+    word_count = np.bincount(idx, minlength=n_sentences)
+
+    # 句内语音跨度：首词开始到末词结束
+    first = np.full(n_sentences, np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.zeros(n_sentences, dtype=np.int64)
+    np.minimum.at(first, idx, wb)
+    np.maximum.at(last, idx, we)
+    span = np.where(word_count > 0, last - first, 0)
+    words_per_minute = np.where(span > 0, word_count * 60000.0 / np.maximum(span, 1), 0.0)
+
+    # 同一句内相邻词之间的停顿
+    same = idx[1:] == idx[:-1]
+    pauses = np.maximum(wb[1:] - we[:-1], 0)[same]
+    pause_owner = idx[1:][same]
+    pause_total = np.bincount(pause_owner, weights=pauses, minlength=n_sentences)
+    pause_max = np.zeros(n_sentences, dtype=np.int64)
+    np.maximum.at(pause_max, pause_owner, pauses)
+
+    return {
+        'word_count': word_count,
+        'words_per_minute': words_per_minute,
+        'pause_total_ms': pause_total.astype(np.int64),
+        'pause_max_ms': pause_max,
+    }
+
+
+def postprocess_columns(sent_begin, sent_end, word_begin, word_end, gap_ms=GAP_MS):
+    """按列做时间戳后处理，输入输出都按原顺序排列（不要求已排序）
+
+    返回 dict：sentence_end / word_end 为修正后的结束时间，word_sentence 为每个词所属句子
+    在原顺序中的下标（没有句子时为 -1），以及 sentence_stats 的各项
+    """
+    sent_begin = np.asarray(sent_begin, dtype=np.int64)
+    word_begin = np.asarray(word_begin, dtype=np.int64)
+
+    # 按开始时间排序（识别结果一般已有序，稳定排序保证相同时间的顺序不变）
+    sent_order = np.argsort(sent_begin, kind='stable')
+    word_order = np.argsort(word_begin, kind='stable')
+    sb, se = sent_begin[sent_order], np.asarray(sent_end, dtype=np.int64)[sent_order]
+    wb, we = word_begin[word_order], np.asarray(word_end, dtype=np.int64)[word_order]
+
+    se = fix_overlaps(sb, se, gap_ms=0)
+    # 归属只取决于词的开始时间，先分句再补齐句内的小空隙
+    owner = assign_sentences(wb, sb, se)
+    we = fix_overlaps(wb, we, gap_ms=gap_ms, groups=owner)
+    stats = sentence_stats(owner, wb, we, sb.size)
+
+    # 还原为原顺序
+    columns = {'sentence_end': np.empty_like(se), 'word_end': np.empty_like(we),
+               'word_sentence': np.empty_like(owner)}
+    columns['sentence_end'][sent_order] = se
+    columns['word_end'][word_order] = we
+    columns['word_sentence'][word_order] = np.where(owner >= 0, sent_order[np.maximum(owner, 0)], -1) \
+        if sent_order.size else owner
+    for key, values in stats.items():
+        columns[key] = np.empty_like(values)
+        columns[key][sent_order] = values
+    return columns
+
+
+def postprocess(sentences, words, gap_ms=GAP_MS):
+    """对整列时间戳做后处理，原地更新句子和词的字典
+
+    sentences/words 为 ResultStorage._process_result 生成的行，需包含
+    id、begin_time、end_time 字段；处理后词的 sentence_id 总会指向某个句子
+    （只要存在句子），句子上会增加 word_count、words_per_minute、pause_total_ms、pause_max_ms
+    """
+    columns = postprocess_columns(
+        np.fromiter((s['begin_time'] for s in sentences), dtype=np.int64, count=len(sentences)),
+        np.fromiter((s['end_time'] for s in sentences), dtype=np.int64, count=len(sentences)),
+        np.fromiter((w['begin_time'] for w in words), dtype=np.int64, count=len(words)),
+        np.fromiter((w['end_time'] for w in words), dtype=np.int64, count=len(words)),
+        gap_ms)
+
+    for sentence, row in zip(sentences, sentence_fields(columns)):
+        sentence.update(row)
+
+    sentence_ids = [s['id'] for s in sentences]
+    for word, end_time, owner in zip(words, columns['word_end'].tolist(), columns['word_sentence'].tolist()):
+        word['end_time'] = end_time
+        word['sentence_id'] = sentence_ids[owner] if owner >= 0 else None
+
+    return sentences, words
+
+
+def sentence_fields(columns):
+    """逐句产出 postprocess 写到句子上的字段（按原顺序）"""
+    for end_time, count, wpm, pause_total, pause_max in zip(
+            columns['sentence_end'].tolist(), columns['word_count'].tolist(),
+            columns['words_per_minute'].tolist(), columns['pause_total_ms'].tolist(),
+            columns['pause_max_ms'].tolist()):
+        yield {
+            'end_time': end_time,
+            'word_count': int(count),
+            'words_per_minute': round(float(wpm), 1),
+            'pause_total_ms': int(pause_total),
+            'pause_max_ms': int(pause_max),
+        }
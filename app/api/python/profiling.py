@@ -0,0 +1,151 @@
+import io
+import os
+import threading
+import tracemalloc
+
+# 开启单任务性能分析的环境变量：1/all 同时采集CPU和内存，cpu 或 mem 只采集一种
+PROFILE_ENV = "SPEECH_PROFILE"
+# tracemalloc 记录的调用栈深度，越深越准确但开销越大
+TRACEMALLOC_FRAMES = 10
+# 报告中列出的函数数和内存分配位置数
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# 性能分析产物的文件后缀（与结果文件放在同一分片目录）
+PSTATS_SUFFIX = '.prof'
+REPORT_SUFFIX = '.profile.txt'
+
+# tracemalloc 是进程级的，多个任务同时分析时按引用计数共用
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def resolve_profile(profile=None):
+    """把开关（参数或环境变量）解析为采集项集合，未开启时返回空集合
+
+    profile 为None时读取 SPEECH_PROFILE；未开启时只有这一次环境变量读取的开销
+    """
+    if profile is None:
+        profile = os.getenv(PROFILE_ENV)
+    if profile is True:
+        return {'cpu', 'mem'}
+    if not profile or profile is False:
+        return set()
+    modes = set()
+    for part in str(profile).lower().split(','):
+        part = part.strip()
+        if part in ('1', 'true', 'all', 'yes'):
+            modes |= {'cpu', 'mem'}
+        elif part in ('cpu', 'mem'):
+            modes.add(part)
+    return modes
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class JobProfiler:
+    """对单个识别任务采集 cProfile 和 tracemalloc 数据
+
+    start() 后在同一线程中执行任务，stop() 后用 dump() 写出 pstats 和文本报告
+    """
+
+    def __init__(self, modes):
+        self.modes = set(modes)
+        self.notes = []
+        self._profile = None
+        self._snapshot_before = None
+        self._snapshot = None
+        self._peak = None
+        self._mem_started = False
+        self.running = False
+        # 任务提交后由调用方记录，用于给未随结果保存的产物命名
+        self.task_id = None
+
+    def start(self):
+        if 'mem' in self.modes:
+            _start_tracemalloc()
+            self._mem_started = True
+            if _tracemalloc_users > 1:
+                self.notes.append("tracemalloc 为进程级，分析期间有其他任务同时运行，内存数据包含它们的分配")
+            tracemalloc.reset_peak()
+            self._snapshot_before = tracemalloc.take_snapshot()
+        if 'cpu' in self.modes:
+            # cProfile/pstats 只在开启分析时加载，不影响冷启动
+            import cProfile
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self._profile = profile
+            except ValueError:
+                # Python 3.12 起同一时刻只能有一个 cProfile 在运行
+                self.notes.append("已有其他任务在做CPU分析，本任务未采集CPU数据")
+        self.running = True
+        return self
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self._profile is not None:
+            self._profile.disable()
+        if self._mem_started:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._peak = tracemalloc.get_traced_memory()[1]
+            _stop_tracemalloc()
+            self._mem_started = False
+
+    def report(self):
+        """生成文本报告：耗时最多的函数 + 新增内存最多的分配位置"""
+        out = io.StringIO()
+        for note in self.notes:
+            out.write(f"注意：{note}\n")
+        if self._profile is not None:
+            import pstats
+            out.write(f"==== CPU（按累计耗时，前{TOP_FUNCTIONS}）====\n")
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        if self._snapshot is not None:
+            out.write(f"==== 内存（峰值 {self._peak / 1048576:.1f} MB，新增分配前{TOP_ALLOCATIONS}）====\n")
+            diff = self._snapshot.compare_to(self._snapshot_before, 'lineno')
+            for stat in diff[:TOP_ALLOCATIONS]:
+                out.write(f"{stat}\n")
+            out.write("\n==== 最大分配位置的调用栈 ====\n")
+            top = self._snapshot.statistics('traceback')[:3]
+            for stat in top:
+                out.write(f"{stat.size / 1024:.1f} KiB，{stat.count} 块\n")
+                for line in stat.traceback.format():
+                    out.write(f"{line}\n")
+        return out.getvalue()
+
+    def dump(self, pstats_path, report_path):
+        """写出产物，返回写出的文件路径列表"""
+        self.stop()
+        written = []
+        if self._profile is not None:
+            self._profile.dump_stats(str(pstats_path))
+            written.append(pstats_path)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(self.report())
+        written.append(report_path)
+        return written
+
+
+def start_job_profiler(profile=None):
+    """按开关启动分析器；未开启时返回None"""
+    modes = resolve_profile(profile)
+    if not modes:
+        return None
+    return JobProfiler(modes).start()
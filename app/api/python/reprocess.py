@@ -0,0 +1,148 @@
+# -*- coding: utf8 -*-
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.storage import ResultStorage
+from app.api.python.resultstore import ResultStore
+
+
+def _export_csv(storage, data, path):
+    return storage._save_detailed_csv(data, path.stem)
+
+
+def _upload_supabase(storage, data, path):
+    response = storage._save_to_supabase(data)
+    if isinstance(response, dict) and response.get('status') == 'error':
+        raise RuntimeError(response.get('message'))
+    return response
+
+
+def _write_postgres(storage, data, path):
+    return storage._save_to_postgres(data)
+
+
+def _index_text(storage, data, path):
+    return storage._save_to_textindex(data)
+
+
+def _count_vocab(storage, data, path):
+    return storage._save_to_vocab(data)
+
+
+def _extract_clips(storage, data, path):
+    # 已经按结果并行，每个结果在当前进程内编码
+    return storage._save_clips(data, path.stem, workers=1)
+
+
+# 可用的重处理动作：名称 -> (storage, 已保存的结果, 文件路径) 的处理函数
+ACTIONS = {
+    'csv': _export_csv,
+    'supabase': _upload_supabase,
+    'postgres': _write_postgres,
+    'textindex': _index_text,
+    'vocab': _count_vocab,
+    'clips': _extract_clips,
+}
+
+
+def discover(results_dir):
+    """从结果目录的索引列出所有已保存的识别结果（条目名，含已打包的）
+
+    旧版平铺在顶层的文件需先用 resultstore.py migrate 迁移
+    """
+    return ResultStore(results_dir).names('.json')
+
+
+def load_checkpoint(checkpoint_path):
+    if not checkpoint_path.exists():
+        return set()
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _process_chunk(action, names, output_dir, results_dir):
+    """子进程中处理一批结果条目，返回 [(条目名, 错误信息或None), ...]"""
+    storage = ResultStorage(output_dir)
+    store = storage.store if Path(results_dir) == Path(output_dir) else ResultStore(results_dir)
+    handler = ACTIONS[action]
+    outcomes = []
+    for name in names:
+        try:
+            data = json.loads(store.read_entry(name, '.json'))
+            handler(storage, data, Path(f"{name}.json"))
+            outcomes.append((name, None))
+        except Exception as e:
+            outcomes.append((name, str(e)))
+    return outcomes
+
+
+def reprocess(results_dir, action, output_dir=None, workers=None, chunk_size=32, resume=True):
+    """把结果目录下的文件按批分发到进程池重处理
+
+    已完成的条目名追加写入检查点文件，中断后再次运行会跳过它们
+    返回 (成功数, 失败列表)
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"不支持的动作：{action}，可选 {', '.join(ACTIONS)}")
+    results_dir = Path(results_dir)
+    output_dir = output_dir or str(results_dir)
+    checkpoint_path = results_dir / f".reprocess_{action}.done"
+
+    done = load_checkpoint(checkpoint_path) if resume else set()
+    pending = [name for name in discover(results_dir) if name not in done]
+    total = len(pending)
+    if not total:
+        print("没有需要处理的结果", file=sys.stderr)
+        return 0, []
+
+    chunks = [pending[i:i + chunk_size] for i in range(0, total, chunk_size)]
+    succeeded = 0
+    failed = []
+    finished = 0
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(checkpoint_path, 'a' if resume else 'w', encoding='utf-8') as checkpoint:
+        futures = [executor.submit(_process_chunk, action, chunk, output_dir, str(results_dir)) for chunk in chunks]
+        for future in as_completed(futures):
+            for name, error in future.result():
+                finished += 1
+                if error is None:
+                    succeeded += 1
+                    checkpoint.write(name + '\n')
+                else:
+                    failed.append((name, error))
+            checkpoint.flush()
+            elapsed = time.time() - start
+            rate = finished / elapsed if elapsed > 0 else 0
+            print(f"[{finished}/{total}] {rate:.1f} 个/秒，失败 {len(failed)}", file=sys.stderr)
+
+    return succeeded, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='批量重处理 results/ 目录下的识别结果')
+    parser.add_argument('action', choices=sorted(ACTIONS), help='重处理动作')
+    parser.add_argument('--results_dir', default='results', help='结果目录')
+    parser.add_argument('--output_dir', help='输出目录（默认与结果目录相同）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='进程数')
+    parser.add_argument('--chunk_size', type=int, default=32, help='每批文件数')
+    parser.add_argument('--restart', action='store_true', help='忽略检查点，从头处理')
+    args = parser.parse_args()
+
+    succeeded, failed = reprocess(args.results_dir, args.action, args.output_dir,
+                                  args.workers, args.chunk_size, resume=not args.restart)
+    for name, error in failed:
+        print(f"失败：{name}：{error}", file=sys.stderr)
+    print(json.dumps({'succeeded': succeeded, 'failed': len(failed)}, ensure_ascii=False))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,369 @@
+import os
+import time
+import socket
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+
+# 录音文件识别服务的接入点列表：region=domain，逗号分隔，按优先级排列；
+# 未配置时使用 NLS_FILETRANS_DOMAIN（或上海）单个接入点
+ENDPOINTS_ENV = "NLS_FILETRANS_ENDPOINTS"
+DEFAULT_REGION = "cn-shanghai"
+DEFAULT_DOMAIN = "filetrans.cn-shanghai.aliyuncs.com"
+
+# 单次调用的连接/读取超时（秒）
+CONNECT_TIMEOUT_SECONDS = float(os.getenv('NLS_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT_SECONDS = float(os.getenv('NLS_READ_TIMEOUT', '30'))
+# 查询失败时的重试次数和指数退避（秒，带随机抖动）
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+# 对冲：GetTaskResult 超过该接入点近期 p95 仍未返回时，再发一个相同的查询，取先返回的
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = 0.05
+LATENCY_WINDOW = 200
+# 熔断：最近 BREAKER_WINDOW 次调用中错误率达到阈值即断开，冷却后放行一次探测
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = 10
+BREAKER_ERROR_RATE = 0.5
+BREAKER_COOLDOWN_SECONDS = 30.0
+# 对冲请求使用的共享线程池大小
+HEDGE_POOL_SIZE = 32
+# 请求没有送达服务端的错误特征（连接被拒、DNS失败、连接超时）；读超时、连接中途断开时
+# 服务端可能已经受理，不在其中
+_CONNECT_ERROR_MARKERS = ('connection refused', 'failed to establish a new connection', 'newconnectionerror',
+                          'connecttimeout', 'connect timeout', 'name or service not known',
+                          'temporary failure in name resolution', 'nodename nor servname')
+
+
+class CircuitOpenError(Exception):
+    """接入点处于熔断状态，本次调用未发出"""
+
+
+class RejectedError(Exception):
+    """服务端明确答复了失败（未受理任务），重新提交不会产生重复任务"""
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def _is_timeout(error):
+    name = type(error).__name__.lower()
+    return isinstance(error, TimeoutError) or 'timeout' in name or 'timed out' in str(error).lower()
+
+
+def _not_accepted(error):
+    """提交一定没有被受理：未发出、没连上，或服务端返回了错误（SDK 的 ServerException 带 HTTP 状态）"""
+    if isinstance(error, (CircuitOpenError, RejectedError, ConnectionRefusedError, socket.gaierror)):
+        return True
+    if callable(getattr(error, 'get_http_status', None)):
+        return True
+    text = f"{type(error).__name__}: {error}".lower()
+    return any(marker in text for marker in _CONNECT_ERROR_MARKERS)
+
+
+class CircuitBreaker:
+    """按最近调用的错误率熔断：closed → open（冷却）→ half_open（放行一次探测）→ closed/open"""
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opens = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == 'half_open':
+                if ok:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self.opens += 1
+        self._opened_at = time.monotonic()
+        self._probing = False
+
+
+class ActionMetrics:
+    """某个接入点上某个动作的调用统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.short_circuits = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.failovers = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self):
+        latencies = list(self.latencies)
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'short_circuits': self.short_circuits,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'retries': self.retries,
+            'failovers': self.failovers,
+            'p50_ms': ms(_percentile(latencies, 0.5)),
+            'p95_ms': ms(_percentile(latencies, 0.95)),
+            'p99_ms': ms(_percentile(latencies, 0.99)),
+        }
+
+
+class Endpoint:
+    """一个识别服务接入点（地域 + 域名），带自己的熔断器和延迟统计"""
+
+    def __init__(self, region_id, domain, priority=0):
+        self.region_id = region_id
+        self.domain = domain
+        self.priority = priority
+        self.breaker = CircuitBreaker()
+        self.actions = {}
+        self._lock = threading.Lock()
+
+    def metrics(self, action):
+        with self._lock:
+            if action not in self.actions:
+                self.actions[action] = ActionMetrics()
+            return self.actions[action]
+
+    def latency(self, action=None):
+        """近期成功调用的中位延迟（秒），样本不足时返回None"""
+        if action is not None:
+            samples = list(self.metrics(action).latencies)
+        else:
+            samples = [v for m in list(self.actions.values()) for v in list(m.latencies)]
+        return _percentile(samples, 0.5) if len(samples) >= 3 else None
+
+    def hedge_delay(self, action):
+        """发对冲请求前的等待时间：近期 p95，样本不足时不对冲"""
+        samples = list(self.metrics(action).latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(_percentile(samples, 0.95), HEDGE_MIN_DELAY_SECONDS)
+
+    def snapshot(self):
+        return {
+            'region': self.region_id,
+            'domain': self.domain,
+            'breaker': self.breaker.state,
+            'breaker_opens': self.breaker.opens,
+            'actions': {name: m.snapshot() for name, m in list(self.actions.items())},
+        }
+
+
+def parse_endpoints(spec):
+    """解析 "region=domain,region=domain"；只写域名时地域默认为上海"""
+    endpoints = []
+    for n, item in enumerate(part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        region, _, domain = item.rpartition('=')
+        endpoints.append(Endpoint(region or DEFAULT_REGION, domain, n))
+    return endpoints
+
+
+class ResilientCaller:
+    """SubmitTask/GetTaskResult 的调用层：超时、重试退避、对冲、熔断和按延迟排序的故障转移
+
+    fn(endpoint) 为实际发请求的函数，需自行使用 CONNECT/READ_TIMEOUT_SECONDS 作为超时
+    """
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("至少需要一个识别服务接入点")
+        self.endpoints = endpoints
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix='asr-hedge')
+            return self._pool
+
+    def close(self):
+        """等待进行中的对冲请求结束并关闭线程池"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def ranked(self):
+        """可用接入点按近期延迟排序；熔断中的排最后，没有延迟数据的按配置顺序排在有数据的之后"""
+        def key(endpoint):
+            latency = endpoint.latency()
+            return (endpoint.breaker.state == 'open', latency is None, latency or 0, endpoint.priority)
+        return sorted(self.endpoints, key=key)
+
+    def call(self, endpoint, action, fn):
+        """单次调用：熔断检查 + 计时 + 记录结果"""
+        metrics = endpoint.metrics(action)
+        if not endpoint.breaker.allow():
+            metrics.short_circuits += 1
+            raise CircuitOpenError(f"{endpoint.domain} 已熔断")
+        metrics.calls += 1
+        start = time.perf_counter()
+        try:
+            result = fn(endpoint)
+        except Exception as e:
+            metrics.errors += 1
+            if _is_timeout(e):
+                metrics.timeouts += 1
+            endpoint.breaker.record(False)
+            raise
+        metrics.latencies.append(time.perf_counter() - start)
+        endpoint.breaker.record(True)
+        return result
+
+    def hedged(self, endpoint, action, fn):
+        """超过近期 p95 仍未返回时对同一接入点再发一次，取先成功的结果（只用于幂等的查询）"""
+        delay = endpoint.hedge_delay(action)
+        if delay is None:
+            return self.call(endpoint, action, fn)
+        pool = self._executor()
+        first = pool.submit(self.call, endpoint, action, fn)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        metrics = endpoint.metrics(action)
+        metrics.hedges += 1
+        second = pool.submit(self.call, endpoint, action, fn)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        metrics.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _backoff(attempt):
+        delay = min(BACKOFF_BASE_SECONDS * (2 ** attempt), BACKOFF_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+    def submit(self, action, fn):
+        """提交任务：按排序依次尝试接入点，全部失败后退避重来，返回 (接入点, 结果)
+
+        任务ID只在受理它的地域有效，所以只有提交可以跨接入点转移
+        提交不是幂等的：只在确定未被受理（连接失败、服务端返回错误）时重试或转移，
+        读超时等结果未知的错误直接抛出，否则可能重复创建计费的识别任务
+        """
+        error = None
+        for attempt in range(MAX_ATTEMPTS):
+            for n, endpoint in enumerate(self.ranked()):
+                try:
+                    result = self.call(endpoint, action, fn)
+                except Exception as e:
+                    if not _not_accepted(e):
+                        raise
+                    error = e
+                    continue
+                if n or attempt:
+                    endpoint.metrics(action).failovers += 1
+                return endpoint, result
+            if attempt + 1 < MAX_ATTEMPTS:
+                time.sleep(self._backoff(attempt))
+        raise error
+
+    def query(self, endpoint, action, fn, hedge=True):
+        """查询结果：在受理任务的接入点上对冲 + 退避重试
+
+        hedge 为False时不对冲；响应可能很大时（运行中带中间结果、最终结果）由调用方关闭，
+        避免同一份结果被下载两次
+        """
+        error = None
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                if not hedge:
+                    return self.call(endpoint, action, fn)
+                return self.hedged(endpoint, action, fn)
+            except CircuitOpenError as e:
+                # 熔断期间等待冷却，不计入失败
+                error = e
+                time.sleep(min(endpoint.breaker.cooldown, BACKOFF_MAX_SECONDS))
+            except Exception as e:
+                error = e
+                endpoint.metrics(action).retries += 1
+                if attempt + 1 < MAX_ATTEMPTS:
+                    time.sleep(self._backoff(attempt))
+        raise error
+
+    def snapshot(self):
+        return [endpoint.snapshot() for endpoint in self.endpoints]
+
+
+# 进程内按配置共享调用层，熔断和延迟统计跨任务累计
+_callers = {}
+_callers_lock = threading.Lock()
+
+
+def get_caller():
+    """按当前环境变量取得共享的调用层"""
+    spec = os.getenv(ENDPOINTS_ENV) or f"{DEFAULT_REGION}={os.getenv('NLS_FILETRANS_DOMAIN', DEFAULT_DOMAIN)}"
+    with _callers_lock:
+        caller = _callers.get(spec)
+        if caller is None:
+            caller = _callers[spec] = ResilientCaller(parse_endpoints(spec))
+        return caller
+
+
+def reset_callers():
+    """丢弃所有共享调用层（熔断状态、延迟和调用统计），下次 get_caller 时重新创建；
+    用于压测等需要在同一进程内多轮互不影响的场景"""
+    with _callers_lock:
+        callers = list(_callers.values())
+        _callers.clear()
+    for caller in callers:
+        caller.close()
+
+
+def metrics_snapshot():
+    """所有调用层的接入点统计"""
+    with _callers_lock:
+        callers = list(_callers.values())
+    return [endpoint for caller in callers for endpoint in caller.snapshot()]
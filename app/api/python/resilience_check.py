@@ -0,0 +1,191 @@
+# -*- coding: utf8 -*-
+# 离线检查 resilience.py：启动带故障注入的模拟识别服务（fake_filetrans.py），经 speech.fileTrans
+# 走完整的提交/轮询路径，逐项核对故障转移、提交不重复、熔断、查询重试和对冲
+#   python resilience_check.py
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import tempfile
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+import app.api.python.resilience as resilience
+import app.api.python.speech as speech
+from app.api.python.fake_filetrans import FakeFiletrans, STATUS_CODE_SUCCESS
+
+GET_REQUEST_ACTION = "GetTaskResult"
+SUBMIT_ACTION = "SubmitTask"
+
+
+class CountingFiletrans(FakeFiletrans):
+    """统计返回最终结果的次数；final_delay 模拟最终结果的下载耗时"""
+
+    def __init__(self, final_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.final_delay = final_delay
+        self.final_count = 0
+
+    def query(self, task_id):
+        response = super().query(task_id)
+        if response.get('StatusCode') == STATUS_CODE_SUCCESS:
+            with self.lock:
+                self.final_count += 1
+            time.sleep(self.final_delay)
+        return response
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _run(spec):
+    """按接入点配置跑一次 fileTrans，返回 (结果或异常, 该配置的调用层)"""
+    os.environ[resilience.ENDPOINTS_ENV] = spec
+    try:
+        outcome = speech.fileTrans('check', 'check', 'check', 'http://check/audio.mp3', 'json')
+    except Exception as e:
+        outcome = e
+    return outcome, resilience.get_caller()
+
+
+def _metrics(caller, n, action):
+    return caller.endpoints[n].metrics(action)
+
+
+def check_submit_failover_on_error():
+    bad, good = FakeFiletrans(error_rate=1.0).start(), FakeFiletrans(run_seconds=0.1).start()
+    try:
+        outcome, caller = _run(f"cn-shanghai={bad.domain},cn-beijing={good.domain}")
+        ok = isinstance(outcome, dict) and bad.submit_count == 0 and good.submit_count == 1
+        return ok, f"HTTP 500 后转移：任务数 {bad.submit_count}/{good.submit_count}，" \
+                   f"转移 {_metrics(caller, 1, SUBMIT_ACTION).failovers} 次"
+    finally:
+        bad.stop()
+        good.stop()
+
+
+def check_submit_failover_on_refused():
+    good = FakeFiletrans(run_seconds=0.1).start()
+    try:
+        outcome, caller = _run(f"cn-shanghai=127.0.0.1:{_closed_port()},cn-beijing={good.domain}")
+        ok = isinstance(outcome, dict) and good.submit_count == 1
+        return ok, f"连接被拒后转移：任务数 {good.submit_count}，" \
+                   f"第一个接入点错误 {_metrics(caller, 0, SUBMIT_ACTION).errors} 次"
+    finally:
+        good.stop()
+
+
+def check_submit_timeout_not_retried():
+    # 第一个请求（提交）在读超时之后才返回：服务端已受理，客户端不知道结果
+    delays = iter([resilience.READ_TIMEOUT_SECONDS * 3])
+    slow = FakeFiletrans(run_seconds=0.1, latency=lambda: next(delays, 0.0)).start()
+    other = FakeFiletrans(run_seconds=0.1).start()
+    try:
+        outcome, caller = _run(f"cn-shanghai={slow.domain},cn-beijing={other.domain}")
+        time.sleep(resilience.READ_TIMEOUT_SECONDS * 3)
+        created = slow.submit_count + other.submit_count
+        ok = isinstance(outcome, Exception) and created == 1
+        return ok, f"读超时不重试：共创建 {created} 个任务，" \
+                   f"提交调用 {_metrics(caller, 0, SUBMIT_ACTION).calls + _metrics(caller, 1, SUBMIT_ACTION).calls} 次"
+    finally:
+        slow.stop()
+        other.stop()
+
+
+def check_breaker_opens():
+    bad = FakeFiletrans(error_rate=1.0).start()
+    try:
+        spec = f"cn-shanghai={bad.domain}"
+        for _ in range(3):
+            _run(spec)
+        outcome, caller = _run(spec)
+        endpoint = caller.endpoints[0]
+        metrics = endpoint.metrics(SUBMIT_ACTION)
+        ok = isinstance(outcome, Exception) and endpoint.breaker.opens >= 1 and metrics.short_circuits > 0
+        return ok, f"熔断：状态 {endpoint.breaker.state}，打开 {endpoint.breaker.opens} 次，" \
+                   f"短路 {metrics.short_circuits} 次 / 实际请求 {metrics.calls} 次"
+    finally:
+        bad.stop()
+
+
+def check_query_retry():
+    flaky = FakeFiletrans(run_seconds=0.3, error_rate=0.2, seed=1).start()
+    try:
+        outcome, caller = _run(f"cn-shanghai={flaky.domain}")
+        metrics = _metrics(caller, 0, GET_REQUEST_ACTION)
+        ok = isinstance(outcome, dict) and flaky.submit_count == 1 and metrics.retries > 0
+        return ok, f"查询重试：注入错误 {flaky.error_count} 次，重试 {metrics.retries} 次，任务数 {flaky.submit_count}"
+    finally:
+        flaky.stop()
+
+
+def check_hedging():
+    # 排队阶段偶发慢请求会被对冲；最终结果很慢，但不应被下载两次
+    rng = random.Random(3)
+    fake = CountingFiletrans(final_delay=0.2, queue_seconds=2.0, run_seconds=0.3,
+                             latency=lambda: 0.3 if rng.random() < 0.04 else 0.005).start()
+    try:
+        outcome, caller = _run(f"cn-shanghai={fake.domain}")
+        metrics = _metrics(caller, 0, GET_REQUEST_ACTION)
+        ok = isinstance(outcome, dict) and metrics.hedges > 0 and fake.final_count == 1
+        return ok, f"对冲：{metrics.hedges} 次（胜出 {metrics.hedge_wins}），最终结果下载 {fake.final_count} 次"
+    finally:
+        fake.stop()
+
+
+CHECKS = (
+    ('提交遇服务端错误转移', check_submit_failover_on_error),
+    ('提交遇连接被拒转移', check_submit_failover_on_refused),
+    ('提交读超时不重试', check_submit_timeout_not_retried),
+    ('熔断', check_breaker_opens),
+    ('查询重试', check_query_retry),
+    ('查询对冲', check_hedging),
+)
+
+
+def run_checks(read_timeout=0.3, poll_interval=0.02):
+    """逐项检查并返回 [(检查项, 是否通过, 说明)]；结果保存到临时目录"""
+    saved = (resilience.READ_TIMEOUT_SECONDS, resilience.BACKOFF_BASE_SECONDS, speech.POLL_INTERVAL_SECONDS,
+             os.environ.get(resilience.ENDPOINTS_ENV), os.getcwd())
+    resilience.READ_TIMEOUT_SECONDS = read_timeout
+    resilience.BACKOFF_BASE_SECONDS = 0.01
+    speech.POLL_INTERVAL_SECONDS = poll_interval
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for name, check in CHECKS:
+                try:
+                    ok, detail = check()
+                except Exception as e:
+                    ok, detail = False, f"{type(e).__name__}: {e}"
+                rows.append((name, ok, detail))
+        finally:
+            os.chdir(saved[4])
+            resilience.READ_TIMEOUT_SECONDS, resilience.BACKOFF_BASE_SECONDS, speech.POLL_INTERVAL_SECONDS = saved[:3]
+            if saved[3] is None:
+                os.environ.pop(resilience.ENDPOINTS_ENV, None)
+            else:
+                os.environ[resilience.ENDPOINTS_ENV] = saved[3]
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='用带故障注入的模拟识别服务检查超时、转移、熔断和对冲')
+    parser.add_argument('--read_timeout', type=float, default=0.3, help='检查期间的读超时（秒）')
+    args = parser.parse_args()
+
+    started = time.time()
+    rows = run_checks(args.read_timeout)
+    for name, ok, detail in rows:
+        print(f"{'OK  ' if ok else 'FAIL'} {name}  {detail}")
+    print(f"用时 {time.time() - started:.1f}s")
+    sys.exit(0 if all(ok for _, ok, _ in rows) else 1)
@@ -0,0 +1,385 @@
+# -*- coding: utf8 -*-
+# results/ 目录的分片布局、打包压实和保留策略
+#
+# 布局：results/YYYY/MM/DD/<task_id前2位>/<时间戳>_<task_id>.<后缀>
+# 压实：早于指定天数的分片按天打包为 results/packs/YYYYMMDD-N.pack（文件原样拼接），
+#       每个包旁边有一份 .idx（JSON Lines）记录各文件的偏移和长度
+# 索引：results/index.db 记录每个文件在哪（散文件路径或包+偏移），按 task_id 查找无需扫目录
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+INDEX_NAME = 'index.db'
+PACK_DIR = 'packs'
+# 默认把7天前的分片打包
+DEFAULT_COMPACT_AFTER_DAYS = 7
+# 文件名中的时间戳格式，分片日期从这里解析
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+# 索引中登记的结果文件后缀（含保存时附带的语音区间表、波形峰值、句子音频片段、各种导出格式和性能分析产物）
+RESULT_SUFFIXES = ('.json', '.csv', '.srt', '.vtt', '.tsv', '.vad.npy', '.peaks', '.clips', '.prof', '.profile.txt')
+# 旧版文件名只含 task_id 前几位，迁移后索引中的 task_id 也是这个长度
+LEGACY_TASK_ID_LENGTH = 8
+
+
+def entry_name(task_id, when=None):
+    """结果条目名：<时间戳>_<完整task_id>，不再截断 task_id，避免同一秒内的重名"""
+    when = when or datetime.now()
+    return f"{when.strftime(TIMESTAMP_FORMAT)}_{task_id or 'unknown'}"
+
+
+def split_name(name):
+    """从条目名解析 (保存时间, task_id)"""
+    stamp, task_id = name[:15], name[16:]
+    return datetime.strptime(stamp, TIMESTAMP_FORMAT), task_id
+
+
+def shard_path(name):
+    """条目所在的分片目录（相对结果目录），只由条目名决定"""
+    when, task_id = split_name(name)
+    return Path(when.strftime('%Y'), when.strftime('%m'), when.strftime('%d'), (task_id or 'xx')[:2])
+
+
+def _split_file(filename):
+    """把文件名拆成 (条目名, 后缀)，识别 .vad.npy 这样的双后缀"""
+    for suffix in RESULT_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)], suffix
+    return None, None
+
+
+def is_entry_name(name):
+    try:
+        split_name(name)
+    except ValueError:
+        return False
+    return len(name) > 16 and name[15] == '_'
+
+
+class ResultStore:
+    """结果目录的索引和维护操作
+
+    同一目录可被多个进程同时使用（SQLite WAL），写入索引的是保存、压实和清理三类操作
+    """
+
+    def __init__(self, root="results"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / INDEX_NAME), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT NOT NULL,
+                suffix TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                path TEXT,
+                pack TEXT,
+                offset INTEGER,
+                PRIMARY KEY (name, suffix)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_task_id ON files (task_id, created_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_created_at ON files (created_at)')
+
+    # ---------- 保存与查找 ----------
+
+    def path_for(self, name, suffix):
+        """新文件应写入的位置（会创建分片目录）"""
+        directory = self.root / shard_path(name)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{name}{suffix}"
+
+    def register(self, path):
+        """登记一个已写好的散文件"""
+        path = Path(path)
+        name, suffix = _split_file(path.name)
+        if name is None or not is_entry_name(name):
+            raise ValueError(f"不是结果文件：{path}")
+        when, task_id = split_name(name)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (name, suffix, task_id, created_at, size, path, pack, offset) '
+                'VALUES (?, ?, ?, ?, ?, ?, NULL, NULL)',
+                (name, suffix, task_id, when.timestamp(), path.stat().st_size,
+                 str(path.relative_to(self.root))))
+
+    def find(self, task_id):
+        """某个任务的全部条目名，最新的在前
+
+        没有完整 task_id 的条目时，回退到按前8位登记的旧版迁移条目（见 import_flat），
+        并用条目JSON中的 taskId 排除前8位相同的其他任务
+        """
+        query = 'SELECT DISTINCT name FROM files WHERE task_id = ? ORDER BY created_at DESC, name DESC'
+        with self._lock:
+            rows = self._conn.execute(query, (task_id,)).fetchall()
+            if rows or not task_id or len(task_id) <= LEGACY_TASK_ID_LENGTH:
+                return [row[0] for row in rows]
+            rows = self._conn.execute(query, (task_id[:LEGACY_TASK_ID_LENGTH],)).fetchall()
+        return [row[0] for row in rows if self._legacy_task_id(row[0]) in (None, task_id)]
+
+    def _legacy_task_id(self, name):
+        """旧版条目JSON中记录的完整 taskId；没有JSON或无法解析时返回None"""
+        try:
+            return json.loads(self.read_entry(name, '.json')).get('taskId')
+        except (KeyError, ValueError, AttributeError):
+            return None
+
+    def names(self, suffix='.json'):
+        """全部条目名（按时间排序）"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name FROM files WHERE suffix = ? ORDER BY created_at, name', (suffix,)).fetchall()
+        return [row[0] for row in rows]
+
+    def read_entry(self, name, suffix='.json'):
+        """按条目名读取文件内容（bytes），散文件和包内文件均可"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT path, pack, offset, size FROM files WHERE name = ? AND suffix = ?',
+                (name, suffix)).fetchone()
+        if row is None:
+            raise KeyError(f"{name}{suffix}")
+        path, pack, offset, size = row
+        if pack is None:
+            return (self.root / path).read_bytes()
+        with open(self.root / PACK_DIR / pack, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def read(self, task_id, suffix='.json'):
+        """读取某个任务最新一次保存的结果文件内容（bytes），找不到返回None"""
+        for name in self.find(task_id):
+            try:
+                return self.read_entry(name, suffix)
+            except KeyError:
+                continue
+        return None
+
+    def load(self, task_id):
+        """读取某个任务最新一次保存的JSON结果"""
+        data = self.read(task_id, '.json')
+        return json.loads(data) if data is not None else None
+
+    # ---------- 压实 ----------
+
+    def compact(self, older_than_days=DEFAULT_COMPACT_AFTER_DAYS):
+        """把早于 older_than_days 天的散文件按天打包，返回打包的文件数"""
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).replace(
+            hour=0, minute=0, second=0, microsecond=0).timestamp()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, suffix, created_at, size, path FROM files '
+                'WHERE pack IS NULL AND created_at < ? ORDER BY created_at, name, suffix',
+                (cutoff,)).fetchall()
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row[0][:8], []).append(row)
+
+        packed = 0
+        for day, day_rows in by_day.items():
+            packed += self._write_pack(day, day_rows)
+        self._remove_empty_dirs()
+        return packed
+
+    def _next_pack_name(self, day):
+        pack_dir = self.root / PACK_DIR
+        n = 0
+        while (pack_dir / f"{day}-{n}.pack").exists():
+            n += 1
+        return f"{day}-{n}.pack"
+
+    def _write_pack(self, day, rows):
+        pack_dir = self.root / PACK_DIR
+        pack_dir.mkdir(exist_ok=True)
+        pack_name = self._next_pack_name(day)
+        tmp_path = pack_dir / (pack_name + '.tmp')
+        entries = []
+        offset = 0
+        with open(tmp_path, 'wb') as pack:
+            for name, suffix, created_at, size, path in rows:
+                try:
+                    data = (self.root / path).read_bytes()
+                except FileNotFoundError:
+                    continue
+                pack.write(data)
+                entries.append({'name': name, 'suffix': suffix, 'created_at': created_at,
+                                'offset': offset, 'size': len(data), 'path': path})
+                offset += len(data)
+            pack.flush()
+            os.fsync(pack.fileno())
+        if not entries:
+            tmp_path.unlink()
+            return 0
+        # 先写 .idx 再把包改名就位，包一旦可见就有完整的索引
+        with open(pack_dir / (pack_name + '.idx'), 'w', encoding='utf-8') as idx:
+            for entry in entries:
+                idx.write(json.dumps({k: v for k, v in entry.items() if k != 'path'}) + '\n')
+        os.replace(tmp_path, pack_dir / pack_name)
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'UPDATE files SET path = NULL, pack = ?, offset = ?, size = ? WHERE name = ? AND suffix = ?',
+                    [(pack_name, e['offset'], e['size'], e['name'], e['suffix']) for e in entries])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        # 索引切换到包之后才删除散文件
+        for entry in entries:
+            (self.root / entry['path']).unlink(missing_ok=True)
+        return len(entries)
+
+    def _remove_empty_dirs(self):
+        # 只清理 YYYY/MM/DD/xx 四层分片目录，自底向上
+        for depth in ('*/*/*/*', '*/*/*', '*/*'):
+            for directory in self.root.glob(depth):
+                if directory.is_dir() and directory.parts[len(self.root.parts)].isdigit():
+                    try:
+                        directory.rmdir()
+                    except OSError:
+                        pass
+
+    # ---------- 保留策略 ----------
+
+    def usage(self):
+        """(条目数, 总字节数)"""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(DISTINCT name), COALESCE(SUM(size), 0) FROM files").fetchone()
+        return count, total
+
+    def prune(self, max_age_days=None, max_bytes=None):
+        """按时间和/或总大小清理最旧的结果，返回删除的条目数
+
+        包只能整体删除：包里最新的条目也过期、或为满足大小限制需要删到它时，才删除整个包
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, suffix, created_at, size, path, pack FROM files ORDER BY created_at, name'
+            ).fetchall()
+        # 删除单位：一个包，或一个条目的全部散文件；按最新时间排序，保证先删最旧的
+        units = {}
+        for name, suffix, created_at, size, path, pack in rows:
+            key = ('pack', pack) if pack else ('entry', name)
+            unit = units.setdefault(key, {'newest': created_at, 'size': 0, 'names': set(), 'paths': []})
+            unit['newest'] = max(unit['newest'], created_at)
+            unit['size'] += size
+            unit['names'].add(name)
+            if path:
+                unit['paths'].append(path)
+        ordered = sorted(units.items(), key=lambda item: item[1]['newest'])
+
+        cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+        total = sum(unit['size'] for unit in units.values())
+        removed = set()
+        for (kind, key), unit in ordered:
+            expired = cutoff is not None and unit['newest'] < cutoff
+            oversize = max_bytes is not None and total > max_bytes
+            if not expired and not oversize:
+                break
+            self._delete_unit(kind, key, unit)
+            total -= unit['size']
+            removed |= unit['names']
+        self._remove_empty_dirs()
+        return len(removed)
+
+    def _delete_unit(self, kind, key, unit):
+        with self._lock:
+            if kind == 'pack':
+                self._conn.execute('DELETE FROM files WHERE pack = ?', (key,))
+            else:
+                self._conn.execute('DELETE FROM files WHERE name = ? AND pack IS NULL', (key,))
+        if kind == 'pack':
+            (self.root / PACK_DIR / key).unlink(missing_ok=True)
+            (self.root / PACK_DIR / (key + '.idx')).unlink(missing_ok=True)
+        for path in unit['paths']:
+            (self.root / path).unlink(missing_ok=True)
+
+    # ---------- 迁移与重建 ----------
+
+    def import_flat(self):
+        """把旧版平铺在结果目录顶层的文件移入分片目录并登记，返回迁移的文件数
+
+        旧文件名只含 task_id 前8位，条目名保持不变；按完整 task_id 查找时 find 会回退到前8位
+        """
+        moved = 0
+        for path in sorted(self.root.iterdir()):
+            if not path.is_file():
+                continue
+            name, suffix = _split_file(path.name)
+            if name is None or not is_entry_name(name):
+                continue
+            target = self.path_for(name, suffix)
+            os.replace(path, target)
+            self.register(target)
+            moved += 1
+        return moved
+
+    def rebuild_index(self):
+        """从散文件和包的 .idx 重新生成索引（索引文件损坏或丢失时使用）"""
+        with self._lock:
+            self._conn.execute('DELETE FROM files')
+        for path in self.root.glob('[0-9]*/*/*/*/*'):
+            name, suffix = _split_file(path.name)
+            if name is not None and is_entry_name(name):
+                self.register(path)
+        for idx_path in sorted((self.root / PACK_DIR).glob('*.pack.idx')):
+            pack_name = idx_path.name[:-len('.idx')]
+            with open(idx_path, 'r', encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            with self._lock:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO files (name, suffix, task_id, created_at, size, path, pack, offset) '
+                    'VALUES (?, ?, ?, ?, ?, NULL, ?, ?)',
+                    [(e['name'], e['suffix'], split_name(e['name'])[1], e['created_at'], e['size'],
+                      pack_name, e['offset']) for e in entries])
+        return self.usage()[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='识别结果目录的打包压实与保留清理')
+    parser.add_argument('command', choices=['compact', 'prune', 'migrate', 'reindex', 'stats', 'get'],
+                        help='compact 打包旧分片；prune 按保留策略清理；migrate 迁移旧版平铺文件；'
+                             'reindex 重建索引；stats 查看占用；get 按 task_id 输出结果')
+    parser.add_argument('--results_dir', default='results', help='结果目录')
+    parser.add_argument('--older_than_days', type=int, default=DEFAULT_COMPACT_AFTER_DAYS,
+                        help='compact：打包多少天之前的分片')
+    parser.add_argument('--max_age_days', type=float, help='prune：保留的最长天数')
+    parser.add_argument('--max_mb', type=float, help='prune：结果目录的最大占用（MB）')
+    parser.add_argument('--task_id', help='get：要读取的任务ID')
+    args = parser.parse_args()
+
+    store = ResultStore(args.results_dir)
+    if args.command == 'compact':
+        print(json.dumps({'packed': store.compact(args.older_than_days)}))
+    elif args.command == 'prune':
+        if args.max_age_days is None and args.max_mb is None:
+            parser.error('prune 需要 --max_age_days 或 --max_mb')
+        max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+        print(json.dumps({'removed': store.prune(args.max_age_days, max_bytes)}))
+    elif args.command == 'migrate':
+        print(json.dumps({'moved': store.import_flat()}))
+    elif args.command == 'reindex':
+        print(json.dumps({'entries': store.rebuild_index()}))
+    elif args.command == 'stats':
+        count, total = store.usage()
+        print(json.dumps({'entries': count, 'bytes': total}))
+    else:
+        if not args.task_id:
+            parser.error('get 需要 --task_id')
+        data = store.read(args.task_id)
+        if data is None:
+            print(f"未找到任务：{args.task_id}", file=sys.stderr)
+            sys.exit(1)
+        sys.stdout.write(data.decode('utf-8'))
@@ -0,0 +1,300 @@
+# -*- coding: utf8 -*-
+# 局部重新识别：朗读者重录了章节中的几段后，只把新音频中对应的片段切出来识别，
+# 再把新的句子和词拼接回已保存的结果。编辑区间先扩展到完整的句子边界；
+# 编辑区间之后的时间戳按新旧时长差平移，未改动的句子和词保留原有ID，
+# 被替换的行记入 removed_rows，写入Postgres时在同一事务内删除（见 pgwriter.py）；
+# supabase 路由不会删除这些行，因此不能作为拼接结果的存储格式
+#
+# 编辑写法：旧开始-旧结束[=新开始-新结束]，时间为秒数或 [时:]分:秒，例如 12:00-14:00=12:00-14:30；
+# 省略新区间表示时长不变
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.storage import ResultStorage
+
+# 切片前后多留的毫秒数，避免切掉首尾的音素；落在余量里的句子不采用
+PAD_MS = 300
+# 编辑区间之前的音频在新旧文件中的偏移允许的误差（毫秒）
+ALIGN_TOLERANCE_MS = 1000
+# 句子中随时间平移的字段（含原始返回中的字段）
+_SENTENCE_TIME_FIELDS = ('begin_time', 'end_time', 'BeginTime', 'EndTime')
+
+
+def parse_time(text):
+    """'90' / '1:30' / '0:01:30.5' -> 毫秒"""
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return int(round(seconds * 1000))
+
+
+def parse_edits(specs):
+    """解析编辑列表，返回按旧开始时间排序的 [(旧开始, 旧结束, 新开始, 新结束), ...]（毫秒）"""
+    edits = []
+    for spec in specs:
+        old, _, new = spec.partition('=')
+        old_begin, old_end = (parse_time(t) for t in old.split('-'))
+        if new:
+            new_begin, new_end = (parse_time(t) for t in new.split('-'))
+        else:
+            new_begin, new_end = None, None
+        if old_end <= old_begin or (new and new_end <= new_begin):
+            raise ValueError(f"编辑区间无效：{spec}")
+        edits.append((old_begin, old_end, new_begin, new_end))
+    edits.sort()
+    # 省略新区间：时长不变，位置随之前的编辑平移
+    offset = 0
+    for k, (old_begin, old_end, new_begin, new_end) in enumerate(edits):
+        if new_begin is None:
+            edits[k] = (old_begin, old_end, old_begin + offset, old_end + offset)
+        offset = edits[k][3] - old_end
+    return edits
+
+
+def plan_splices(sentences, edits):
+    """把编辑区间扩展到完整句子并合并重叠的区间
+
+    返回 [{'old': [开始, 结束], 'new': [开始, 结束]}, ...]；编辑之前的音频在新旧文件中的偏移
+    必须与上一段编辑结束后的偏移一致，否则无法确定未改动部分的时间戳
+    """
+    begin = np.fromiter((s['begin_time'] for s in sentences), dtype=np.int64, count=len(sentences))
+    end = np.fromiter((s['end_time'] for s in sentences), dtype=np.int64, count=len(sentences))
+    splices = []
+    offset = 0
+    for old_begin, old_end, new_begin, new_end in edits:
+        if abs((new_begin - old_begin) - offset) > ALIGN_TOLERANCE_MS:
+            raise ValueError(f"编辑 {old_begin / 1000:.1f}s 之前的音频偏移 {(new_begin - old_begin) / 1000:+.1f}s "
+                             f"与上一段编辑之后的偏移 {offset / 1000:+.1f}s 不一致")
+        touched = (begin < old_end) & (end > old_begin)
+        if touched.any():
+            head = old_begin - min(old_begin, int(begin[touched].min()))
+            tail = max(old_end, int(end[touched].max())) - old_end
+        else:
+            head = tail = 0
+        splice = {'old': [old_begin - head, old_end + tail], 'new': [new_begin - head, new_end + tail]}
+        if splices and splice['old'][0] <= splices[-1]['old'][1]:
+            previous = splices[-1]
+            previous['old'][1] = max(previous['old'][1], splice['old'][1])
+            previous['new'][1] = max(previous['new'][1], splice['new'][1])
+        else:
+            splices.append(splice)
+        offset = new_end - old_end
+    return splices
+
+
+def shift_for(splices, times):
+    """旧时间线上（编辑区间之外）的时间在新时间线上的位置"""
+    times = np.asarray(times, dtype=np.int64)
+    if not splices:
+        return times
+    old_end = np.array([s['old'][1] for s in splices], dtype=np.int64)
+    offsets = np.array([0] + [s['new'][1] - s['old'][1] for s in splices], dtype=np.int64)
+    return times + offsets[np.searchsorted(old_end, times, side='right')]
+
+
+def cut_segment(source, begin_ms, end_ms, path):
+    """用ffmpeg从 source 中切出 [begin_ms, end_ms) 并编码为单声道mp3"""
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y',
+        '-ss', f"{begin_ms / 1000:.3f}", '-i', str(source), '-t', f"{(end_ms - begin_ms) / 1000:.3f}",
+        '-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', '64k', str(path)
+    ]
+    try:
+        completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("未找到ffmpeg，请先安装ffmpeg并加入PATH")
+    if completed.returncode != 0:
+        raise RuntimeError(f"切分音频失败 ({completed.returncode})："
+                           f"{completed.stderr.decode('utf-8', errors='replace').strip()}")
+    return path
+
+
+def segment_window(splice):
+    """实际切出并识别的范围（新时间线）：编辑区间加前后余量"""
+    return max(splice['new'][0] - PAD_MS, 0), splice['new'][1] + PAD_MS
+
+
+def transcribe_segment(akId, akSecret, appKey, source, splice, workdir):
+    """切出并上传一段新音频，识别后返回原始结果（时间相对于片段开始）
+
+    片段结果只用于拼接，不单独保存，也不登记到结果索引和指纹库
+    """
+    from app.api.python.speech import fileTrans
+    from app.api.python.upload import upload_file
+
+    begin, end = segment_window(splice)
+    path = cut_segment(source, begin, end, os.path.join(workdir, f"segment_{begin}_{end}.mp3"))
+    _, link = upload_file(path)
+    return fileTrans(akId, akSecret, appKey, link, None, dedup=False)
+
+
+def splice_result(data, splices, segments, storage=None):
+    """把各段的识别结果拼接进已处理的结果，返回新的结果（不修改 data）
+
+    segments 与 splices 一一对应，为 fileTrans 返回的原始结果；
+    原有句子和词的ID不变，被替换的行的ID记入 removed_rows
+    """
+    storage = storage or ResultStorage()
+    sentences = data['sentences']
+    words = data['words']
+    raw = data.get('results')
+    if not isinstance(raw, list) or len(raw) != len(sentences):
+        raw = [None] * len(sentences)
+
+    old_begin = np.fromiter((s['begin_time'] for s in sentences), dtype=np.int64, count=len(sentences))
+    old_end = np.fromiter((s['end_time'] for s in sentences), dtype=np.int64, count=len(sentences))
+    # 与任一编辑区间重叠的句子被替换
+    replaced = np.zeros(len(sentences), dtype=bool)
+    for span in splices:
+        replaced |= (old_begin < span['old'][1]) & (old_end > span['old'][0])
+    new_begin = shift_for(splices, old_begin)
+    shift = new_begin - old_begin
+
+    removed_sentences = {sentences[i]['id'] for i in np.flatnonzero(replaced).tolist()}
+    rows = []
+    for i, sentence in enumerate(sentences):
+        if replaced[i]:
+            continue
+        delta = int(shift[i])
+        rows.append((_shifted(sentence, delta), _shifted(raw[i], delta) if raw[i] is not None else None))
+
+    word_begin = np.fromiter((w['begin_time'] for w in words), dtype=np.int64, count=len(words))
+    in_span = np.zeros(len(words), dtype=bool)
+    for span in splices:
+        in_span |= (word_begin >= span['old'][0]) & (word_begin < span['old'][1])
+    word_shift = shift_for(splices, word_begin) - word_begin
+    removed_words = []
+    kept_words = []
+    for i, word in enumerate(words):
+        if word['sentence_id'] in removed_sentences or (word['sentence_id'] is None and in_span[i]):
+            removed_words.append(word['id'])
+        else:
+            delta = int(word_shift[i])
+            kept_words.append({**word, 'begin_time': word['begin_time'] + delta,
+                               'end_time': word['end_time'] + delta})
+
+    # 新片段：按原流程生成ID和句子关联，再换算到新时间线
+    for splice, segment in zip(splices, segments):
+        offset, _ = segment_window(splice)
+        processed = storage._process_result({'results': segment['results'], 'words': segment['words'],
+                                             'taskId': segment.get('taskId')})
+        kept_ids = set()
+        for sentence, raw_sentence in zip(processed['sentences'], segment['results']):
+            middle = offset + (sentence['begin_time'] + sentence['end_time']) // 2
+            # 中点落在余量里的是相邻未改动句子的残片
+            if not splice['new'][0] <= middle < splice['new'][1]:
+                continue
+            kept_ids.add(sentence['id'])
+            rows.append((_shifted(sentence, offset), _shifted(raw_sentence, offset)))
+        kept_words.extend({**w, 'begin_time': w['begin_time'] + offset, 'end_time': w['end_time'] + offset}
+                          for w in processed['words'] if w['sentence_id'] in kept_ids)
+
+    rows.sort(key=lambda row: row[0]['begin_time'])
+    kept_words.sort(key=lambda w: w['begin_time'])
+    result = {
+        **data,
+        'sentences': [row[0] for row in rows],
+        'words': kept_words,
+        'removed_rows': {'sentences': sorted(removed_sentences), 'words': removed_words},
+        'splices': list(data.get('splices') or []) + [
+            {'old': s['old'], 'new': s['new'], 'task_id': seg.get('taskId')} for s, seg in zip(splices, segments)],
+        'timestamp': datetime.now().isoformat(),
+    }
+    if all(row[1] is not None for row in rows):
+        result['results'] = [row[1] for row in rows]
+    else:
+        # 缺少原始句子时不能沿用旧结果的 results，否则与拼接后的 sentences 对不上
+        result.pop('results', None)
+    return result
+
+
+def _shifted(sentence, delta):
+    shifted = dict(sentence)
+    for field in _SENTENCE_TIME_FIELDS:
+        if field in shifted:
+            shifted[field] += delta
+    return shifted
+
+
+def retranscribe(task_id, source, edits, storage_format='json', results_dir='results', workers=None,
+                 audio_url=None):
+    """重新识别已保存结果中被编辑的区间，拼接后保存为该任务的最新结果，返回 (新结果, 统计)
+
+    audio_url 为编辑后音频的访问地址；为空时 source 是URL则用 source，否则保留原结果的地址
+    （本地文件路径不能作为 audio_url 保存）
+    """
+    from app.api.python.speech import load_env
+
+    ResultStorage.check_removal_formats(storage_format)
+    load_env()
+    storage = ResultStorage(results_dir)
+    data = storage.load(task_id)
+    if data is None:
+        raise ValueError(f"找不到识别结果：{task_id}")
+    splices = plan_splices(data['sentences'], edits)
+    if not splices:
+        return data, {'splices': 0}
+
+    credentials = (os.getenv('ALIYUN_AK_ID'), os.getenv('ALIYUN_AK_SECRET'), os.getenv('NLS_APP_KEY'))
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix='retranscribe-') as workdir, \
+            ThreadPoolExecutor(max_workers=workers or len(splices)) as executor:
+        segments = list(executor.map(
+            lambda splice: transcribe_segment(*credentials, source, splice, workdir), splices))
+
+    result = splice_result(data, splices, segments, storage)
+    if audio_url is None and source.startswith(('http://', 'https://')):
+        audio_url = source
+    if audio_url is not None:
+        result['audio_url'] = audio_url
+        result['speech_results'] = [{**data['speech_results'][0], 'audio_url': audio_url}]
+    storage.save_processed(result, storage_format)
+
+    windows = [segment_window(s) for s in splices]
+    old_ids = {s['id'] for s in data['sentences']}
+    return result, {
+        'splices': len(splices),
+        'asr_seconds': round(sum(b - a for a, b in windows) / 1000, 1),
+        'chapter_seconds': round(max((s['end_time'] for s in result['sentences']), default=0) / 1000, 1),
+        'replaced_sentences': len(result['removed_rows']['sentences']),
+        'new_sentences': sum(1 for s in result['sentences'] if s['id'] not in old_ids),
+        'seconds': round(time.time() - start, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='只重新识别音频中被编辑的区间，拼接回已保存的结果')
+    parser.add_argument('task_id', help='已保存结果的识别任务ID')
+    parser.add_argument('--audio', required=True, help='编辑后的完整音频（本地文件或URL）')
+    parser.add_argument('--edit', action='append', required=True,
+                        help='编辑区间：旧开始-旧结束[=新开始-新结束]，如 12:00-14:00=12:00-14:30，可重复')
+    parser.add_argument('--audio_url', help='编辑后音频的访问地址，记入结果；默认 --audio 为URL时用它，否则保留原地址')
+    parser.add_argument('--format', default='json', help='存储格式/后端，与 speech.py --format 相同（不支持 supabase）')
+    parser.add_argument('--results_dir', default='results', help='结果目录')
+    args = parser.parse_args()
+
+    try:
+        edits = parse_edits(args.edit)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        ResultStorage.check_removal_formats(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    result, stats = retranscribe(args.task_id, args.audio, edits, args.format, args.results_dir,
+                                 audio_url=args.audio_url)
+    print(json.dumps(stats, ensure_ascii=False))
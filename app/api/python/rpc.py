@@ -0,0 +1,50 @@
+import base64
+import hashlib
+import hmac
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+# 响应体超过该大小后落盘，避免几十MB的识别结果常驻内存
+SPOOL_MAX_MEMORY = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _encode(value):
+    return quote(str(value), safe='~')
+
+
+def signed_rpc_url(akId, akSecret, domain, region_id, version, action, params):
+    """按阿里云RPC签名规则（HMAC-SHA1）生成GET请求地址，与 aliyunsdkcore 的签名一致"""
+    query = {
+        'Format': 'JSON',
+        'Version': version,
+        'AccessKeyId': akId,
+        'SignatureMethod': 'HMAC-SHA1',
+        'SignatureVersion': '1.0',
+        'SignatureNonce': uuid.uuid4().hex,
+        'Timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'RegionId': region_id,
+        'Action': action,
+        **params,
+    }
+    canonical = '&'.join(f"{_encode(k)}={_encode(v)}" for k, v in sorted(query.items()))
+    string_to_sign = 'GET&%2F&' + _encode(canonical)
+    digest = hmac.new((akSecret + '&').encode('utf-8'), string_to_sign.encode('utf-8'), hashlib.sha1).digest()
+    signature = base64.b64encode(digest).decode('ascii')
+    return f"http://{domain}/?{canonical}&Signature={_encode(signature)}"
+
+
+def fetch_to_spool(url, timeout=(10, 120)):
+    """流式下载响应体到临时文件（小于 SPOOL_MAX_MEMORY 时留在内存），返回已回到开头的文件对象"""
+    import requests
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        if response.status_code >= 400:
+            raise Exception(f"HTTP {response.status_code}：{response.text[:500]}")
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            spool.write(chunk)
+    spool.seek(0)
+    return spool
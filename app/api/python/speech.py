@@ -3,11 +3,6 @@ import json
 import time
 import os
 import argparse
-from aliyunsdkcore.acs_exception.exceptions import ClientException
-from aliyunsdkcore.acs_exception.exceptions import ServerException
-from aliyunsdkcore.client import AcsClient
-from aliyunsdkcore.request import CommonRequest
-from dotenv import load_dotenv
 from datetime import datetime
 import sys
 import os.path
@@ -19,18 +14,140 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
 sys.path.append(parent_dir)
 
 # 现在可以导入了
-from app.api.python.storage import ResultStorage
+# 阿里云SDK、dotenv、storage（requests/numpy）等较重的模块只在用到时才加载，
+# 保证每个任务进程冷启动尽可能快，见 --import-profile
+from app.api.python.ids import ID_STRATEGIES
 
-load_dotenv()
+_env_loaded = False
 
-def fileTrans(akId, akSecret, appKey, fileLink, storage_format='json'):
+
+def load_env():
+    """加载 .env 环境变量（只加载一次）"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def import_runtime():
+    """加载提交识别任务所需的阿里云SDK，返回 (AcsClient, CommonRequest)"""
+    from aliyunsdkcore.client import AcsClient
+    from aliyunsdkcore.request import CommonRequest
+    return AcsClient, CommonRequest
+
+# 一次识别任务（提交、轮询、保存）必经的模块，--import-profile 要求冷启动测量包含它们
+JOB_PATH_MODULES = (
+    'aliyunsdkcore.client',
+    'app.api.python.profiling',
+    'app.api.python.resilience',
+    'app.api.python.storage',
+)
+
+
+def import_job_path():
+    """加载 fileTrans 默认路径（不含 vad/stream/dedup 等可选功能）上的全部模块并初始化调用层，
+    供 --import-check 测量冷启动；不发起任何请求"""
+    load_env()
+    from app.api.python.profiling import start_job_profiler
+    from app.api.python.resilience import get_caller
+    from app.api.python.storage import ResultStorage
+    import_runtime()
+    start_job_profiler(False)
+    get_caller()
+    return ResultStorage
+
+# 轮询识别结果的间隔（秒）
+POLL_INTERVAL_SECONDS = 10
+# 回调模式下兜底轮询的间隔（秒）
+CALLBACK_FALLBACK_POLL_SECONDS = 60
+# 开启声学指纹去重的环境变量
+DEDUP_ENV = "SPEECH_DEDUP"
+
+def fileTrans(akId, akSecret, appKey, fileLink, storage_format='json', vad=False, id_strategy='random',
+              on_progress=None, callback_url=None, stream=False, profile=None, peaks=False, dedup=None):
+    """提交录音文件识别任务并轮询结果
+
+    on_progress 为可选回调：任务运行中每识别出新的句子，就以新增句子列表调用一次
+    callback_url 不为空时开启回调模式：识别完成由服务端推送到该地址（需由 callbacks.py
+    的接收端处理），轮询只作为低频兜底
+    stream 为True时 GetTaskResult 的响应体流式落到临时文件并增量解析，返回结果中的
+    results/words 是按需从文件读取的 StreamedArray，不会整体载入内存
+    profile 为True/"cpu"/"mem"时对本任务做性能分析（None时读取 SPEECH_PROFILE），
+    pstats 和报告与识别结果保存在一起，见 profiling.py
+    vad / peaks 为True时在识别进行期间于后台解码音频一次，同时计算语音区间表和
+    波形峰值金字塔（见 vad.py、peaks.py），与结果一起保存
+    dedup 为True时（None时读取 SPEECH_DEDUP）先计算音频的声学指纹，与之前识别过的音频
+    逐段一致时直接复用其结果、不再提交识别；只有部分区间不同（如原位重录）时照常识别，
+    并提示可用 retranscribe.py 只重新识别改动的区间，见 fingerprint.py
+    storage_format 为None时只返回原始结果，不保存、不登记指纹（如 retranscribe.py 识别的片段）
+    """
+    from app.api.python.profiling import start_job_profiler
+    profiler = start_job_profiler(profile)
+    if profiler is None:
+        return _file_trans(akId, akSecret, appKey, fileLink, storage_format, vad, id_strategy,
+                           on_progress, callback_url, stream, peaks, dedup)
+    try:
+        result = _file_trans(akId, akSecret, appKey, fileLink, storage_format, vad, id_strategy,
+                             on_progress, callback_url, stream, peaks, dedup, profiler)
+    except BaseException:
+        if profiler.running:
+            # 任务失败：产物单独保存便于排查，已提交时带上 taskId
+            _save_profile(profiler, f"{profiler.task_id}_failed" if profiler.task_id else 'failed')
+        raise
+    if profiler.running:
+        # 成功但产物没有随结果保存（如 storage_format 为None）：按 taskId 保存
+        _save_profile(profiler, result.get('taskId') or profiler.task_id)
+    return result
+
+
+def _save_profile(profiler, name):
+    """写出性能分析产物；保存失败只报告，不能掩盖任务本身的结果或异常"""
+    try:
+        from app.api.python.storage import ResultStorage
+        ResultStorage().save_profile(profiler, name)
+    except Exception as e:
+        print(f"保存性能分析结果失败：{type(e).__name__}: {e}", file=sys.stderr)
+
+
+def _file_trans(akId, akSecret, appKey, fileLink, storage_format, vad, id_strategy,
+                on_progress, callback_url, stream, peaks=False, dedup=None, profiler=None):
     if not all([akId, akSecret, appKey, fileLink]):
         raise ValueError("缺少必要参数")
+    load_env()
+    if dedup is None:
+        dedup = os.getenv(DEDUP_ENV, '').lower() in ('1', 'true', 'yes')
+
+    # 去重：提交前解码一次音频算指纹（需要时顺带做语音区间/波形峰值分析），
+    # 命中之前识别过的相同音频时直接复用其结果
+    fingerprint = audio_analysis = None
+    if dedup:
+        from app.api.python.fingerprint import Fingerprinter
+        fingerprinter = Fingerprinter()
+        audio_analysis = start_audio_analysis(fileLink, vad, peaks, fingerprinter)
+        audio_analysis.result()
+        # 静音或解码失败时没有可靠指纹，照常识别且不登记
+        fingerprint = fingerprinter.finish()
+        reused = _reuse_duplicate(fileLink, fingerprint) if fingerprint is not None else None
+        if reused is not None:
+            speech_map, pyramid = audio_analysis.result()
+            if storage_format is not None:
+                from app.api.python.storage import ResultStorage
+                ResultStorage(id_strategy=id_strategy).save(reused, format=storage_format, speech_map=speech_map,
+                                                            peaks=pyramid, profiler=profiler)
+            return reused
+
+    AcsClient, CommonRequest = import_runtime()
+    from app.api.python.resilience import get_caller, RejectedError, CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS
+    if callback_url:
+        from app.api.python.callbacks import registry as callback_registry
+    if stream:
+        from itertools import islice
+        from app.api.python.rpc import signed_rpc_url, fetch_to_spool
+        from app.api.python.streamjson import read_fields, iter_items, StreamedArray
     
-    # 地域ID，固定值。
-    REGION_ID = "cn-shanghai"
+    # 接入点（地域 + 域名）由 resilience.py 按 NLS_FILETRANS_ENDPOINTS 配置和近期延迟选择
     PRODUCT = "nls-filetrans"
-    DOMAIN = "filetrans.cn-shanghai.aliyuncs.com"
     API_VERSION = "2018-08-17"
     POST_REQUEST_ACTION = "SubmitTask"
     GET_REQUEST_ACTION = "GetTaskResult"
@@ -51,16 +168,25 @@ def fileTrans(akId, akSecret, appKey, fileLink, storage_format='json'):
     STATUS_RUNNING = "RUNNING"
     STATUS_QUEUEING = "QUEUEING"
     
-    # 创建AcsClient实例
-    client = AcsClient(akId, akSecret, REGION_ID)
-    
-    # 提交录音文件识别请求
-    postRequest = CommonRequest()
-    postRequest.set_domain(DOMAIN)
-    postRequest.set_version(API_VERSION)
-    postRequest.set_product(PRODUCT)
-    postRequest.set_action_name(POST_REQUEST_ACTION)
-    postRequest.set_method('POST')
+    # 每个地域一个AcsClient；重试、超时和故障转移由调用层统一处理，关闭SDK自带重试
+    clients = {}
+
+    def client_for(endpoint):
+        if endpoint.region_id not in clients:
+            clients[endpoint.region_id] = AcsClient(akId, akSecret, endpoint.region_id, auto_retry=False)
+        return clients[endpoint.region_id]
+
+    def make_request(endpoint, action, method):
+        request = CommonRequest()
+        request.set_domain(endpoint.domain)
+        request.set_version(API_VERSION)
+        request.set_product(PRODUCT)
+        request.set_action_name(action)
+        request.set_method(method)
+        # SDK 的超时单位是秒（直接传给 requests）
+        request.set_connect_timeout(CONNECT_TIMEOUT_SECONDS)
+        request.set_read_timeout(READ_TIMEOUT_SECONDS)
+        return request
 
     # 配置任务参数
     task_config = {
@@ -75,78 +201,198 @@ def fileTrans(akId, akSecret, appKey, fileLink, storage_format='json'):
         "enable_inverse_text_normalization": True,  # 开启ITN
         "enable_sample_rate_adaptive": True  # 开启自动降采样
     }
+    if callback_url:
+        task_config["enable_callback"] = True  # 开启识别完成回调
+        task_config["callback_url"] = callback_url
     
     task = json.dumps(task_config)
-    postRequest.add_body_params(KEY_TASK, task)
+
+    def submit(endpoint):
+        postRequest = make_request(endpoint, POST_REQUEST_ACTION, 'POST')
+        postRequest.add_body_params(KEY_TASK, task)
+        postResponse = json.loads(client_for(endpoint).do_action_with_exception(postRequest))
+        if postResponse[KEY_STATUS_TEXT] != STATUS_SUCCESS:
+            raise RejectedError(f"录音文件识别请求失败：{postResponse[KEY_STATUS_TEXT]}")
+        return postResponse
     
     # 提交任务
+    caller = get_caller()
     try:
-        postResponse = client.do_action_with_exception(postRequest)
-        postResponse = json.loads(postResponse)
-        
-        statusText = postResponse[KEY_STATUS_TEXT]
-        if statusText != STATUS_SUCCESS:
-            raise Exception("录音文件识别请求失败")
+        endpoint, postResponse = caller.submit(POST_REQUEST_ACTION, submit)
         taskId = postResponse[KEY_TASK_ID]
+        if profiler is not None:
+            profiler.task_id = taskId
     except Exception as e:
         raise Exception(f"提交任务异常：{str(e)}")
 
-    # 查询结果
-    getRequest = CommonRequest()
-    getRequest.set_domain(DOMAIN)
-    getRequest.set_version(API_VERSION)
-    getRequest.set_product(PRODUCT)
-    getRequest.set_action_name(GET_REQUEST_ACTION)
-    getRequest.set_method('GET')
-    getRequest.add_query_param(KEY_TASK_ID, taskId)
+    # 识别在服务端进行期间，本地解码音频做语音区间/波形峰值分析
+    if audio_analysis is None and (vad or peaks):
+        audio_analysis = start_audio_analysis(fileLink, vad, peaks)
+
+    # 查询结果（只能在受理任务的接入点上查询）
+    def query(endpoint):
+        if stream:
+            # 响应体直接落盘，结果数组留待后续按需流式读取
+            return fetch_to_spool(
+                signed_rpc_url(akId, akSecret, endpoint.domain, endpoint.region_id, API_VERSION,
+                               GET_REQUEST_ACTION, {KEY_TASK_ID: taskId}),
+                timeout=(CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS))
+        getRequest = make_request(endpoint, GET_REQUEST_ACTION, 'GET')
+        getRequest.add_query_param(KEY_TASK_ID, taskId)
+        return json.loads(client_for(endpoint).do_action_with_exception(getRequest))
 
     # 轮询获取结果
-    results = []  # 存储所有识别结果
+    seen_sentences = 0  # 已推送给 on_progress 的句子数
+    # 只在排队阶段对冲：运行中的响应带中间结果，会一直增长到最终结果的大小
+    hedge = True
     retry_count = 0
     max_retries = 3  # 最大重试次数
     
     while True:
+        if callback_url:
+            # 回调模式下先等待推送，收到或超时后都查询一次；回调接口无鉴权，
+            # 回调只用来提前唤醒，结果一律从识别服务取回
+            callback_registry.wait(taskId, CALLBACK_FALLBACK_POLL_SECONDS)
         try:
-            getResponse = client.do_action_with_exception(getRequest)
-            getResponse = json.loads(getResponse)
-            
-            statusText = getResponse[KEY_STATUS_TEXT]
-            
-            if statusText == STATUS_RUNNING or statusText == STATUS_QUEUEING:
-                time.sleep(10)
-                continue
-            elif statusText == STATUS_SUCCESS:
-                break
+            # 超时、对冲和退避重试在调用层内完成，这里失败即为多次重试后仍失败
+            getResponse = caller.query(endpoint, GET_REQUEST_ACTION, query, hedge=hedge)
+            if stream:
+                statusText = read_fields(getResponse, (KEY_STATUS_TEXT,))[KEY_STATUS_TEXT]
             else:
-                if retry_count < max_retries:
-                    retry_count += 1
-                    time.sleep(3)
-                    continue
-                raise Exception(f"识别失败，状态：{statusText}")
-                
+                statusText = getResponse[KEY_STATUS_TEXT]
+            hedge = statusText == STATUS_QUEUEING
         except Exception as e:
+            raise Exception(f"查询结果异常：{str(e)}")
+            
+        if statusText == STATUS_RUNNING or statusText == STATUS_QUEUEING:
+            # 推送运行中已识别出的新句子
+            if on_progress is not None:
+                if stream:
+                    getResponse.seek(0)
+                    sentences = list(islice(iter_items(getResponse, (KEY_RESULT, "Sentences")),
+                                            seen_sentences, None))
+                else:
+                    sentences = ((getResponse.get(KEY_RESULT) or {}).get("Sentences") or [])[seen_sentences:]
+                if sentences:
+                    on_progress(sentences)
+                    seen_sentences += len(sentences)
+            if not callback_url:
+                time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+        elif statusText == STATUS_SUCCESS:
+            break
+        else:
             if retry_count < max_retries:
                 retry_count += 1
                 time.sleep(3)
                 continue
-            raise Exception(f"查询结果异常：{str(e)}")
+            raise Exception(f"识别失败，状态：{statusText}")
 
     # 保存结果
+    if stream and not isinstance(getResponse, dict):
+        sentences = StreamedArray(getResponse, (KEY_RESULT, "Sentences"))
+        words = StreamedArray(getResponse, (KEY_RESULT, "Words"))
+    else:
+        sentences = getResponse.get("Result", {}).get("Sentences", [])
+        words = getResponse.get("Result", {}).get("Words", [])
     final_result = {
         "status": statusText,
-        "results": getResponse.get("Result", {}).get("Sentences", []),
-        "words": getResponse.get("Result", {}).get("Words", []),
+        "results": sentences,
+        "words": words,
         "taskId": taskId,
         "audio_url": fileLink,
         "timestamp": datetime.now().isoformat()
     }
     
+    # 可选：等待后台音频分析完成，语音区间表和波形峰值随结果一起保存
+    speech_map = pyramid = None
+    if audio_analysis is not None:
+        speech_map, pyramid = audio_analysis.result()
+
+    if storage_format is None:
+        return final_result
+
     # 保存结果
-    storage = ResultStorage()
-    saved_path = storage.save(final_result, format=storage_format)
+    from app.api.python.storage import ResultStorage
+    storage = ResultStorage(id_strategy=id_strategy)
+    saved_path = storage.save(final_result, format=storage_format, speech_map=speech_map,
+                              peaks=pyramid, profiler=profiler)
+    if fingerprint is not None:
+        from app.api.python.fingerprint import get_index
+        signature, duration, windows = fingerprint
+        get_index().add(signature, duration, taskId, fileLink, windows)
     
     return final_result
 
+def _reuse_duplicate(fileLink, fingerprint):
+    """指纹逐窗口一致且原结果仍在时，按原结果构造本次的返回值，否则返回None
+
+    整体相似但有窗口不一致的是改过的音频，不复用
+    """
+    from app.api.python.fingerprint import get_index
+    match = get_index().lookup(*fingerprint)
+    if match is None:
+        return None
+    if match['changed'] is None:
+        return None
+    if match['changed']:
+        edits = ' '.join(f"--edit {begin:g}-{end:g}" for begin, end in match['changed'])
+        print(f"音频与任务 {match['task_id']} 相似（{match['similarity']:.2f}）但有改动，不复用其结果；"
+              f"只需重新识别改动部分时可用：python retranscribe.py {match['task_id']} --audio <音频> {edits}",
+              file=sys.stderr)
+        return None
+    from app.api.python.storage import ResultStorage
+    previous = ResultStorage().load(match['task_id'])
+    if previous is None:
+        return None
+    # 保存的JSON中 words 已是处理后的格式，还原为接口返回的字段
+    words = [{"Word": w['word'], "BeginTime": w['begin_time'], "EndTime": w['end_time']}
+             for w in previous.get('words', [])]
+    return {
+        "status": previous.get('status', "SUCCESS"),
+        "results": previous.get('results', []),
+        "words": words,
+        "taskId": match['task_id'],
+        "audio_url": fileLink,
+        "timestamp": datetime.now().isoformat(),
+        "reused_from": {"task_id": match['task_id'], "audio_url": match['audio_url'],
+                        "similarity": match['similarity']}
+    }
+
+
+def start_audio_analysis(fileLink, vad, peaks, fingerprinter=None):
+    """在后台线程中解码音频一次，返回 Future，结果为 (语音区间表或None, PeakPyramid或None)
+
+    fingerprinter 为可选的 Fingerprinter（见 fingerprint.py），在同一次解码中累计
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.api.python.audio import analyze
+
+    def run():
+        energy = pyramid = None
+        consumers = []
+        if vad:
+            from app.api.python.vad import FrameEnergy
+            energy = FrameEnergy()
+            consumers.append(energy)
+        if peaks:
+            from app.api.python.peaks import PeakPyramid
+            pyramid = PeakPyramid()
+            consumers.append(pyramid)
+        if fingerprinter is not None:
+            consumers.append(fingerprinter)
+        analyze(fileLink, consumers)
+        speech_map = None
+        if energy is not None:
+            from app.api.python.vad import energy_to_intervals
+            speech_map = energy_to_intervals(energy.finish())
+        return speech_map, pyramid
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-analysis')
+    future = executor.submit(run)
+    executor.shutdown(wait=False)
+    return future
+
 def format_time(milliseconds):
     """将毫秒转换为可读时间格式"""
     seconds = milliseconds / 1000
@@ -157,16 +403,63 @@ def format_time(milliseconds):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='语音识别服务')
-    parser.add_argument('--audio_url', required=True, help='音频文件URL')
-    parser.add_argument('--format', default='json', help='输出格式 (json/csv)')
+    parser.add_argument('--audio_url', help='音频文件URL')
+    parser.add_argument('--audio_file', help='本地音频文件：先并行分片上传到OSS，再用签名地址识别（见 upload.py）')
+    parser.add_argument('--format', default='json', help='输出格式 (json/csv/srt/vtt/tsv/supabase/postgres/textindex/vocab，多个用逗号分隔)')
+    parser.add_argument('--vad', action='store_true', help='同时计算并保存语音/静音区间表')
+    parser.add_argument('--peaks', action='store_true', help='同时生成并保存波形峰值金字塔（.peaks）')
+    parser.add_argument('--profile', nargs='?', const='all', choices=['all', 'cpu', 'mem'],
+                        help='对本任务做性能分析（cProfile/tracemalloc），产物与结果保存在一起')
+    parser.add_argument('--dedup', action='store_true', default=None,
+                        help='提交前计算声学指纹，与之前识别过的音频相同时直接复用结果')
+    parser.add_argument('--stream', action='store_true', help='流式解析识别结果，适合数小时的长音频')
+    parser.add_argument('--callback_url', help='识别完成回调地址（开启回调模式）')
+    parser.add_argument('--callback_listen', help='在本进程内监听回调的地址，如 0.0.0.0:9000')
+    parser.add_argument('--id_strategy', default='random', choices=ID_STRATEGIES,
+                        help='行ID生成策略，deterministic 可重复处理后 upsert')
+    parser.add_argument('--import-profile', dest='import_profile', action='store_true',
+                        help='报告冷启动各模块的导入耗时（-X importtime）')
+    parser.add_argument('--import-budget', dest='import_budget', type=float,
+                        help='冷启动耗时预算（毫秒），与 --import-profile 一起使用，超出时以非零状态退出')
+    parser.add_argument('--import-check', dest='import_check', action='store_true',
+                        help=argparse.SUPPRESS)
     args = parser.parse_args()
 
+    # 只加载识别任务路径上的模块后退出，供 --import-profile 测量
+    if args.import_check:
+        import_job_path()
+        sys.exit(0)
+
+    if args.import_profile:
+        from app.api.python.import_profile import profile_startup, print_report
+        report = profile_startup(os.path.abspath(__file__), required_modules=JOB_PATH_MODULES)
+        print_report(report, budget_ms=args.import_budget)
+        sys.exit(1 if args.import_budget and report['wall_ms'] > args.import_budget else 0)
+
+    if not args.audio_url and not args.audio_file:
+        parser.error('缺少 --audio_url 或 --audio_file')
+
+    load_env()
     accessKeyId = os.getenv('ALIYUN_AK_ID')
     accessKeySecret = os.getenv('ALIYUN_AK_SECRET')
     appKey = os.getenv('NLS_APP_KEY')
     
+    # 回调需要由本进程接收
+    if args.callback_url and args.callback_listen:
+        from app.api.python.callbacks import start_receiver
+        host, port = args.callback_listen.rsplit(':', 1)
+        start_receiver(host, int(port))
+
+    if args.audio_file:
+        from app.api.python.upload import upload_file
+        _, args.audio_url = upload_file(args.audio_file)
+
     # 执行录音文件识别
-    result = fileTrans(accessKeyId, accessKeySecret, appKey, args.audio_url, args.format)
+    result = fileTrans(accessKeyId, accessKeySecret, appKey, args.audio_url, args.format,
+                       vad=args.vad, id_strategy=args.id_strategy, callback_url=args.callback_url, stream=args.stream,
+                       profile=args.profile, peaks=args.peaks, dedup=args.dedup)
     
-    # 直接输出JSON结果供Node.js解析
-    print(json.dumps(result, ensure_ascii=False))
\ No newline at end of file
+    # 直接输出JSON结果供Node.js解析（流式结果逐条写出）
+    from app.api.python.streamjson import dump
+    dump(result, sys.stdout)
+    print()
\ No newline at end of file
@@ -1,26 +1,128 @@
 from pydantic import BaseModel
-from fastapi import HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
 
+from app.api.python.speech import fileTrans, load_env
+from app.api.python.jobs import JobStore, format_sse
+from app.api.python.callbacks import handle_callback
+from app.api.python.resilience import metrics_snapshot
+from app.api.python.storage import ResultStorage
+
+router = APIRouter()
+load_env()
+
+# 识别任务在线程池中运行，请求本身只负责入队，立即返回
+MAX_CONCURRENT_JOBS = int(os.getenv('SPEECH_MAX_CONCURRENT_JOBS', '4'))
+# SSE 无新事件时发送心跳的间隔（秒），避免代理断开空闲连接
+SSE_KEEPALIVE_SECONDS = 15
+# 识别完成回调地址，需能从识别服务访问到本服务的 /callback 路由；为空时使用轮询
+CALLBACK_URL = os.getenv('SPEECH_CALLBACK_URL')
+
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS)
+job_store = JobStore(os.getenv('SPEECH_JOB_DB', 'results/jobs.db'))
+
+
 class SpeechRequest(BaseModel):
     audioUrl: str  # 必须的音频URL参数
     storageFormat: str = 'json'  # 可选存储格式
+    profile: bool = False  # 对本任务做性能分析（也可用环境变量 SPEECH_PROFILE 全局开启）
 
-@router.post("/")
-async def handle_speech_task(request: SpeechRequest):
-    # 验证音频URL格式
-    if not request.audioUrl.startswith('https://'):
-        raise HTTPException(400, "音频链接必须使用HTTPS协议")
-    
-    # 调用核心逻辑
+
+def _run_job(job_id, audio_url, storage_format, profile=None):
+    """在工作线程中执行识别，并把进度写入任务表"""
+    job_store.mark_processing(job_id)
     try:
         result = fileTrans(
             akId=os.getenv('ALIYUN_AK_ID'),
             akSecret=os.getenv('ALIYUN_AK_SECRET'),
             appKey=os.getenv('NLS_APP_KEY'),
-            audio_url=request.audioUrl,  # 使用验证后的参数
-            storage_format=request.storageFormat
+            fileLink=audio_url,
+            storage_format=storage_format,
+            on_progress=lambda sentences: job_store.add_sentences(job_id, sentences),
+            callback_url=CALLBACK_URL,
+            profile=profile
         )
-        return result
+        job_store.complete(job_id, result)
     except Exception as e:
-        raise HTTPException(500, detail=str(e)) 
\ No newline at end of file
+        job_store.fail(job_id, str(e))
+
+
+@router.post("/", status_code=202)
+async def handle_speech_task(request: SpeechRequest, http_request: Request):
+    # 验证音频URL格式
+    if not request.audioUrl.startswith('https://'):
+        raise HTTPException(400, "音频链接必须使用HTTPS协议")
+    # 存储格式在入队前校验，否则要等识别完成后保存时才失败
+    try:
+        ResultStorage.check_formats(request.storageFormat)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    # 入队后立即返回任务ID，识别结果通过状态接口或SSE获取
+    job_id = job_store.create(request.audioUrl, request.storageFormat)
+    executor.submit(_run_job, job_id, request.audioUrl, request.storageFormat,
+                    True if request.profile else None)
+    return JSONResponse(
+        status_code=202,
+        content={
+            'jobId': job_id,
+            'status': job_store.get(job_id)['status']
+        },
+        # 指向任务状态接口，按路由挂载位置解析（如 /api/python/speech/{job_id}）
+        headers={'Location': http_request.url_for('get_speech_task', job_id=job_id).path}
+    )
+
+
+@router.post("/callback")
+async def receive_filetrans_callback(payload: dict):
+    # 识别服务完成回调，直接唤醒等待该任务的 fileTrans
+    if not handle_callback(payload):
+        raise HTTPException(400, "回调缺少TaskId")
+    return {'status': 'ok'}
+
+
+@router.get("/metrics/asr")
+async def get_asr_metrics():
+    # 各识别服务接入点的调用统计、延迟分位数和熔断状态
+    return {'endpoints': metrics_snapshot()}
+
+
+@router.get("/{job_id}")
+async def get_speech_task(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "任务不存在")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def stream_speech_task(job_id: str):
+    if job_store.get(job_id) is None:
+        raise HTTPException(404, "任务不存在")
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    unsubscribe = job_store.subscribe(job_id, lambda: loop.call_soon_threadsafe(changed.set))
+
+    async def event_stream():
+        cursor = 0
+        try:
+            while True:
+                changed.clear()
+                events, cursor, finished = job_store.events_since(job_id, cursor)
+                for event, data in events:
+                    yield format_sse(event, data)
+                if finished:
+                    break
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe()
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
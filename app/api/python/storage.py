@@ -1,48 +1,165 @@
-import json
-import csv
+import io
 import os
+from array import array
 from datetime import datetime
 from pathlib import Path
-import requests
-import uuid
+
+import numpy as np
+
+from app.api.python.export import EXPORT_SUFFIXES, export
+from app.api.python.ids import IdGenerator
+from app.api.python.postprocess import postprocess, postprocess_columns, sentence_fields
+from app.api.python.profiling import PSTATS_SUFFIX, REPORT_SUFFIX
+from app.api.python.resultstore import ResultStore, entry_name, is_entry_name
+from app.api.python.streamjson import dump, LazyArray
+
+# 流式结果按块生成ID，避免一次构造整列字符串
+_ID_CHUNK = 65536
+# 不处理 removed_rows 的存储后端：supabase 路由只做 upsert，被替换的旧行会留在表中。
+# 其余后端都能整份替换：postgres 在同一事务内删除，文件格式整份重写，
+# textindex 同一 speech_id 以最新的段为准，vocab 按章节替换计数
+NO_REMOVAL_FORMATS = ('supabase',)
+
+
+class _ProcessedRows(LazyArray):
+    """由原始数组按需逐行生成的处理后行；make_rows(原始元素迭代器) 产出处理后的行，可重复迭代
+
+    columns 为导出可直接使用的整列数据（如句子的 begin_time/end_time），
+    sentence_positions 为每个词所属句子的下标（仅词）
+    """
+
+    def __init__(self, source, length, make_rows, columns=None, sentence_positions=None):
+        self._source = source
+        self._length = length
+        self._make_rows = make_rows
+        self.columns = columns or {}
+        self.sentence_positions = sentence_positions
+
+    def __iter__(self):
+        return self._make_rows(iter(self._source))
+
+    def __len__(self):
+        return self._length
+
+
+def _time_columns(items):
+    """一次遍历取出 BeginTime/EndTime 两列（int64），不保留元素本身"""
+    begin, end = array('q'), array('q')
+    for item in items:
+        begin.append(item['BeginTime'])
+        end.append(item['EndTime'])
+    return np.frombuffer(begin, dtype=np.int64), np.frombuffer(end, dtype=np.int64)
+
+
+def _id_column(ids, kind, count):
+    column = np.empty(count, dtype='S36')
+    for start in range(0, count, _ID_CHUNK):
+        n = min(_ID_CHUNK, count - start)
+        column[start:start + n] = ids.batch(kind, n, start=start)
+    return column
 
 class ResultStorage:
-    def __init__(self, output_dir="results"):
+    def __init__(self, output_dir="results", id_strategy='random'):
         self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
+        # 按日期和 task_id 前缀分片保存，并登记到 index.db，见 resultstore.py
+        self.store = ResultStore(self.output_dir)
+        # ID生成策略，见 ids.py；deterministic 可让重复处理同一任务时 upsert 而非重复插入
+        self.id_strategy = id_strategy
         
-    def save(self, result, format='json'):
-        """保存识别结果，包含词级别时间戳"""
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        task_id = result.get('taskId', 'unknown')
-        filename = f"{timestamp}_{task_id[:8]}"
+    def save(self, result, format='json', speech_map=None, peaks=None, profiler=None):
+        """保存识别结果，包含词级别时间戳
+
+        format 可以是单个格式，也可以是逗号分隔或列表形式的多个格式（如 "json,srt,vtt"），
+        结果只处理一次，所有文件格式在同一次遍历中写出，各格式中的ID一致；
+        单个格式时返回该格式的保存结果，多个格式时返回 {格式: 保存结果}
+        speech_map 为可选的语音区间表（见 vad.py），会保存为同名的 .vad.npy 文件
+        peaks 为可选的 PeakPyramid（见 peaks.py），会保存为同名的 .peaks 文件
+        profiler 为正在运行的 JobProfiler（见 profiling.py），保存完成后停止并写出同名的
+        .prof / .profile.txt
+        """
+        formats = self._parse_formats(format)
+
+        # 生成文件名（时间戳 + 完整task_id）
+        filename = entry_name(result.get('taskId'))
         
         # 处理结果数据
         processed_result = self._process_result(result)
         
+        if speech_map is not None:
+            self._save_speech_map(speech_map, filename)
+        if peaks is not None:
+            self._save_peaks(peaks, filename)
+        
+        saved = self._save_processed(processed_result, filename, formats)
+        if profiler is not None:
+            self.save_profile(profiler, filename)
+        return saved[formats[0]] if len(formats) == 1 else saved
+
+    def save_processed(self, processed_result, format='json'):
+        """保存已处理过的结果（不重新生成ID），如 retranscribe.py 拼接后的结果；返回值同 save
+
+        结果带 removed_rows 时不能写入 NO_REMOVAL_FORMATS 中的后端
+        """
+        formats = self._parse_formats(format)
+        if processed_result.get('removed_rows'):
+            self.check_removal_formats(formats)
+        saved = self._save_processed(processed_result, entry_name(processed_result.get('taskId')), formats)
+        return saved[formats[0]] if len(formats) == 1 else saved
+
+    @staticmethod
+    def check_formats(format):
+        """检查存储格式都受支持，返回格式列表，否则抛出 ValueError"""
+        return ResultStorage._parse_formats(format)
+
+    @staticmethod
+    def check_removal_formats(format):
+        """检查存储格式都能删除 removed_rows 中的行，否则抛出 ValueError"""
+        formats = ResultStorage._parse_formats(format)
+        unsupported = [f for f in formats if f in NO_REMOVAL_FORMATS]
+        if unsupported:
+            raise ValueError(f"{', '.join(unsupported)} 不会删除被替换的句子和词，"
+                             f"拼接后的结果请写入 postgres 或文件格式")
+        return formats
+
+    @staticmethod
+    def _parse_formats(format):
+        formats = [f.strip() for f in format.split(',')] if isinstance(format, str) else list(format)
+        unknown = [f for f in formats if f not in EXPORT_SUFFIXES and f not in ('supabase', 'postgres', 'textindex', 'vocab')]
+        if unknown or not formats:
+            raise ValueError(f"不支持的格式，请选择 {', '.join(EXPORT_SUFFIXES)}, supabase, postgres, textindex 或 vocab")
+        return formats
+
+    def _save_processed(self, processed_result, filename, formats):
         # 保存文件
-        if format == 'json':
-            return self._save_json(processed_result, filename)
-        elif format == 'csv':
-            return self._save_detailed_csv(processed_result, filename)
-        elif format == 'supabase':
-            return self._save_to_supabase(processed_result)
-        else:
-            raise ValueError("不支持的格式，请选择 json, csv 或 supabase")
+        saved = self._export(processed_result, filename, [f for f in formats if f in EXPORT_SUFFIXES])
+        if 'supabase' in formats:
+            saved['supabase'] = self._save_to_supabase(processed_result)
+        if 'postgres' in formats:
+            saved['postgres'] = self._save_to_postgres(processed_result)
+        if 'textindex' in formats:
+            saved['textindex'] = self._save_to_textindex(processed_result)
+        if 'vocab' in formats:
+            saved['vocab'] = self._save_to_vocab(processed_result)
+        return saved
     
     def _process_result(self, result):
         """处理结果，添加UUID和句子关联"""
+        raw_sentences = result.get('results', [])
+        raw_words = result.get('words', [])
+        ids = IdGenerator(self.id_strategy, result.get('taskId'))
+        if isinstance(raw_sentences, LazyArray) or isinstance(raw_words, LazyArray):
+            return self._process_streamed(result, ids)
+        sentence_ids = ids.batch('sentence', len(raw_sentences))
+        speech_ids = ids.batch('speech', len(raw_sentences))  # 为每个speech记录生成ID
+        word_ids = ids.batch('word', len(raw_words))
+
         # 为每个句子生成UUID
         sentences = []
-        sentence_map = {}  # 用于存储时间范围到句子ID的映射
-        
-        for sentence in result.get('results', []):
-            sentence_id = str(uuid.uuid4())
+        for sentence, sentence_id, speech_id in zip(raw_sentences, sentence_ids, speech_ids):
             sentence_data = {
                 **sentence,
                 'id': sentence_id,
-                'speech_id': str(uuid.uuid4()),  # 为每个speech记录生成ID
+                'speech_id': speech_id,
                 'text_content': sentence['Text'],
                 'begin_time': sentence['BeginTime'],
                 'end_time': sentence['EndTime'],
@@ -50,36 +167,28 @@ class ResultStorage:
                 'emotion_value': sentence.get('EmotionValue')
             }
             sentences.append(sentence_data)
-            # 记录这个句子的时间范围
-            sentence_map[(sentence['BeginTime'], sentence['EndTime'])] = sentence_id
 
-        # 为每个词找到对应的句子ID
         words = []
-        for word in result.get('words', []):
-            word_time = word['BeginTime']
-            # 找到这个词属于哪个句子
-            sentence_id = None
-            for (sent_start, sent_end), sent_id in sentence_map.items():
-                if sent_start <= word_time <= sent_end:
-                    sentence_id = sent_id
-                    break
-            
+        for word, word_id in zip(raw_words, word_ids):
             word_data = {
-                'id': str(uuid.uuid4()),
-                'sentence_id': sentence_id,
+                'id': word_id,
+                'sentence_id': None,
                 'word': word['Word'].strip(),
                 'begin_time': word['BeginTime'],
                 'end_time': word['EndTime']
             }
             words.append(word_data)
 
+        # 整列修正时间戳、为每个词找到对应的句子ID并统计句子语速
+        postprocess(sentences, words)
+
         # 构建最终结果
         processed_result = {
             **result,
             'sentences': sentences,
             'words': words,
             'speech_results': [{
-                'id': str(uuid.uuid4()),
+                'id': ids.one('speech_result'),
                 'task_id': result.get('taskId'),
                 'audio_url': result.get('audio_url'),
                 'user_id': None,  # 这个需要从认证上下文中获取
@@ -89,65 +198,141 @@ class ResultStorage:
         
         return processed_result
             
+    def _process_streamed(self, result, ids):
+        """流式结果（如 --stream 的 StreamedArray）：只把时间戳读成列做后处理，句子和词
+        是按需从原始数组逐行生成的 LazyArray，导出和入库边读边写，行内容与 _process_result 相同
+        """
+        raw_sentences = result.get('results', [])
+        raw_words = result.get('words', [])
+        sent_begin, sent_end = _time_columns(raw_sentences)
+        word_begin, word_end = _time_columns(raw_words)
+        columns = postprocess_columns(sent_begin, sent_end, word_begin, word_end)
+        sentence_ids = _id_column(ids, 'sentence', sent_begin.size)
+        speech_ids = _id_column(ids, 'speech', sent_begin.size)
+        word_ids = _id_column(ids, 'word', word_begin.size)
+
+        def make_sentences(items):
+            for sentence, sentence_id, speech_id, fields in zip(items, sentence_ids, speech_ids,
+                                                                sentence_fields(columns)):
+                row = {
+                    **sentence,
+                    'id': sentence_id.decode(),
+                    'speech_id': speech_id.decode(),
+                    'text_content': sentence['Text'],
+                    'begin_time': sentence['BeginTime'],
+                    'end_time': sentence['EndTime'],
+                    'speech_rate': sentence.get('SpeechRate'),
+                    'emotion_value': sentence.get('EmotionValue')
+                }
+                row.update(fields)
+                yield row
+
+        def make_words(items):
+            for word, word_id, end_time, owner in zip(items, word_ids, columns['word_end'],
+                                                      columns['word_sentence']):
+                yield {
+                    'id': word_id.decode(),
+                    'sentence_id': sentence_ids[owner].decode() if owner >= 0 else None,
+                    'word': word['Word'].strip(),
+                    'begin_time': word['BeginTime'],
+                    'end_time': int(end_time)
+                }
+
+        return {
+            **result,
+            'sentences': _ProcessedRows(raw_sentences, sent_begin.size, make_sentences,
+                                        columns={'begin_time': sent_begin, 'end_time': columns['sentence_end']}),
+            'words': _ProcessedRows(raw_words, word_begin.size, make_words,
+                                    sentence_positions=columns['word_sentence']),
+            'speech_results': [{
+                'id': ids.one('speech_result'),
+                'task_id': result.get('taskId'),
+                'audio_url': result.get('audio_url'),
+                'user_id': None,  # 这个需要从认证上下文中获取
+                'created_at': datetime.now().isoformat()
+            }]
+        }
+
+    def save_profile(self, profiler, filename):
+        """停止分析器并把 pstats 和报告写到该结果的分片目录；filename 不是条目名时按其生成一个"""
+        if not is_entry_name(filename):
+            filename = entry_name(filename)
+        paths = profiler.dump(self.store.path_for(filename, PSTATS_SUFFIX),
+                              self.store.path_for(filename, REPORT_SUFFIX))
+        for filepath in paths:
+            self.store.register(filepath)
+        return paths
+
+    def load(self, task_id):
+        """按 task_id 读取最近一次保存的JSON结果（走索引，不扫描目录），找不到返回None"""
+        return self.store.load(task_id)
+            
+    def _export(self, data, filename, formats):
+        """一次遍历写出多种文件格式并登记到索引，返回 {格式: 文件路径}"""
+        if not formats:
+            return {}
+        targets = {fmt: self.store.path_for(filename, EXPORT_SUFFIXES[fmt]) for fmt in formats}
+        export(data, targets)
+        for filepath in targets.values():
+            self.store.register(filepath)
+        return targets
+
     def _save_json(self, data, filename):
-        filepath = self.output_dir / f"{filename}.json"
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        return self._export(data, filename, ['json'])['json']
+            
+    def _save_speech_map(self, speech_map, filename):
+        # numpy 只在需要语音区间表时才加载
+        from app.api.python.vad import save_speech_map
+        filepath = save_speech_map(speech_map, self.store.path_for(filename, '.vad.npy'))
+        self.store.register(filepath)
         return filepath
             
-    def _save_detailed_csv(self, data, filename):
-        filepath = self.output_dir / f"{filename}.csv"
-        
-        with open(filepath, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            # 添加表头
-            writer.writerow([
-                "句子ID", "开始时间(ms)", "结束时间(ms)", "文本内容", 
-                "语速(字/分)", "情感值", "词ID", "词内容", "词开始时间", "词结束时间"
-            ])
+    def _save_peaks(self, pyramid, filename):
+        from app.api.python.peaks import save_pyramid
+        filepath = save_pyramid(pyramid, self.store.path_for(filename, '.peaks'))
+        self.store.register(filepath)
+        return filepath
             
-            # 写入数据
-            for sentence in data['sentences']:
-                # 获取属于这个句子的词
-                sentence_words = [w for w in data['words'] if w['sentence_id'] == sentence['id']]
-                
-                if sentence_words:
-                    for word in sentence_words:
-                        writer.writerow([
-                            sentence['id'],
-                            sentence['begin_time'],
-                            sentence['end_time'],
-                            sentence['text_content'],
-                            sentence.get('speech_rate', 'N/A'),
-                            sentence.get('emotion_value', 'N/A'),
-                            word['id'],
-                            word['word'],
-                            word['begin_time'],
-                            word['end_time']
-                        ])
-                else:
-                    # 如果句子没有对应的词，也要写入句子信息
-                    writer.writerow([
-                        sentence['id'],
-                        sentence['begin_time'],
-                        sentence['end_time'],
-                        sentence['text_content'],
-                        sentence.get('speech_rate', 'N/A'),
-                        sentence.get('emotion_value', 'N/A'),
-                        '', '', '', ''
-                    ])
-        
+    def _save_clips(self, data, filename, source=None, **options):
+        """逐句切出音频片段保存为同名的 .clips 文件，source 默认为结果中的 audio_url（见 clips.py）"""
+        from app.api.python.clips import extract_clips, CLIPS_SUFFIX
+        source = source or data.get('audio_url')
+        if not source:
+            raise ValueError("结果中没有 audio_url，无法切分句子音频")
+        filepath = extract_clips(source, data['sentences'], self.store.path_for(filename, CLIPS_SUFFIX), **options)
+        self.store.register(filepath)
         return filepath
+            
+    def _save_detailed_csv(self, data, filename):
+        return self._export(data, filename, ['csv'])['csv']
 
     def _save_to_supabase(self, data):
         """通过API路由保存到Supabase"""
+        import requests
         api_url = "http://localhost:3000/api/save-result"  # Next.js开发地址
         try:
+            body = io.StringIO()
+            dump(data, body)
             response = requests.post(
                 api_url,
-                json=data,
+                data=body.getvalue().encode('utf-8'),
                 headers={"Content-Type": "application/json"}
             )
             return response.json()
         except Exception as e:
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            return {"status": "error", "message": str(e)}
+
+    def _save_to_postgres(self, data):
+        """直连Postgres批量写入（COPY + 合并），连接串读取 SPEECH_RESULTS_DSN"""
+        from app.api.python.pgwriter import get_writer
+        return get_writer().write(data)
+
+    def _save_to_textindex(self, data):
+        """追加到全文倒排索引（目录读取 SPEECH_TEXT_INDEX_DIR，默认 results/textindex）"""
+        from app.api.python.textindex import get_index, INDEX_DIR_ENV
+        return get_index(os.getenv(INDEX_DIR_ENV) or self.output_dir / 'textindex').add_result(data)
+
+    def _save_to_vocab(self, data):
+        """累加到词频索引（目录读取 SPEECH_VOCAB_DIR，默认 results/vocab），结果中的 book_id 为所属书籍"""
+        from app.api.python.vocab import get_index, VOCAB_DIR_ENV
+        return get_index(os.getenv(VOCAB_DIR_ENV) or self.output_dir / 'vocab').add_result(data)
@@ -0,0 +1,255 @@
+import codecs
+import json
+import threading
+
+_WHITESPACE = ' \t\r\n'
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class JsonStream:
+    """增量读取JSON：按结构逐层前进，只把单个元素完整解码到内存
+
+    iter_object/iter_array 每产出一次，调用方都必须用 value()、skip() 或再次
+    iter_object/iter_array 把对应的值消费掉，然后才能继续迭代
+    """
+
+    def __init__(self, fp, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        data = self._fp.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            chunk = self._utf8.decode(b'', final=True)
+        else:
+            chunk = self._utf8.decode(data) if isinstance(data, bytes) else data
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                raise ValueError("JSON意外结束")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"JSON格式错误：期望 {char!r}，位置 {self._pos}")
+        self._pos += 1
+
+    def value(self):
+        """完整解码当前位置的一个值（用于小的元素）"""
+        self._peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # 数字可能恰好被块边界截断（如 "1500" + ".5"），读到更多数据再确认
+            if not self._eof and isinstance(obj, (int, float)) and not isinstance(obj, bool):
+                following = self._buf[end:end + 1]
+                if not following or following in '.eE+-0123456789':
+                    self._fill()
+                    continue
+            self._pos = end
+            return obj
+
+    def iter_object(self):
+        """逐个产出对象的键，值留给调用方消费"""
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            char = self._peek()
+            self._pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f"JSON格式错误：对象中出现 {char!r}")
+
+    def iter_array(self):
+        """逐个产出数组元素的位置，元素留给调用方消费"""
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self._peek()
+            self._pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"JSON格式错误：数组中出现 {char!r}")
+
+    def skip(self):
+        """跳过当前值；对象按键、数组按元素逐个跳过，不会整体载入内存
+
+        数组元素（如一个句子或词）很小，直接整体解码后丢弃，比逐字段跳过快得多
+        """
+        char = self._peek()
+        if char == '{':
+            for _ in self.iter_object():
+                self.skip()
+        elif char == '[':
+            for _ in self.iter_array():
+                self.value()
+        else:
+            self.value()
+
+
+def iter_items(fp, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """逐个产出 path（键的元组，如 ('Result', 'Sentences')）所指数组中的元素"""
+    stream = JsonStream(fp, chunk_size)
+    yield from _descend(stream, tuple(path))
+
+
+def _descend(stream, path):
+    if not path:
+        if stream._peek() != '[':
+            stream.skip()
+            return
+        for _ in stream.iter_array():
+            yield stream.value()
+        return
+    if stream._peek() != '{':
+        stream.skip()
+        return
+    for key in stream.iter_object():
+        if key == path[0]:
+            # 找到目标数组后不再读取后面的字段
+            yield from _descend(stream, path[1:])
+            return
+        stream.skip()
+
+
+def read_fields(fp, keys, chunk_size=DEFAULT_CHUNK_SIZE):
+    """读取顶层对象中的若干标量字段，其余（包括很大的数组）一律跳过"""
+    stream = JsonStream(fp, chunk_size)
+    found = {}
+    for key in stream.iter_object():
+        if key in keys and stream._peek() not in '{[':
+            found[key] = stream.value()
+        else:
+            stream.skip()
+    return found
+
+
+# 同一文件上的各个读取视图共用，seek + read 作为一步完成
+_read_lock = threading.Lock()
+
+
+class _FileView:
+    """共享文件上的独立读位置，同一文件上的多个迭代器可以交错读取（如 zip(results, words)）"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._pos = 0
+
+    def read(self, size=-1):
+        with _read_lock:
+            self._fp.seek(self._pos)
+            data = self._fp.read(size)
+        self._pos += len(data)
+        return data
+
+
+class LazyArray:
+    """按需产出元素、可重复迭代的数组；dump 会逐个元素写出它，不整体载入内存"""
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class StreamedArray(LazyArray):
+    """以文件为后端的惰性数组；每次迭代都从文件头重新流式读取，各次迭代互不影响"""
+
+    def __init__(self, fp, path):
+        self._fp = fp
+        self._path = tuple(path)
+        self._len = None
+
+    def __iter__(self):
+        return iter_items(_FileView(self._fp), self._path)
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+
+def _indent_block(text, indent):
+    return text.replace('\n', '\n' + indent)
+
+
+def dump(obj, fp, indent=None, ensure_ascii=False):
+    """写出JSON，其中的 LazyArray（如 StreamedArray）逐个元素写出而不整体载入内存
+
+    输出与 json.dump 相同；只处理顶层字典或顶层字典中一层的 LazyArray
+    """
+    if not isinstance(obj, dict):
+        json.dump(obj, fp, indent=indent, ensure_ascii=ensure_ascii)
+        return
+
+    def encode(value, depth):
+        text = json.dumps(value, indent=indent, ensure_ascii=ensure_ascii)
+        return _indent_block(text, ' ' * (indent * depth)) if indent is not None else text
+
+    if not obj:
+        fp.write('{}')
+        return
+    inner = ' ' * indent if indent is not None else ''
+    newline = '\n' if indent is not None else ''
+    item_sep = ',' + newline if indent is not None else ', '
+    fp.write('{' + newline)
+    for n, (key, value) in enumerate(obj.items()):
+        if n:
+            fp.write(item_sep)
+        fp.write(inner + json.dumps(str(key), ensure_ascii=ensure_ascii) + ': ')
+        if isinstance(value, LazyArray):
+            _dump_array(value, fp, indent, ensure_ascii, encode)
+        else:
+            fp.write(encode(value, 1))
+    fp.write(newline + '}')
+
+
+def _dump_array(array, fp, indent, ensure_ascii, encode):
+    items = iter(array)
+    first = next(items, None)
+    if first is None:
+        fp.write('[]')
+        return
+    if indent is None:
+        fp.write('[' + encode(first, 0))
+        for item in items:
+            fp.write(', ' + encode(item, 0))
+        fp.write(']')
+        return
+    pad = ' ' * (indent * 2)
+    fp.write('[\n' + pad + encode(first, 2))
+    for item in items:
+        fp.write(',\n' + pad + encode(item, 2))
+    fp.write('\n' + ' ' * indent + ']')
@@ -0,0 +1,632 @@
+# -*- coding: utf8 -*-
+# 识别结果全文倒排索引：以 ResultStorage._process_result 处理后的词为输入，
+# 倒排表记录 (speech_id, sentence_id, begin_time)，支持短语查询（"跳到这个词出现的每一处"）。
+#
+# 索引由若干不可变的段组成，每完成一个任务追加一个小段，同层的段攒够 MERGE_FACTOR 个后在后台合并。
+# 段文件：
+#   <代>.post   所有词项的倒排表，按词项依次存放；每个倒排表按列存放 4 列
+#               （speech序号、词位置、begin_time、sentence序号），差分 + zigzag 后按该列最大值
+#               选用 0/1/2/4/8 字节的最小宽度（0 表示整列为0，不占空间）
+#   <代>.json   speech_id / sentence_id 列表和词典 {词项: [偏移, 个数, 4列宽度]}
+#   manifest.json  有效的段（从旧到新），同一 speech_id 以最新的段为准
+import os
+import re
+import sys
+import json
+import time
+import mmap
+import random
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.locking import locked
+
+INDEX_DIR_ENV = "SPEECH_TEXT_INDEX_DIR"
+DEFAULT_INDEX_DIR = "results/textindex"
+# 同一层（词数同一数量级，以 MERGE_FACTOR 为底）的段达到该数量时合并
+MERGE_FACTOR = 8
+# 合并中断（进程退出）后，超过该时间的合并标记视为失效（秒）
+MERGE_STALE_SECONDS = 3600
+# 词数在该值以下的段都算作第0层
+MIN_LEVEL_WORDS = 1024
+
+_TOKEN = re.compile(r"[\w']+")
+_WIDTH_DTYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+
+def normalize(word):
+    """词项归一化：小写，去掉标点；"U.S." → "us"，"don't" 保持不变"""
+    return ''.join(_TOKEN.findall(word.lower())).strip("'")
+
+
+def tokenize(text):
+    return [t for t in (normalize(part) for part in text.split()) if t]
+
+
+def _zigzag(values):
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.astype(np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+def _restart_mask(speech):
+    restart = np.ones(speech.size, dtype=bool)
+    restart[1:] = speech[1:] != speech[:-1]
+    return restart
+
+
+def _delta(values, restart):
+    """差分编码，restart 处（每组的第一条记录）存绝对值"""
+    deltas = np.diff(values, prepend=0)
+    deltas[restart] = values[restart]
+    return deltas
+
+
+def _undelta(deltas, restart):
+    total = np.cumsum(deltas)
+    starts = np.flatnonzero(restart)
+    base = total[starts] - deltas[starts]
+    return total - base[np.cumsum(restart) - 1]
+
+
+class Postings:
+    """一组倒排记录（列式），speech/sentence 为段内序号"""
+
+    def __init__(self, speech, position, begin_time, sentence):
+        self.speech = speech
+        self.position = position
+        self.begin_time = begin_time
+        self.sentence = sentence
+
+    @classmethod
+    def decode(cls, buffer, offset, count, widths, positions_only=False):
+        """positions_only 时只解码 speech 和词位置两列（短语匹配用），其余列为None"""
+        columns = []
+        for width in widths[:2] if positions_only else widths:
+            if width:
+                column = np.frombuffer(buffer, dtype=_WIDTH_DTYPES[width], count=count, offset=offset)
+                offset += width * count
+                columns.append(_unzigzag(column))
+            else:
+                columns.append(np.zeros(count, dtype=np.int64))
+        speech = np.cumsum(columns[0])
+        restart = _restart_mask(speech)
+        if positions_only:
+            return cls(speech, _undelta(columns[1], restart), None, None)
+        return cls(speech, _undelta(columns[1], restart), _undelta(columns[2], restart),
+                   _undelta(columns[3], restart))
+
+
+def _result_columns(data):
+    """处理后的结果 → (speech_id, sentence_id列表, 词项列表, 词位置, begin_time, sentence序号)"""
+    speech_id = data['speech_results'][0]['id']
+    sentence_ids = [s['id'] for s in data.get('sentences', [])]
+    sentence_ord = {sentence_id: n for n, sentence_id in enumerate(sentence_ids)}
+    terms = []
+    begin_times = []
+    sentences = []
+    normalized = {}
+    for word in data.get('words', []):
+        term = normalized.get(word['word'])
+        if term is None:
+            term = normalized[word['word']] = normalize(word['word'])
+        if not term:
+            continue
+        terms.append(term)
+        begin_times.append(word['begin_time'])
+        # 没有对应句子的词记为 -1
+        sentences.append(sentence_ord.get(word.get('sentence_id'), -1))
+    n = len(terms)
+    return (speech_id, sentence_ids, terms, np.arange(n, dtype=np.int64),
+            np.asarray(begin_times, dtype=np.int64).reshape(n), np.asarray(sentences, dtype=np.int64).reshape(n))
+
+
+def write_segment(path, speech_ids, sentence_ids, terms, postings):
+    """把列式倒排记录写成一个段；terms 为每条记录的词项，sentence 为 sentence_ids 中的全局序号"""
+    path = Path(path)
+    terms = np.asarray(terms, dtype=object)
+    vocabulary, term_ids = np.unique(terms.astype(str), return_inverse=True) if terms.size else ([], terms)
+    order = np.lexsort((postings.position, postings.speech, term_ids))
+    term_ids = np.asarray(term_ids)[order]
+    speech = postings.speech[order]
+    position = postings.position[order]
+    begin_time = postings.begin_time[order]
+    sentence = postings.sentence[order]
+    bounds = np.flatnonzero(np.diff(term_ids, prepend=-1, append=-1))
+
+    # 所有词项一起向量化编码：每个词项的倒排表从头差分，其余列在每个 speech 处重新开始
+    term_start = np.zeros(term_ids.size, dtype=bool)
+    term_start[bounds[:-1]] = True
+    restart = term_start | _restart_mask(speech)
+    columns = [_zigzag(_delta(speech, term_start)), _zigzag(_delta(position, restart)),
+               _zigzag(_delta(begin_time, restart)), _zigzag(_delta(sentence, restart))]
+    widths = np.zeros((bounds.size - 1, 4), dtype=np.int64)
+    for c, column in enumerate(columns):
+        top = np.maximum.reduceat(column, bounds[:-1]) if column.size else column
+        widths[:, c] = np.select([top == 0, top < 1 << 8, top < 1 << 16, top < 1 << 32], [0, 1, 2, 4], 8)
+
+    dictionary = {}
+    offset = 0
+    tmp_post = path.with_suffix('.post.tmp')
+    with open(tmp_post, 'wb') as f:
+        for term_id, a, b, term_widths in zip(term_ids[bounds[:-1]].tolist(), bounds[:-1].tolist(),
+                                              bounds[1:].tolist(), widths.tolist()):
+            data = b''.join(column[a:b].astype(_WIDTH_DTYPES[w]).tobytes()
+                            for column, w in zip(columns, term_widths) if w)
+            f.write(data)
+            dictionary[str(vocabulary[term_id])] = [offset, b - a, *term_widths]
+            offset += len(data)
+    tmp_meta = path.with_suffix('.json.tmp')
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        # json.dumps 走C实现，比 json.dump 逐块写快得多
+        f.write(json.dumps({'speeches': list(speech_ids), 'sentences': list(sentence_ids),
+                            'words': int(len(terms)), 'terms': dictionary},
+                           ensure_ascii=False, separators=(',', ':')))
+    os.replace(tmp_post, path.with_suffix('.post'))
+    os.replace(tmp_meta, path.with_suffix('.json'))
+    return int(len(terms))
+
+
+class Segment:
+    """只读的段：词典常驻内存，倒排表通过 mmap 按需解码"""
+
+    def __init__(self, path):
+        path = Path(path)
+        with open(path.with_suffix('.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.speeches = meta['speeches']
+        self.sentences = meta['sentences']
+        self.words = meta['words']
+        self.terms = meta['terms']
+        with open(path.with_suffix('.post'), 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+
+    def postings(self, term, positions_only=False):
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        offset, count, *widths = entry
+        return Postings.decode(self._buffer, offset, count, widths, positions_only)
+
+    def all_postings(self):
+        """解码全部倒排记录（合并用），返回 (词项列表, Postings)"""
+        terms = []
+        columns = [[], [], [], []]
+        for term, (offset, count, *widths) in self.terms.items():
+            terms.extend([term] * count)
+            for c, width in enumerate(widths):
+                if width:
+                    columns[c].append(np.frombuffer(self._buffer, dtype=_WIDTH_DTYPES[width],
+                                                    count=count, offset=offset).astype(np.uint64))
+                    offset += width * count
+                else:
+                    columns[c].append(np.zeros(count, dtype=np.uint64))
+        if not terms:
+            empty = np.zeros(0, dtype=np.int64)
+            return terms, Postings(empty, empty, empty, empty)
+        # 与 write_segment 相反：先按词项边界还原 speech，再按 speech 边界还原其余列
+        columns = [_unzigzag(np.concatenate(column)) for column in columns]
+        counts = [entry[1] for entry in self.terms.values()]
+        term_start = np.zeros(len(terms), dtype=bool)
+        term_start[np.cumsum([0] + counts[:-1])] = True
+        speech = _undelta(columns[0], term_start)
+        restart = term_start | _restart_mask(speech)
+        return terms, Postings(speech, *(_undelta(column, restart) for column in columns[1:]))
+
+
+def _level(words):
+    level = 0
+    while words >= MIN_LEVEL_WORDS * MERGE_FACTOR ** (level + 1):
+        level += 1
+    return level
+
+
+class TextIndex:
+    """倒排索引目录；多进程可同时追加（manifest 读改写由文件锁保护）"""
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, background_merge=True):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.background_merge = background_merge
+        self._segments = {}
+        self._live = []
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+        self._merge_thread = None
+
+    # ---------- manifest ----------
+
+    @property
+    def _manifest_path(self):
+        return self.index_dir / 'manifest.json'
+
+    @contextmanager
+    def _locked(self):
+        with locked(self.index_dir / '.lock'):
+            yield self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'next': 1, 'segments': [], 'merging': {}}
+
+    def _write_manifest(self, manifest):
+        tmp = self._manifest_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path)
+
+    def _segment_path(self, gen):
+        return self.index_dir / f"{gen:08d}"
+
+    # ---------- 写入 ----------
+
+    def add_result(self, data):
+        """把一个处理后的识别结果追加为新段，返回 {'segment', 'words'}"""
+        speech_id, sentence_ids, terms, position, begin_time, sentence = _result_columns(data)
+        speech = np.zeros(len(terms), dtype=np.int64)
+        return self._append([speech_id], sentence_ids, terms, Postings(speech, position, begin_time, sentence))
+
+    def add_results(self, results):
+        """批量追加多个结果为一个段（离线建索引用）"""
+        speech_ids, sentence_ids, terms, parts = [], [], [], []
+        for data in results:
+            speech_id, sentences, result_terms, position, begin_time, sentence = _result_columns(data)
+            sentence = np.where(sentence >= 0, sentence + len(sentence_ids), -1)
+            parts.append(Postings(np.full(len(result_terms), len(speech_ids), dtype=np.int64),
+                                  position, begin_time, sentence))
+            speech_ids.append(speech_id)
+            sentence_ids.extend(sentences)
+            terms.extend(result_terms)
+        if not speech_ids:
+            return None
+        return self._append(speech_ids, sentence_ids, terms,
+                            Postings(*(np.concatenate([getattr(p, c) for p in parts])
+                                       for c in ('speech', 'position', 'begin_time', 'sentence'))))
+
+    def _append(self, speech_ids, sentence_ids, terms, postings):
+        with self._locked() as manifest:
+            gen = manifest['next']
+            manifest['next'] = gen + 1
+            self._write_manifest(manifest)
+        words = write_segment(self._segment_path(gen), speech_ids, sentence_ids, terms, postings)
+        with self._locked() as manifest:
+            manifest['segments'].append({'gen': gen, 'words': words, 'speeches': len(speech_ids)})
+            self._write_manifest(manifest)
+        if self.background_merge:
+            self._merge_in_background()
+        return {'segment': gen, 'words': words}
+
+    # ---------- 合并 ----------
+
+    def _pick_merge(self, manifest, full=False):
+        """选出一段连续、同层、未在合并中的段；full 时选全部"""
+        now = time.time()
+        merging = {int(g) for g, started in manifest.get('merging', {}).items()
+                   if now - started < MERGE_STALE_SECONDS}
+        segments = manifest['segments']
+        if full:
+            return segments if len(segments) > 1 and not merging else None
+        # 从旧往新找：取最旧的一段，剩下较新的段留给之后追加的段凑齐，不会被夹在大段之间
+        run = []
+        for segment in segments:
+            if segment['gen'] in merging:
+                run = []
+                continue
+            if run and _level(segment['words']) != _level(run[0]['words']):
+                run = []
+            run.append(segment)
+            if len(run) == MERGE_FACTOR:
+                return run
+        return None
+
+    def _remove_orphans(self, manifest):
+        """删除中断的写入留下的段文件（含 .tmp）：不在 manifest 中、且超过 MERGE_STALE_SECONDS 未修改"""
+        live = {segment['gen'] for segment in manifest['segments']}
+        cutoff = time.time() - MERGE_STALE_SECONDS
+        for path in self.index_dir.iterdir():
+            gen = path.name.split('.', 1)[0]
+            if not gen.isdigit() or int(gen) in live:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def merge(self, full=False):
+        """执行一次合并，返回合并的段数（0 表示无需合并）"""
+        with self._locked() as manifest:
+            self._remove_orphans(manifest)
+            run = self._pick_merge(manifest, full)
+            if not run:
+                return 0
+            merging = manifest.setdefault('merging', {})
+            for segment in run:
+                merging[str(segment['gen'])] = time.time()
+            gen = manifest['next']
+            manifest['next'] = gen + 1
+            self._write_manifest(manifest)
+
+        try:
+            speech_ids, sentence_ids, terms, parts = [], [], [], []
+            # 从新到旧，同一 speech_id 只保留最新一段中的记录
+            seen = set()
+            for segment_info in reversed(run):
+                segment = Segment(self._segment_path(segment_info['gen']))
+                keep = np.array([speech_id not in seen for speech_id in segment.speeches], dtype=bool)
+                seen.update(segment.speeches)
+                segment_terms, postings = segment.all_postings()
+                mask = keep[postings.speech] if postings.speech.size else np.zeros(0, dtype=bool)
+                remap = np.cumsum(keep) - 1 + len(speech_ids)
+                parts.append(Postings(remap[postings.speech[mask]], postings.position[mask],
+                                      postings.begin_time[mask],
+                                      np.where(postings.sentence[mask] >= 0,
+                                               postings.sentence[mask] + len(sentence_ids), -1)))
+                terms.extend(np.asarray(segment_terms, dtype=object)[mask].tolist())
+                speech_ids.extend(s for s, k in zip(segment.speeches, keep) if k)
+                sentence_ids.extend(segment.sentences)
+            words = write_segment(self._segment_path(gen), speech_ids, sentence_ids, terms,
+                                  Postings(*(np.concatenate([getattr(p, c) for p in parts])
+                                             for c in ('speech', 'position', 'begin_time', 'sentence'))))
+        except Exception:
+            with self._locked() as manifest:
+                for segment in run:
+                    manifest.get('merging', {}).pop(str(segment['gen']), None)
+                self._write_manifest(manifest)
+            raise
+
+        merged = {segment['gen'] for segment in run}
+        with self._locked() as manifest:
+            segments = manifest['segments']
+            position = next(n for n, s in enumerate(segments) if s['gen'] in merged)
+            segments = [s for s in segments if s['gen'] not in merged]
+            segments.insert(position, {'gen': gen, 'words': words, 'speeches': len(speech_ids)})
+            manifest['segments'] = segments
+            for g in merged:
+                manifest.get('merging', {}).pop(str(g), None)
+            self._write_manifest(manifest)
+        # 已打开的读者仍持有 mmap，删除文件不影响它们
+        for g in merged:
+            for suffix in ('.post', '.json'):
+                self._segment_path(g).with_suffix(suffix).unlink(missing_ok=True)
+        return len(run)
+
+    def _merge_in_background(self):
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+
+            def run():
+                while self.merge():
+                    pass
+
+            # 非守护线程：speech.py 这类一次性进程退出前会等合并完成，
+            # 不会留下 .tmp 文件和要等 MERGE_STALE_SECONDS 才失效的合并标记
+            self._merge_thread = threading.Thread(target=run, name='textindex-merge')
+            self._merge_thread.start()
+
+    def wait_merges(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def optimize(self):
+        """合并为单个段"""
+        self.wait_merges()
+        while self.merge(full=True):
+            pass
+
+    # ---------- 查询 ----------
+
+    def _live_segments(self):
+        """当前有效的段（从新到旧），返回 [(段, 被更新的段覆盖的speech序号)]；
+        manifest 未变化时直接复用已打开的段"""
+        try:
+            mtime = self._manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return self._live
+            manifest = self._read_manifest()
+            gens = {s['gen'] for s in manifest['segments']}
+            for gen in list(self._segments):
+                if gen not in gens:
+                    del self._segments[gen]
+            live = []
+            seen = set()
+            complete = True
+            for info in reversed(manifest['segments']):
+                segment = self._segments.get(info['gen'])
+                if segment is None:
+                    try:
+                        segment = self._segments[info['gen']] = Segment(self._segment_path(info['gen']))
+                    except FileNotFoundError:
+                        # 刚被合并删除，下次按新的 manifest 重新读取
+                        complete = False
+                        continue
+                masked = np.array([n for n, s in enumerate(segment.speeches) if s in seen], dtype=np.int64)
+                seen.update(segment.speeches)
+                live.append((segment, masked))
+            self._live = live
+            self._manifest_mtime = mtime if complete else None
+            return live
+
+    def search(self, phrase, limit=None):
+        """短语查询，返回 [(speech_id, sentence_id, begin_time), ...]，同一 speech 内按出现顺序排列
+
+        begin_time 为短语第一个词的开始时间；没有对应句子的词 sentence_id 为None
+        """
+        terms = tokenize(phrase)
+        if not terms:
+            return []
+        hits = []
+        for segment, masked in self._live_segments():
+            # 只有第一个词需要 begin_time / sentence
+            lists = [segment.postings(term, positions_only=i > 0) for i, term in enumerate(terms)]
+            if any(p is None for p in lists):
+                continue
+            # 第 i 个词的 (speech, 位置-i) 即短语起点；倒排表按 (speech, 位置) 有序，
+            # 从最短的表出发，在其余表中二分查找
+            keys = [(p.speech << 32) + p.position - i for i, p in enumerate(lists)]
+            rarest = min(range(len(keys)), key=lambda i: keys[i].size)
+            starts = keys[rarest]
+            for i, other in enumerate(keys):
+                if i != rarest and starts.size:
+                    found = np.searchsorted(other, starts)
+                    starts = starts[other[np.minimum(found, other.size - 1)] == starts]
+            first = lists[0]
+            rows = np.searchsorted(keys[0], starts)
+            if masked.size:
+                rows = rows[~np.isin(first.speech[rows], masked)]
+            if limit is not None:
+                rows = rows[:limit - len(hits)]
+            speeches = segment.speeches
+            sentences = segment.sentences
+            hits.extend(zip([speeches[n] for n in first.speech[rows].tolist()],
+                            [sentences[n] if n >= 0 else None for n in first.sentence[rows].tolist()],
+                            first.begin_time[rows].tolist()))
+            if limit is not None and len(hits) >= limit:
+                break
+        return hits
+
+    def stats(self):
+        manifest = self._read_manifest()
+        size = sum(p.stat().st_size for p in self.index_dir.glob('*.post')) + \
+            sum(p.stat().st_size for p in self.index_dir.glob('*.json'))
+        return {'segments': len(manifest['segments']),
+                'words': sum(s['words'] for s in manifest['segments']),
+                'speeches': sum(s['speeches'] for s in manifest['segments']),
+                'bytes': size}
+
+
+# 每个进程按目录复用一个索引
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(index_dir=None):
+    """取得进程内共享的倒排索引；index_dir 默认读取 SPEECH_TEXT_INDEX_DIR"""
+    index_dir = str(index_dir or os.getenv(INDEX_DIR_ENV, DEFAULT_INDEX_DIR))
+    with _indexes_lock:
+        index = _indexes.get(index_dir)
+        if index is None:
+            index = _indexes[index_dir] = TextIndex(index_dir)
+        return index
+
+
+def synthetic_results(n_words, words_per_result=10000, vocabulary=50000, seed=0):
+    """生成词频服从 Zipf 分布（s=1，与自然语言相近）的模拟处理结果（基准测试用）"""
+    rng = np.random.default_rng(seed)
+    words_per_sentence = 12
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    for r in range(0, n_words, words_per_result):
+        n = min(words_per_result, n_words - r)
+        ranks = rng.choice(vocabulary, n, p=weights) + 1
+        n_sentences = (n + words_per_sentence - 1) // words_per_sentence
+        sentences = [{'id': f"{r:08d}-s{i}"} for i in range(n_sentences)]
+        yield {
+            'speech_results': [{'id': f"speech-{r // words_per_result:06d}"}],
+            'sentences': sentences,
+            'words': [{'word': f"w{rank}", 'begin_time': i * 300,
+                       'sentence_id': sentences[i // words_per_sentence]['id']}
+                      for i, rank in enumerate(ranks.tolist())],
+        }
+
+
+def _measure_queries(index, results, queries, seed):
+    rng = random.Random(seed)
+    timings = {'word': [], 'phrase2': [], 'phrase3': []}
+    hits = {k: 0 for k in timings}
+    index.search('warmup')
+    for _ in range(queries):
+        words = rng.choice(results)['words']
+        i = rng.randrange(len(words) - 3)
+        for kind, n in (('word', 1), ('phrase2', 2), ('phrase3', 3)):
+            phrase = ' '.join(w['word'] for w in words[i:i + n])
+            t = time.perf_counter()
+            hits[kind] += len(index.search(phrase))
+            timings[kind].append(time.perf_counter() - t)
+    report = {}
+    for kind, values in timings.items():
+        values.sort()
+        report[f'{kind}_p50_ms'] = round(values[len(values) // 2] * 1000, 3)
+        report[f'{kind}_p99_ms'] = round(values[min(int(len(values) * 0.99), len(values) - 1)] * 1000, 3)
+        report[f'{kind}_hits_mean'] = round(hits[kind] / queries, 1)
+    return report
+
+
+def benchmark(index_dir, n_words, queries=200, seed=0):
+    """离线基准：按任务逐个追加、后台合并，测查询耗时；再合并为单段后重测"""
+    index = TextIndex(index_dir)
+    start = time.perf_counter()
+    results = list(synthetic_results(n_words, seed=seed))
+    generated = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in results:
+        index.add_result(data)
+    appended = time.perf_counter() - start
+    index.wait_merges()
+    merged = time.perf_counter() - start
+
+    report = {'words': n_words, 'results': len(results), 'generate_s': round(generated, 2),
+              'append_s': round(appended, 2), 'append_and_merge_s': round(merged, 2), **index.stats(),
+              'queries': _measure_queries(index, results, queries, seed)}
+    start = time.perf_counter()
+    index.optimize()
+    report['optimize_s'] = round(time.perf_counter() - start, 2)
+    report['optimized'] = {**index.stats(), 'queries': _measure_queries(index, results, queries, seed)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='识别结果全文倒排索引')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--index_dir', help=f'索引目录（默认读取 {INDEX_DIR_ENV}，未设置时为 {DEFAULT_INDEX_DIR}）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('search', parents=[common], help='短语查询')
+    p.add_argument('phrase')
+    p.add_argument('--limit', type=int, help='最多返回的条数')
+    subparsers.add_parser('optimize', parents=[common], help='合并为单个段')
+    subparsers.add_parser('stats', parents=[common], help='段数、词数和占用空间')
+    p = subparsers.add_parser('bench', parents=[common], help='离线基准测试（模拟数据）')
+    p.add_argument('--words', type=int, default=1000000, help='总词数')
+    p.add_argument('--queries', type=int, default=200, help='每种查询的次数')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        import tempfile
+        index_dir = args.index_dir or tempfile.mkdtemp(prefix='textindex-bench-')
+        print(json.dumps(benchmark(index_dir, args.words, args.queries), ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    index = get_index(args.index_dir)
+    if args.command == 'search':
+        start = time.perf_counter()
+        hits = index.search(args.phrase, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for speech_id, sentence_id, begin_time in hits:
+            print(f"{speech_id}  {sentence_id}  {begin_time}ms")
+        print(f"共 {len(hits)} 处，{elapsed:.2f}ms", file=sys.stderr)
+    elif args.command == 'optimize':
+        index.optimize()
+        print(json.dumps(index.stats(), ensure_ascii=False))
+    else:
+        print(json.dumps(index.stats(), ensure_ascii=False))
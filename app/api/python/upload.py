@@ -0,0 +1,259 @@
+# -*- coding: utf8 -*-
+# 本地录音并行分片上传到OSS，输出带签名的下载地址，可直接作为 fileTrans 的 fileLink。
+# 每个分片由工作线程各自打开文件按偏移读取，内存占用不超过 线程数 × 分片大小；
+# 分片带 Content-MD5 校验，已完成的分片记录在清单文件中，中断后重新运行只上传缺少的分片
+import os
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+# 与 lib/oss-client.ts 使用相同的环境变量和默认值；OSS_ENDPOINT 可指向内网地址或本地模拟服务
+DEFAULT_REGION = "oss-cn-beijing"
+DEFAULT_BUCKET = "chango-url"
+# 上传对象的前缀
+KEY_PREFIX = "speech-uploads"
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# OSS 限制：除最后一片外每片至少100KB，最多10000片
+MIN_PART_SIZE = 100 * 1024
+MAX_PARTS = 10000
+DEFAULT_WORKERS = 8
+# 单个分片的重试次数和退避（秒）
+PART_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 0.5
+# 签名URL有效期：识别任务可能排队较久，默认一天
+DEFAULT_EXPIRES_SECONDS = 24 * 3600
+MANIFEST_SUFFIX = '.upload.json'
+
+
+def get_bucket():
+    """按环境变量创建 oss2.Bucket"""
+    try:
+        import oss2
+    except ImportError:
+        raise RuntimeError("未安装oss2，请先执行 pip install oss2")
+    from app.api.python.speech import load_env
+    load_env()
+    akId = os.getenv('ALIYUN_AK_ID')
+    akSecret = os.getenv('ALIYUN_AK_SECRET')
+    if not akId or not akSecret:
+        raise RuntimeError("缺少OSS认证配置（ALIYUN_AK_ID / ALIYUN_AK_SECRET）")
+    region = os.getenv('OSS_REGION', DEFAULT_REGION)
+    endpoint = os.getenv('OSS_ENDPOINT') or f"https://{region}.aliyuncs.com"
+    return oss2.Bucket(oss2.Auth(akId, akSecret), endpoint, os.getenv('OSS_BUCKET', DEFAULT_BUCKET))
+
+
+def public_url(url):
+    """与 lib/oss-client.ts 的 transformUrl 一致：换成自定义域名，或去掉内网域名中的 -internal"""
+    custom = os.getenv('OSS_CUSTOM_DOMAIN')
+    if not custom:
+        return url.replace('-internal.aliyuncs.com', '.aliyuncs.com')
+    custom = custom.rstrip('/')
+    if not custom.startswith('http'):
+        custom = f"https://{custom}"
+    parts = urlsplit(url)
+    base = urlsplit(custom)
+    return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, ''))
+
+
+def plan_part_size(size, part_size=DEFAULT_PART_SIZE):
+    """分片大小：不小于 MIN_PART_SIZE，且保证分片数不超过 MAX_PARTS"""
+    part_size = max(part_size, MIN_PART_SIZE)
+    if size > part_size * MAX_PARTS:
+        part_size = -(-size // MAX_PARTS)
+    return part_size
+
+
+def default_key(path):
+    """按日期和文件内容指纹（大小 + 修改时间 + 路径）生成对象名，同一文件重复上传得到相同的名字"""
+    stat = os.stat(path)
+    digest = hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'))
+    return f"{KEY_PREFIX}/{datetime.now():%Y%m%d}/{digest.hexdigest()[:12]}_{Path(path).name}"
+
+
+class UploadManifest:
+    """断点续传清单：上传ID和已完成分片的 MD5，每完成一片原子地重写一次"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.data = {}
+        return self.data
+
+    def matches(self, key, size, mtime_ns, part_size):
+        d = self.data
+        return (d.get('key') == key and d.get('size') == size and d.get('mtime_ns') == mtime_ns
+                and d.get('part_size') == part_size and d.get('upload_id'))
+
+    def start(self, key, size, mtime_ns, part_size, upload_id):
+        self.data = {'key': key, 'size': size, 'mtime_ns': mtime_ns, 'part_size': part_size,
+                     'upload_id': upload_id, 'parts': {}}
+        self._write()
+
+    def record(self, number, md5_hex):
+        with self._lock:
+            self.data['parts'][str(number)] = md5_hex
+            self._write()
+
+    def _write(self):
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def _upload_part(bucket, key, upload_id, path, number, offset, length):
+    """读取并上传一个分片（失败时指数退避重试），返回 (分片号, ETag, MD5)"""
+    import oss2
+    # 每个分片单独打开文件：os.pread 在Windows上不可用，共享句柄的seek又不是线程安全的
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    if len(data) != length:
+        raise IOError(f"读取分片 {number} 失败：文件在上传期间被修改")
+    md5 = hashlib.md5(data)
+    headers = {'Content-MD5': base64.b64encode(md5.digest()).decode('ascii')}
+    for attempt in range(PART_ATTEMPTS):
+        try:
+            result = bucket.upload_part(key, upload_id, number, data, headers=headers)
+            break
+        except oss2.exceptions.OssError as e:
+            # 只重试网络错误和服务端5xx；校验失败等4xx直接抛出
+            retryable = isinstance(e, oss2.exceptions.RequestError) or e.status >= 500
+            if not retryable or attempt + 1 == PART_ATTEMPTS:
+                raise
+            time.sleep(BACKOFF_BASE_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.0))
+    etag = result.etag.strip('"').lower()
+    if etag != md5.hexdigest():
+        raise IOError(f"分片 {number} 校验失败：服务端ETag {etag} 与本地MD5不一致")
+    return number, result.etag, md5.hexdigest()
+
+
+def upload_file(path, key=None, bucket=None, part_size=DEFAULT_PART_SIZE, workers=DEFAULT_WORKERS,
+                expires=DEFAULT_EXPIRES_SECONDS, manifest_path=None, on_progress=None):
+    """并行分片上传本地文件，返回 (对象名, 签名下载地址)
+
+    manifest_path 默认为 <文件>.upload.json；同一文件（大小、修改时间、分片大小不变）再次上传时
+    从清单和服务端的分片列表恢复，只上传缺少的分片
+    on_progress(已完成字节数, 总字节数) 在每个分片完成后调用
+    """
+    import oss2
+    bucket = bucket or get_bucket()
+    stat = os.stat(path)
+    size = stat.st_size
+    part_size = plan_part_size(size, part_size)
+    manifest = UploadManifest(manifest_path or f"{path}{MANIFEST_SUFFIX}")
+    manifest.load()
+    if key is None:
+        key = manifest.data.get('key') if manifest.matches(manifest.data.get('key'), size, stat.st_mtime_ns,
+                                                            part_size) else default_key(path)
+
+    if size <= part_size:
+        # 小文件一次上传
+        with open(path, 'rb') as f:
+            data = f.read()
+        md5 = hashlib.md5(data)
+        bucket.put_object(key, data, headers={'Content-MD5': base64.b64encode(md5.digest()).decode('ascii')})
+        if on_progress is not None:
+            on_progress(size, size)
+        return key, public_url(bucket.sign_url('GET', key, expires, slash_safe=True))
+
+    # 恢复：以服务端实际存在且MD5一致的分片为准
+    done = {}
+    if manifest.matches(key, size, stat.st_mtime_ns, part_size):
+        upload_id = manifest.data['upload_id']
+        try:
+            remote = {p.part_number: p.etag.strip('"').lower()
+                      for p in oss2.PartIterator(bucket, key, upload_id)}
+            done = {int(n): md5 for n, md5 in manifest.data['parts'].items() if remote.get(int(n)) == md5}
+            manifest.data['parts'] = {str(n): md5 for n, md5 in done.items()}
+        except oss2.exceptions.NoSuchUpload:
+            upload_id = None
+    else:
+        upload_id = None
+    if upload_id is None:
+        upload_id = bucket.init_multipart_upload(key).upload_id
+        manifest.start(key, size, stat.st_mtime_ns, part_size, upload_id)
+
+    n_parts = -(-size // part_size)
+    uploaded = sum(min(part_size, size - (n - 1) * part_size) for n in done)
+    if on_progress is not None and uploaded:
+        on_progress(uploaded, size)
+    parts = {n: oss2.models.PartInfo(n, f'"{md5.upper()}"') for n, md5 in done.items()}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='oss-part') as executor:
+        futures = [executor.submit(_upload_part, bucket, key, upload_id, path, n, (n - 1) * part_size,
+                                   min(part_size, size - (n - 1) * part_size))
+                   for n in range(1, n_parts + 1) if n not in done]
+        try:
+            for future in as_completed(futures):
+                number, etag, md5_hex = future.result()
+                parts[number] = oss2.models.PartInfo(number, etag)
+                manifest.record(number, md5_hex)
+                uploaded += min(part_size, size - (number - 1) * part_size)
+                if on_progress is not None:
+                    on_progress(uploaded, size)
+        except Exception:
+            # 保留已完成的分片和清单，下次运行从断点继续
+            for future in futures:
+                future.cancel()
+            raise
+
+    bucket.complete_multipart_upload(key, upload_id, [parts[n] for n in sorted(parts)])
+    manifest.remove()
+    return key, public_url(bucket.sign_url('GET', key, expires, slash_safe=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='并行分片上传本地录音到OSS，输出签名下载地址')
+    parser.add_argument('file', help='本地音频文件')
+    parser.add_argument('--key', help='对象名（默认按日期和文件指纹生成）')
+    parser.add_argument('--part_size', type=int, default=DEFAULT_PART_SIZE // (1024 * 1024), help='分片大小（MB）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='并行上传的线程数')
+    parser.add_argument('--expires', type=int, default=DEFAULT_EXPIRES_SECONDS, help='签名URL有效期（秒）')
+    parser.add_argument('--transcribe', action='store_true', help='上传后直接提交识别，输出识别结果')
+    parser.add_argument('--format', default='json', help='--transcribe 时的存储格式，与 speech.py --format 相同')
+    args = parser.parse_args()
+
+    start = time.time()
+
+    def progress(done, total):
+        rate = done / max(time.time() - start, 1e-6) / 1048576
+        print(f"\r已上传 {done / 1048576:.1f}/{total / 1048576:.1f} MB（{rate:.1f} MB/s）",
+              end='', file=sys.stderr)
+
+    key, url = upload_file(args.file, args.key, part_size=args.part_size * 1024 * 1024,
+                           workers=args.workers, expires=args.expires, on_progress=progress)
+    print(file=sys.stderr)
+    if not args.transcribe:
+        print(url)
+        sys.exit(0)
+
+    from app.api.python.speech import fileTrans
+    from app.api.python.streamjson import dump
+    result = fileTrans(os.getenv('ALIYUN_AK_ID'), os.getenv('ALIYUN_AK_SECRET'), os.getenv('NLS_APP_KEY'),
+                       url, args.format)
+    dump(result, sys.stdout)
+    print()
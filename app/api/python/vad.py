@@ -0,0 +1,158 @@
+import numpy as np
+
+from app.api.python.audio import iter_pcm_blocks, DEFAULT_SAMPLE_RATE
+
+# 帧长（毫秒），每帧计算一次能量
+FRAME_MS = 30
+# 比噪声底高出多少分贝才算语音
+THRESHOLD_DB = 12.0
+# 绝对静音下限，避免整段安静录音把噪声底拉得过低
+MIN_THRESHOLD_DB = -50.0
+# 短于该时长的静音并入相邻语音（句中停顿）
+MIN_SILENCE_MS = 200
+# 短于该时长的语音片段视为噪声丢弃
+MIN_SPEECH_MS = 120
+
+
+class FrameEnergy:
+    """逐块累计每帧能量（dB）；块之间不足一帧的尾部采样会拼到下一块"""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, frame_ms=FRAME_MS):
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self._energies = []
+        self._carry = np.zeros(0, dtype=np.float32)
+
+    def add(self, block):
+        if self._carry.size:
+            block = np.concatenate([self._carry, block])
+        frame_len = self.frame_len
+        n_frames = block.size // frame_len
+        if n_frames:
+            frames = block[:n_frames * frame_len].reshape(n_frames, frame_len)
+            power = np.einsum('ij,ij->i', frames, frames) / frame_len
+            self._energies.append(10.0 * np.log10(power + 1e-10))
+        self._carry = block[n_frames * frame_len:]
+
+    def finish(self):
+        """返回全部帧能量的float32数组"""
+        energies = list(self._energies)
+        if self._carry.size:
+            power = float(np.dot(self._carry, self._carry)) / self._carry.size
+            energies.append(np.array([10.0 * np.log10(power + 1e-10)]))
+        if not energies:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(energies).astype(np.float32)
+
+
+def compute_frame_energy(source, sample_rate=DEFAULT_SAMPLE_RATE, frame_ms=FRAME_MS):
+    """流式解码音频并计算每帧能量（dB），返回float32数组
+
+    解码按块进行，内存只随帧数线性增长
+    """
+    energy = FrameEnergy(sample_rate, frame_ms)
+    for block in iter_pcm_blocks(source, sample_rate):
+        energy.add(block)
+    return energy.finish()
+
+
+def energy_to_intervals(energy_db, frame_ms=FRAME_MS, threshold_db=THRESHOLD_DB,
+                        min_silence_ms=MIN_SILENCE_MS, min_speech_ms=MIN_SPEECH_MS):
+    """把帧能量转换为语音区间，返回形如 (n, 2) 的int32数组（毫秒）"""
+    if energy_db.size == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+
+    # 以低分位数估计噪声底，自适应不同录音电平
+    noise_floor = float(np.percentile(energy_db, 10))
+    threshold = max(noise_floor + threshold_db, MIN_THRESHOLD_DB)
+    is_speech = energy_db > threshold
+
+    # 找出所有语音段的起止帧
+    padded = np.concatenate([[False], is_speech, [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    if starts.size == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+
+    # 合并间隔过短的语音段
+    min_gap = int(np.ceil(min_silence_ms / frame_ms))
+    keep = np.concatenate([[True], (starts[1:] - ends[:-1]) >= min_gap])
+    group = np.cumsum(keep) - 1
+    merged_starts = starts[keep]
+    merged_ends = np.zeros(merged_starts.size, dtype=ends.dtype)
+    np.maximum.at(merged_ends, group, ends)
+
+    # 丢弃过短的语音段
+    min_len = int(np.ceil(min_speech_ms / frame_ms))
+    long_enough = (merged_ends - merged_starts) >= min_len
+    intervals = np.stack([merged_starts[long_enough], merged_ends[long_enough]], axis=1)
+    return (intervals * frame_ms).astype(np.int32)
+
+
+def compute_speech_map(source, sample_rate=DEFAULT_SAMPLE_RATE, frame_ms=FRAME_MS, **kwargs):
+    """计算音频的语音区间表（毫秒），静音即区间之间的空隙"""
+    energy_db = compute_frame_energy(source, sample_rate, frame_ms)
+    return energy_to_intervals(energy_db, frame_ms, **kwargs)
+
+
+def save_speech_map(intervals, path):
+    """以紧凑的.npy格式保存语音区间表"""
+    np.save(path, np.asarray(intervals, dtype=np.int32))
+    return path
+
+
+def load_speech_map(path):
+    return np.load(path)
+
+
+def speech_coverage(begin_times, end_times, intervals):
+    """计算每个句子时间范围内被语音覆盖的比例，用于核查识别时间戳
+
+    返回与句子数相同长度的float数组，接近0说明该句落在静音里
+    """
+    begin = np.asarray(begin_times, dtype=np.int64)
+    end = np.asarray(end_times, dtype=np.int64)
+    if begin.size == 0 or len(intervals) == 0:
+        return np.zeros(begin.size, dtype=np.float64)
+
+    starts = intervals[:, 0].astype(np.int64)
+    ends = intervals[:, 1].astype(np.int64)
+    # 语音时长前缀和，区间覆盖量 = F(end) - F(begin)
+    cum = np.concatenate([[0], np.cumsum(ends - starts)])
+
+    def covered_until(t):
+        # t 之前累计的语音时长
+        idx = np.searchsorted(starts, t, side='right')
+        prev = np.maximum(idx - 1, 0)
+        partial = np.clip(t - starts[prev], 0, ends[prev] - starts[prev])
+        return cum[prev] + np.where(idx > 0, partial, 0)
+
+    duration = np.maximum(end - begin, 1)
+    return (covered_until(end) - covered_until(begin)) / duration
+
+
+def snap_to_speech(begin_times, end_times, intervals, max_shift_ms=300):
+    """把句子边界吸附到最近的语音起点/终点
+
+    只在 max_shift_ms 范围内调整，超出范围保持原值；返回新的 (begin, end) 数组
+    """
+    begin = np.asarray(begin_times, dtype=np.int64)
+    end = np.asarray(end_times, dtype=np.int64)
+    if begin.size == 0 or len(intervals) == 0:
+        return begin, end
+
+    onsets = intervals[:, 0].astype(np.int64)
+    offsets = intervals[:, 1].astype(np.int64)
+
+    def nearest(points, values):
+        idx = np.searchsorted(points, values)
+        left = points[np.clip(idx - 1, 0, points.size - 1)]
+        right = points[np.clip(idx, 0, points.size - 1)]
+        return np.where(np.abs(values - left) <= np.abs(right - values), left, right)
+
+    near_begin = nearest(onsets, begin)
+    near_end = nearest(offsets, end)
+    new_begin = np.where(np.abs(near_begin - begin) <= max_shift_ms, near_begin, begin)
+    new_end = np.where(np.abs(near_end - end) <= max_shift_ms, near_end, end)
+    # 吸附后不能出现结束早于开始
+    new_end = np.maximum(new_end, new_begin)
+    return new_begin, new_end
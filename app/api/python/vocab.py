@@ -0,0 +1,402 @@
+# -*- coding: utf8 -*-
+# 词汇频率与覆盖率索引：每个识别结果（章节）入库时只统计一次词频，增量累加到所属书籍和全局计数，
+# 之后的"按书排词频""这一章里学习者已认识的词占多少"都是对整数数组的向量化运算，不再重新分词。
+#
+# 目录结构（默认 results/vocab）：
+#   terms.txt           词典，每行一个词形，行号即词ID（只追加）
+#   global.npy          全局词频，uint32，下标为词ID
+#   books/<书籍>.npy    每本书的词频
+#   chapters/<章节>.npy 每章的稀疏词频，(2, n) uint32：第0行词ID（升序），第1行次数
+#   chapters.json       章节 → 所属书籍（未指定为null）
+#   users/<用户>.npy    用户已掌握的词ID，升序 uint32
+# 可选的原形表（SPEECH_LEMMA_FILE，每行 "词形<TAB>原形"）用于按原形统计，如 running → run
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.alignment import TOKEN_RE, normalize
+from app.api.python.locking import locked
+
+VOCAB_DIR_ENV = "SPEECH_VOCAB_DIR"
+LEMMA_FILE_ENV = "SPEECH_LEMMA_FILE"
+DEFAULT_VOCAB_DIR = "results/vocab"
+# 覆盖率报告中列出的未掌握高频词个数
+TOP_UNKNOWN = 20
+
+_ID_RE = re.compile(r'^[\w.-]+$')
+
+
+def _check_id(value, kind):
+    if not value or not _ID_RE.match(value):
+        raise ValueError(f"无效的{kind}ID：{value!r}")
+    return value
+
+
+def tokens_of(words):
+    """处理后的词列表 → 归一化的词形列表（与对齐使用相同的分词：英文单词或单个汉字）"""
+    tokens = []
+    for word in words:
+        tokens.extend(normalize(t) for t in TOKEN_RE.findall(word['word']))
+    return tokens
+
+
+def load_lemmas(path):
+    """读取原形表 {词形: 原形}"""
+    lemmas = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            form, _, lemma = line.rstrip('\n').partition('\t')
+            if form and lemma:
+                lemmas[normalize(form)] = normalize(lemma)
+    return lemmas
+
+
+def _add_counts(total, ids, counts, sign=1):
+    """把稀疏词频加到（必要时加长的）稠密数组上"""
+    size = int(ids[-1]) + 1 if ids.size else 0
+    if total.size < size:
+        total = np.concatenate([total, np.zeros(size - total.size, dtype=np.uint32)])
+    if sign > 0:
+        total[ids] += counts
+    else:
+        total[ids] -= np.minimum(counts, total[ids])
+    return total
+
+
+class VocabularyIndex:
+    """增量维护的词频索引；多进程写入由文件锁串行化，读取不加锁"""
+
+    def __init__(self, vocab_dir=DEFAULT_VOCAB_DIR, lemmas=None):
+        self.vocab_dir = Path(vocab_dir)
+        for sub in ('books', 'chapters', 'users'):
+            (self.vocab_dir / sub).mkdir(parents=True, exist_ok=True)
+        self._terms = []
+        self._term_ids = {}
+        self._terms_size = 0
+        self._lock = threading.Lock()
+        self._lemmas = lemmas or {}
+        self._lemma_of = np.zeros(0, dtype=np.uint32)
+
+    # ---------- 文件 ----------
+
+    @contextmanager
+    def _locked(self):
+        with locked(self.vocab_dir / '.lock'):
+            yield
+
+    def _load(self, path, dtype=np.uint32):
+        try:
+            return np.load(path)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=dtype)
+
+    def _save(self, path, array):
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def _book_path(self, book_id):
+        return self.vocab_dir / 'books' / f"{_check_id(book_id, '书籍')}.npy"
+
+    def _chapter_path(self, chapter_id):
+        return self.vocab_dir / 'chapters' / f"{_check_id(chapter_id, '章节')}.npy"
+
+    def _user_path(self, user_id):
+        return self.vocab_dir / 'users' / f"{_check_id(user_id, '用户')}.npy"
+
+    def _read_chapters(self):
+        try:
+            with open(self.vocab_dir / 'chapters.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_chapters(self, chapters):
+        path = self.vocab_dir / 'chapters.json'
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(chapters, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ---------- 词典 ----------
+
+    def _refresh_terms(self):
+        """读入其他进程追加的新词"""
+        path = self.vocab_dir / 'terms.txt'
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size == self._terms_size:
+            return
+        with open(path, 'rb') as f:
+            f.seek(self._terms_size)
+            data = f.read()
+        for term in data.decode('utf-8').splitlines():
+            self._term_ids[term] = len(self._terms)
+            self._terms.append(term)
+        self._terms_size = size
+
+    def ids(self, tokens, create=False):
+        """词形 → 词ID数组；create 为False时不在词典中的词被丢弃（需在写锁内调用 create=True）"""
+        with self._lock:
+            self._refresh_terms()
+            new = []
+            for token in dict.fromkeys(tokens):
+                if token not in self._term_ids and create:
+                    self._term_ids[token] = len(self._terms)
+                    self._terms.append(token)
+                    new.append(token)
+            if new:
+                data = ''.join(f"{t}\n" for t in new).encode('utf-8')
+                with open(self.vocab_dir / 'terms.txt', 'ab') as f:
+                    f.write(data)
+                self._terms_size += len(data)
+            lookup = self._term_ids
+            return np.array([lookup[t] for t in tokens if t in lookup], dtype=np.uint32)
+
+    def terms(self, ids):
+        with self._lock:
+            self._refresh_terms()
+            return [self._terms[i] for i in ids]
+
+    def lemma_of(self):
+        """词ID → 原形词ID 的映射数组（没有原形表时为恒等映射）"""
+        with self._lock:
+            self._refresh_terms()
+            n = len(self._terms)
+            if self._lemma_of.size == n:
+                return self._lemma_of
+        lemma_of = np.arange(n, dtype=np.uint32)
+        if self._lemmas:
+            terms = self.terms(range(n))
+            pairs = [(i, self._lemmas[t]) for i, t in enumerate(terms) if t in self._lemmas]
+            with self._locked():
+                lemma_ids = self.ids([lemma for _, lemma in pairs], create=True)
+            lemma_of = np.arange(len(self._terms), dtype=np.uint32)
+            lemma_of[[i for i, _ in pairs]] = lemma_ids
+        with self._lock:
+            self._lemma_of = lemma_of
+        return lemma_of
+
+    def _to_level(self, ids, counts, level):
+        """按原形合并计数：返回 (原形ID, 次数)"""
+        if level == 'word' or not self._lemmas:
+            return ids, counts
+        lemma_of = self.lemma_of()
+        lemma_ids, inverse = np.unique(lemma_of[ids], return_inverse=True)
+        return lemma_ids, np.bincount(inverse, weights=counts).astype(np.int64)
+
+    # ---------- 写入 ----------
+
+    def add_chapter(self, chapter_id, tokens, book_id=None):
+        """登记一章的词频（同一章重复登记时先扣除旧计数），返回 {'tokens', 'types'}"""
+        with self._locked():
+            ids = self.ids(tokens, create=True)
+            unique, counts = np.unique(ids, return_counts=True)
+            counts = counts.astype(np.uint32)
+            chapters = self._read_chapters()
+            self._remove_chapter(chapter_id, chapters)
+            self._save(self._chapter_path(chapter_id), np.stack([unique, counts]))
+            self._save(self.vocab_dir / 'global.npy',
+                       _add_counts(self._load(self.vocab_dir / 'global.npy'), unique, counts))
+            if book_id:
+                path = self._book_path(book_id)
+                self._save(path, _add_counts(self._load(path), unique, counts))
+            chapters[chapter_id] = book_id
+            self._write_chapters(chapters)
+        return {'tokens': int(counts.sum()), 'types': int(unique.size)}
+
+    def add_result(self, data, book_id=None):
+        """登记一个处理后的识别结果，章节ID为其 speech_results 的ID"""
+        chapter_id = data['speech_results'][0]['id']
+        return {'chapter': chapter_id, **self.add_chapter(chapter_id, tokens_of(data.get('words', [])),
+                                                          book_id or data.get('book_id'))}
+
+    def _remove_chapter(self, chapter_id, chapters):
+        if chapter_id not in chapters:
+            return
+        unique, counts = self._load(self._chapter_path(chapter_id)).reshape(2, -1)
+        self._save(self.vocab_dir / 'global.npy',
+                   _add_counts(self._load(self.vocab_dir / 'global.npy'), unique, counts, -1))
+        book_id = chapters.pop(chapter_id)
+        if book_id:
+            path = self._book_path(book_id)
+            self._save(path, _add_counts(self._load(path), unique, counts, -1))
+
+    def assign_book(self, chapter_id, book_id):
+        """把已登记的章节归入某本书（如对齐后得知所属章节），原有归属的计数随之移走"""
+        with self._locked():
+            chapters = self._read_chapters()
+            if chapter_id not in chapters:
+                raise KeyError(f"章节未登记：{chapter_id}")
+            previous = chapters[chapter_id]
+            if previous == book_id:
+                return
+            unique, counts = self._load(self._chapter_path(chapter_id)).reshape(2, -1)
+            if previous:
+                path = self._book_path(previous)
+                self._save(path, _add_counts(self._load(path), unique, counts, -1))
+            if book_id:
+                path = self._book_path(book_id)
+                self._save(path, _add_counts(self._load(path), unique, counts))
+            chapters[chapter_id] = book_id
+            self._write_chapters(chapters)
+
+    def set_known(self, user_id, words, replace=False):
+        """把词加入（replace 时替换为）用户的已掌握词集合，返回集合大小"""
+        with self._locked():
+            ids = self.ids([normalize(w) for w in words], create=True)
+            known = ids if replace else np.concatenate([self._load(self._user_path(user_id)), ids])
+            known = np.unique(known).astype(np.uint32)
+            self._save(self._user_path(user_id), known)
+        return int(known.size)
+
+    def forget(self, user_id, words):
+        with self._locked():
+            known = self._load(self._user_path(user_id))
+            known = np.setdiff1d(known, self.ids([normalize(w) for w in words]), assume_unique=True)
+            self._save(self._user_path(user_id), known.astype(np.uint32))
+        return int(known.size)
+
+    # ---------- 查询 ----------
+
+    def chapter_counts(self, chapter_id):
+        ids, counts = self._load(self._chapter_path(chapter_id)).reshape(2, -1)
+        return ids, counts.astype(np.int64)
+
+    def book_counts(self, book_id=None):
+        """某本书（None 为全局）的 (词ID, 次数)，只含出现过的词"""
+        path = self._book_path(book_id) if book_id else self.vocab_dir / 'global.npy'
+        total = self._load(path)
+        ids = np.flatnonzero(total).astype(np.uint32)
+        return ids, total[ids].astype(np.int64)
+
+    def top_words(self, book_id=None, n=100, level='lemma'):
+        """词频最高的 n 个词 [(词, 次数)]"""
+        ids, counts = self._to_level(*self.book_counts(book_id), level)
+        if ids.size > n:
+            top = np.argpartition(-counts, n)[:n]
+        else:
+            top = np.arange(ids.size)
+        top = top[np.lexsort((ids[top], -counts[top]))]
+        return list(zip(self.terms(ids[top].tolist()), counts[top].tolist()))
+
+    def known_mask(self, user_id, level='lemma'):
+        """按词ID索引的布尔数组：该词（或其原形）是否已掌握"""
+        known = self._load(self._user_path(user_id))
+        lemma_of = self.lemma_of()
+        if level == 'word' or not self._lemmas:
+            mask = np.zeros(lemma_of.size, dtype=bool)
+            mask[known] = True
+            return mask
+        # 掌握了某个词形即视为掌握其原形
+        known_lemmas = np.zeros(lemma_of.size, dtype=bool)
+        known_lemmas[lemma_of[known]] = True
+        return known_lemmas[lemma_of]
+
+    def coverage(self, user_id, chapter_id=None, book_id=None, level='lemma', known=None):
+        """章节（或书籍/全局）中已掌握词占全部词次的比例
+
+        返回 {'tokens', 'known_tokens', 'coverage', 'types', 'known_types', 'unknown_top'}
+        """
+        ids, counts = self.chapter_counts(chapter_id) if chapter_id else self.book_counts(book_id)
+        mask = self.known_mask(user_id, level) if known is None else known
+        hit = np.zeros(ids.size, dtype=bool)
+        inside = ids < mask.size
+        hit[inside] = mask[ids[inside]]
+        tokens = int(counts.sum())
+        known_tokens = int(counts[hit].sum())
+        unknown_ids, unknown_counts = self._to_level(ids[~hit], counts[~hit], level)
+        order = np.argsort(-unknown_counts, kind='stable')[:TOP_UNKNOWN]
+        return {
+            'tokens': tokens,
+            'known_tokens': known_tokens,
+            'coverage': known_tokens / tokens if tokens else 0.0,
+            'types': int(ids.size),
+            'known_types': int(hit.sum()),
+            'unknown_top': list(zip(self.terms(unknown_ids[order].tolist()), unknown_counts[order].tolist())),
+        }
+
+    def book_coverage(self, user_id, book_id, level='lemma'):
+        """书中每一章的覆盖率 {章节: 覆盖率}，已掌握集合只计算一次"""
+        mask = self.known_mask(user_id, level)
+        result = {}
+        for chapter_id, chapter_book in self._read_chapters().items():
+            if chapter_book != book_id:
+                continue
+            ids, counts = self.chapter_counts(chapter_id)
+            inside = ids < mask.size
+            tokens = counts.sum()
+            result[chapter_id] = float(counts[inside][mask[ids[inside]]].sum() / tokens) if tokens else 0.0
+        return result
+
+
+# 每个进程按目录复用一个索引
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(vocab_dir=None):
+    """取得进程内共享的词频索引；目录默认读取 SPEECH_VOCAB_DIR，原形表读取 SPEECH_LEMMA_FILE"""
+    vocab_dir = str(vocab_dir or os.getenv(VOCAB_DIR_ENV, DEFAULT_VOCAB_DIR))
+    with _indexes_lock:
+        index = _indexes.get(vocab_dir)
+        if index is None:
+            lemma_file = os.getenv(LEMMA_FILE_ENV)
+            index = _indexes[vocab_dir] = VocabularyIndex(vocab_dir, load_lemmas(lemma_file) if lemma_file else None)
+        return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='词汇频率与覆盖率索引')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--vocab_dir', help=f'索引目录（默认读取 {VOCAB_DIR_ENV}，未设置时为 {DEFAULT_VOCAB_DIR}）')
+    common.add_argument('--level', default='lemma', choices=['lemma', 'word'], help='按原形还是按词形统计')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('top', parents=[common], help='书籍（或全局）高频词')
+    p.add_argument('--book', help='书籍ID，不填为全局')
+    p.add_argument('-n', type=int, default=50, help='列出的词数')
+    p = subparsers.add_parser('assign', parents=[common], help='把章节归入书籍')
+    p.add_argument('chapter')
+    p.add_argument('book')
+    p = subparsers.add_parser('known', parents=[common], help='添加用户已掌握的词（从文件读取，每行一个）')
+    p.add_argument('user')
+    p.add_argument('file')
+    p.add_argument('--replace', action='store_true', help='替换而不是追加')
+    p = subparsers.add_parser('coverage', parents=[common], help='用户对章节/书籍的覆盖率')
+    p.add_argument('user')
+    p.add_argument('--chapter', help='章节ID')
+    p.add_argument('--book', help='书籍ID；不填 --chapter 时给出书中每章的覆盖率')
+    args = parser.parse_args()
+
+    index = get_index(args.vocab_dir)
+    if args.command == 'top':
+        for word, count in index.top_words(args.book, args.n, args.level):
+            print(f"{count:>8}  {word}")
+    elif args.command == 'assign':
+        index.assign_book(args.chapter, args.book)
+    elif args.command == 'known':
+        with open(args.file, 'r', encoding='utf-8') as f:
+            words = [line.strip() for line in f if line.strip()]
+        print(f"已掌握 {index.set_known(args.user, words, args.replace)} 个词")
+    elif args.chapter or not args.book:
+        report = index.coverage(args.user, args.chapter, args.book, args.level)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for chapter_id, value in sorted(index.book_coverage(args.user, args.book, args.level).items(),
+                                        key=lambda item: -item[1]):
+            print(f"{value:7.2%}  {chapter_id}")
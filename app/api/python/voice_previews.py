@@ -0,0 +1,249 @@
+# -*- coding: utf8 -*-
+# 音色试听文件批量转码：把 download_voice_demos.py 下载到 voice_demos/ 的 wav/mp3
+# 解码为单声道，按 ITU-R BS.1770 门限积分响度统一到同一响度，再编码成小体积的网页格式。
+# 按内容哈希跳过未变化的文件（文件大小和修改时间不变时沿用上次的哈希，不重复读取），
+# 用进程池并行处理；输出目录下的 manifest.json 记录每个文件的哈希、响度、增益和体积。
+# 输出保持原文件名、只换后缀，上传到 OSS 的 tts_voice_demos_web/ 后由
+# components/tts/VoiceSelector.tsx 播放（PREVIEW_DIR / PREVIEW_EXT 需与 --codec 一致）
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+from app.api.python.audio import iter_pcm_blocks
+from app.api.python.clips import CODECS, CLIP_SAMPLE_RATE, encode_clip, _to_s16le
+from app.api.python.peaks import AUDIO_EXTENSIONS
+
+DEFAULT_OUTPUT_DIR = 'voice_demos_web'
+MANIFEST_NAME = 'manifest.json'
+# 编码名 -> 输出文件后缀
+PREVIEW_SUFFIXES = {'mp3': '.mp3', 'opus': '.ogg', 'aac': '.aac'}
+DEFAULT_CODEC = 'mp3'
+# 目标响度（LUFS）和峰值上限（dBFS），与常见网页/播客音频一致
+TARGET_LUFS = -16.0
+PEAK_CEILING_DB = -1.0
+# 增益上限，避免把几乎无声的文件连同底噪一起放大
+MAX_GAIN_DB = 24.0
+# BS.1770 门限积分：400ms 块、75% 重叠，绝对门限 -70 LUFS，相对门限 -10 LU
+BLOCK_SECONDS = 0.4
+STEP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _biquad_response(b, a, w):
+    z = np.exp(-1j * w)
+    return np.abs(b[0] + b[1] * z + b[2] * z * z) / np.abs(a[0] + a[1] * z + a[2] * z * z)
+
+
+def k_weighting(sample_rate, n_bins):
+    """K 计权滤波器（高架 + 高通两级）在 rfft 各频点上的幅度响应，系数按采样率重新设计"""
+    w = np.linspace(0, np.pi, n_bins)
+    # 第一级：约 1.7kHz 以上 +4dB 的高架滤波
+    gain_db, f0, q = 3.999843853973347, 1681.974450955533, 0.7071752369554196
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * f0 / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    cos, root = np.cos(w0), 2 * np.sqrt(A) * alpha
+    shelf_b = (A * ((A + 1) + (A - 1) * cos + root), -2 * A * ((A - 1) + (A + 1) * cos),
+               A * ((A + 1) + (A - 1) * cos - root))
+    shelf_a = ((A + 1) - (A - 1) * cos + root, 2 * ((A - 1) - (A + 1) * cos), (A + 1) - (A - 1) * cos - root)
+    # 第二级：约 38Hz 的高通
+    f0, q = 38.13547087602444, 0.5003270373238773
+    w0 = 2 * np.pi * f0 / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    cos = np.cos(w0)
+    pass_b = ((1 + cos) / 2, -(1 + cos), (1 + cos) / 2)
+    pass_a = (1 + alpha, -2 * cos, 1 - alpha)
+    return _biquad_response(shelf_b, shelf_a, w) * _biquad_response(pass_b, pass_a, w)
+
+
+def integrated_loudness(samples, sample_rate):
+    """门限积分响度（LUFS）；K 计权在频域一次完成，分块能量用前缀和一次算出，全程无逐块循环
+
+    静音返回 -inf
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if not samples.size:
+        return float('-inf')
+    spectrum = np.fft.rfft(samples)
+    weighted = np.fft.irfft(spectrum * k_weighting(sample_rate, spectrum.size), samples.size)
+    block = int(BLOCK_SECONDS * sample_rate)
+    step = int(STEP_SECONDS * sample_rate)
+    if weighted.size < block:
+        power = np.array([np.mean(weighted ** 2)])
+    else:
+        energy = np.concatenate([[0.0], np.cumsum(weighted ** 2)])
+        starts = np.arange(0, weighted.size - block + 1, step)
+        power = (energy[starts + block] - energy[starts]) / block
+    loudness = -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+    gated = loudness > ABSOLUTE_GATE_LUFS
+    if not gated.any():
+        return float('-inf')
+    relative = -0.691 + 10 * np.log10(power[gated].mean()) + RELATIVE_GATE_LU
+    gated &= loudness > relative
+    return float(-0.691 + 10 * np.log10(power[gated].mean()))
+
+
+def normalization_gain(loudness, peak, target_lufs=TARGET_LUFS, ceiling_db=PEAK_CEILING_DB):
+    """把响度拉到目标所需的增益（dB），且增益后峰值不超过上限、增益不超过 MAX_GAIN_DB；静音不调整
+
+    loudness/peak 可以是单个值或数组（一次算完一批文件）
+    """
+    loudness = np.asarray(loudness, dtype=np.float64)
+    peak = np.asarray(peak, dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        headroom = ceiling_db - 20 * np.log10(peak)
+    gain = np.minimum(np.minimum(target_lufs - loudness, headroom), MAX_GAIN_DB)
+    return np.where(np.isfinite(loudness) & (peak > 0), gain, 0.0)
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcode_preview(source, target, codec=DEFAULT_CODEC, target_lufs=TARGET_LUFS,
+                      sample_rate=CLIP_SAMPLE_RATE):
+    """解码、响度归一化并编码一个试听文件，返回 {响度, 增益, 时长, 字节数}"""
+    blocks = list(iter_pcm_blocks(source, sample_rate))
+    samples = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    loudness = integrated_loudness(samples, sample_rate)
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    gain_db = float(normalization_gain(loudness, peak, target_lufs))
+    data = encode_clip(_to_s16le(samples * np.float32(10 ** (gain_db / 20))), sample_rate, codec)
+
+    target = Path(target)
+    tmp_path = target.with_name(target.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, target)
+    return {'loudness': round(loudness, 2) if np.isfinite(loudness) else None, 'gain_db': round(gain_db, 2),
+            'duration': round(samples.size / sample_rate, 3), 'bytes_out': len(data)}
+
+
+class PreviewManifest:
+    """输出目录下的处理记录：相对路径 -> {sha1, size, mtime_ns, settings, output, ...}"""
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / MANIFEST_NAME
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def digest(self, name, source):
+        """文件大小和修改时间与记录一致时沿用记录的哈希，否则重新计算"""
+        stat = source.stat()
+        entry = self.entries.get(name)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry['sha1'], stat
+        return file_digest(source), stat
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def build_directory(demo_dir, output_dir=DEFAULT_OUTPUT_DIR, codec=DEFAULT_CODEC, target_lufs=TARGET_LUFS,
+                    workers=None, force=False):
+    """用进程池转码目录下全部试听文件，内容和参数都未变化的跳过；输入已删除的，删除其输出
+
+    返回 (转码数, 跳过数, 失败列表)
+    """
+    if codec not in PREVIEW_SUFFIXES:
+        raise ValueError(f"不支持的编码：{codec}，可选 {', '.join(PREVIEW_SUFFIXES)}")
+    demo_dir = Path(demo_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = PreviewManifest(output_dir)
+    settings = {'codec': codec, 'bitrate': CODECS[codec][2], 'sample_rate': CLIP_SAMPLE_RATE,
+                'target_lufs': target_lufs}
+
+    jobs = []
+    skipped = 0
+    seen = set()
+    for source in sorted(demo_dir.rglob('*')):
+        if source.suffix.lower() not in AUDIO_EXTENSIONS or not source.is_file():
+            continue
+        name = source.relative_to(demo_dir).as_posix()
+        seen.add(name)
+        sha1, stat = manifest.digest(name, source)
+        target = output_dir / source.relative_to(demo_dir).with_suffix(PREVIEW_SUFFIXES[codec])
+        entry = manifest.entries.get(name)
+        if (not force and entry and entry['sha1'] == sha1 and entry.get('settings') == settings
+                and (output_dir / entry['output']).exists()):
+            # 只有修改时间变了：更新记录，不重新转码
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            skipped += 1
+            continue
+        if entry and entry['output'] != target.relative_to(output_dir).as_posix():
+            # 换了编码：旧格式的输出不再有用
+            (output_dir / entry['output']).unlink(missing_ok=True)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        jobs.append((name, source, target, {'sha1': sha1, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                            'settings': settings,
+                                            'output': target.relative_to(output_dir).as_posix()}))
+
+    for name in [n for n in manifest.entries if n not in seen]:
+        (output_dir / manifest.entries.pop(name)['output']).unlink(missing_ok=True)
+
+    built = 0
+    failed = []
+    start = time.time()
+    try:
+        if jobs:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(transcode_preview, str(source), str(target), codec, target_lufs): (name, record)
+                           for name, source, target, record in jobs}
+                for n, future in enumerate(as_completed(futures), 1):
+                    name, record = futures[future]
+                    try:
+                        manifest.entries[name] = {**record, **future.result(), 'bytes_in': record['size']}
+                        built += 1
+                    except Exception as e:
+                        failed.append((name, str(e)))
+                    rate = n / max(time.time() - start, 1e-6)
+                    print(f"[{n}/{len(jobs)}] {rate:.1f} 个/秒，失败 {len(failed)}", file=sys.stderr)
+    finally:
+        manifest.save()
+    return built, skipped, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='音色试听文件批量转码和响度归一化')
+    parser.add_argument('demo_dir', nargs='?', default='voice_demos', help='试听文件目录')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='输出目录')
+    parser.add_argument('--codec', choices=sorted(PREVIEW_SUFFIXES), default=DEFAULT_CODEC, help='输出编码')
+    parser.add_argument('--target', type=float, default=TARGET_LUFS, help='目标响度（LUFS）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='进程数')
+    parser.add_argument('--force', action='store_true', help='重新转码全部文件')
+    args = parser.parse_args()
+
+    built, skipped, failed = build_directory(args.demo_dir, args.output, args.codec, args.target,
+                                             args.workers, args.force)
+    for name, error in failed:
+        print(f"失败：{name}：{error}", file=sys.stderr)
+    entries = PreviewManifest(args.output).entries.values()
+    bytes_in = sum(e['bytes_in'] for e in entries)
+    bytes_out = sum(e['bytes_out'] for e in entries)
+    print(f"转码 {built} 个，跳过 {skipped} 个，失败 {len(failed)} 个；"
+          f"共 {bytes_in / 1048576:.1f} MB → {bytes_out / 1048576:.1f} MB")
+    sys.exit(1 if failed else 0)
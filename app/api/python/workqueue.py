@@ -0,0 +1,441 @@
+# -*- coding: utf8 -*-
+# 基于租约的任务队列：worker 领取任务时获得一段时间的租约，处理期间定时心跳续约，
+# 租约过期（worker 崩溃或失联）后任务自动重新可见，由其他 worker 接手。
+# 单机使用 SQLite 文件，多机共享时使用 Postgres（需安装 psycopg）。
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+import uuid
+from pathlib import Path
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
+sys.path.append(parent_dir)
+
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# 默认租约时长（秒），心跳间隔为其三分之一
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 3
+# 失败重试的退避基数（秒），第 n 次失败后延迟 base * 2^(n-1)
+RETRY_BACKOFF_SECONDS = 10
+# 租约过期时已达最大尝试次数（worker 每次处理都崩溃或被杀）的任务直接置为failed，不再无限重领
+LEASE_EXPIRED_ERROR = '租约过期且已达最大尝试次数（worker 崩溃或失联）'
+
+_COLUMNS = ('id', 'kind', 'payload', 'status', 'attempts', 'max_attempts',
+            'lease_owner', 'lease_expires', 'available_at', 'error', 'result',
+            'created_at', 'updated_at')
+
+
+def _row_to_job(row):
+    job = dict(zip(_COLUMNS, row))
+    job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+class SQLiteQueue:
+    """单机队列，多个进程可通过同一个 SQLite 文件共享"""
+
+    def __init__(self, path="results/queue.db"):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS work_queue (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                available_at REAL NOT NULL,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS work_queue_ready '
+                           'ON work_queue (status, available_at)')
+
+    def enqueue(self, kind, payload, max_attempts=DEFAULT_MAX_ATTEMPTS, delay=0):
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO work_queue (id, kind, payload, status, max_attempts, available_at, '
+                'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), STATUS_PENDING,
+                 max_attempts, now + delay, now, now))
+        return job_id
+
+    def _sweep(self, now):
+        return self._conn.execute(
+            'UPDATE work_queue SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, '
+            'updated_at = ? WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts',
+            (STATUS_FAILED, LEASE_EXPIRED_ERROR, now, STATUS_LEASED, now)).rowcount
+
+    def sweep(self):
+        """把租约已过期且次数用尽的任务置为failed，返回处理的任务数"""
+        with self._lock:
+            return self._sweep(time.time())
+
+    def lease(self, worker_id, kinds=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """领取一个可执行的任务（待处理或租约已过期且未用尽次数），没有时返回None"""
+        now = time.time()
+        kind_filter = ''
+        params = [STATUS_PENDING, now, STATUS_LEASED, now]
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._sweep(now)
+                row = self._conn.execute(
+                    'SELECT id FROM work_queue WHERE ((status = ? AND available_at <= ?) '
+                    'OR (status = ? AND lease_expires < ? AND attempts < max_attempts))' + kind_filter +
+                    ' ORDER BY available_at LIMIT 1', params).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+                self._conn.execute(
+                    'UPDATE work_queue SET status = ?, lease_owner = ?, lease_expires = ?, '
+                    'attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                    (STATUS_LEASED, worker_id, now + lease_seconds, now, row[0]))
+                job = self._conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM work_queue WHERE id = ?", (row[0],)).fetchone()
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return _row_to_job(job)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """续约，返回False表示租约已丢失（已被其他worker接手）"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE work_queue SET lease_expires = ?, updated_at = ? '
+                'WHERE id = ? AND status = ? AND lease_owner = ?',
+                (now + lease_seconds, now, job_id, STATUS_LEASED, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE work_queue SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL, '
+                'updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?',
+                (STATUS_DONE, json.dumps(result, ensure_ascii=False, default=str), now,
+                 job_id, STATUS_LEASED, worker_id))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """标记失败：未超过最大次数时按指数退避重新排队，否则置为failed"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE work_queue SET '
+                'status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, '
+                'available_at = ? + ? * (1 << (attempts - 1)), '
+                'error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? '
+                'WHERE id = ? AND status = ? AND lease_owner = ?',
+                (STATUS_PENDING, STATUS_FAILED, now, RETRY_BACKOFF_SECONDS, str(error), now,
+                 job_id, STATUS_LEASED, worker_id))
+        return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM work_queue WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT kind, status, COUNT(*) FROM work_queue GROUP BY kind, status').fetchall()
+        return [{'kind': k, 'status': s, 'count': c} for k, s, c in rows]
+
+
+class PostgresQueue:
+    """多机共享队列，领取任务使用 FOR UPDATE SKIP LOCKED，避免worker之间互相阻塞"""
+
+    def __init__(self, dsn, pool_size=4):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise RuntimeError("使用Postgres队列需要安装 psycopg[binary] 和 psycopg_pool")
+        self.pool = ConnectionPool(dsn, min_size=1, max_size=pool_size, open=True)
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS work_queue (
+                    id uuid PRIMARY KEY,
+                    kind text NOT NULL,
+                    payload jsonb NOT NULL,
+                    status text NOT NULL,
+                    attempts integer NOT NULL DEFAULT 0,
+                    max_attempts integer NOT NULL,
+                    lease_owner text,
+                    lease_expires double precision,
+                    available_at double precision NOT NULL,
+                    error text,
+                    result jsonb,
+                    created_at double precision NOT NULL,
+                    updated_at double precision NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS work_queue_ready ON work_queue (status, available_at)')
+
+    def _select(self, conn, job_id):
+        row = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM work_queue WHERE id = %s", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job['id'] = str(job['id'])
+        return job
+
+    def enqueue(self, kind, payload, max_attempts=DEFAULT_MAX_ATTEMPTS, delay=0):
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute(
+                'INSERT INTO work_queue (id, kind, payload, status, max_attempts, available_at, '
+                'created_at, updated_at) VALUES (%s, %s, %s::jsonb, %s, %s, %s, %s, %s)',
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), STATUS_PENDING,
+                 max_attempts, now + delay, now, now))
+        return job_id
+
+    def _sweep(self, conn, now):
+        return conn.execute(
+            'UPDATE work_queue SET status = %s, error = %s, lease_owner = NULL, lease_expires = NULL, '
+            'updated_at = %s WHERE status = %s AND lease_expires < %s AND attempts >= max_attempts',
+            (STATUS_FAILED, LEASE_EXPIRED_ERROR, now, STATUS_LEASED, now)).rowcount
+
+    def sweep(self):
+        with self.pool.connection() as conn:
+            return self._sweep(conn, time.time())
+
+    def lease(self, worker_id, kinds=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        kind_filter = ' AND kind = ANY(%s)' if kinds else ''
+        params = [STATUS_PENDING, now, STATUS_LEASED, now] + ([list(kinds)] if kinds else [])
+        with self.pool.connection() as conn:
+            self._sweep(conn, now)
+            row = conn.execute(
+                'UPDATE work_queue SET status = %s, lease_owner = %s, lease_expires = %s, '
+                'attempts = attempts + 1, updated_at = %s WHERE id = ('
+                'SELECT id FROM work_queue WHERE ((status = %s AND available_at <= %s) '
+                'OR (status = %s AND lease_expires < %s AND attempts < max_attempts))' + kind_filter +
+                ' ORDER BY available_at LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING id',
+                [STATUS_LEASED, worker_id, now + lease_seconds, now] + params).fetchone()
+            return self._select(conn, row[0]) if row else None
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                'UPDATE work_queue SET lease_expires = %s, updated_at = %s '
+                'WHERE id = %s AND status = %s AND lease_owner = %s',
+                (now + lease_seconds, now, job_id, STATUS_LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        now = time.time()
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                'UPDATE work_queue SET status = %s, result = %s::jsonb, lease_owner = NULL, lease_expires = NULL, '
+                'updated_at = %s WHERE id = %s AND status = %s AND lease_owner = %s',
+                (STATUS_DONE, json.dumps(result, ensure_ascii=False, default=str), now,
+                 job_id, STATUS_LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        now = time.time()
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                'UPDATE work_queue SET '
+                'status = CASE WHEN attempts < max_attempts THEN %s ELSE %s END, '
+                'available_at = %s + %s * power(2, attempts - 1), '
+                'error = %s, lease_owner = NULL, lease_expires = NULL, updated_at = %s '
+                'WHERE id = %s AND status = %s AND lease_owner = %s',
+                (STATUS_PENDING, STATUS_FAILED, now, RETRY_BACKOFF_SECONDS, str(error), now,
+                 job_id, STATUS_LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self.pool.connection() as conn:
+            return self._select(conn, job_id)
+
+    def stats(self):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT kind, status, COUNT(*) FROM work_queue GROUP BY kind, status').fetchall()
+        return [{'kind': k, 'status': s, 'count': c} for k, s, c in rows]
+
+
+def open_queue(url):
+    """按地址选择队列后端：sqlite:///path/to/queue.db 或 postgresql://..."""
+    if url.startswith('postgres://') or url.startswith('postgresql://'):
+        return PostgresQueue(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteQueue(url[len('sqlite:///'):])
+    return SQLiteQueue(url)
+
+
+def _handle_transcribe(payload):
+    from app.api.python.speech import fileTrans, load_env
+    load_env()
+    result = fileTrans(
+        os.getenv('ALIYUN_AK_ID'), os.getenv('ALIYUN_AK_SECRET'), os.getenv('NLS_APP_KEY'),
+        payload['audio_url'],
+        storage_format=payload.get('format', 'json'),
+        vad=payload.get('vad', False),
+        id_strategy=payload.get('id_strategy', 'deterministic'),
+        profile=payload.get('profile')
+    )
+    return {'taskId': result['taskId'], 'sentences': len(result['results'])}
+
+
+def _load_saved(storage, task_id):
+    data = storage.load(task_id)
+    if data is None:
+        raise RuntimeError(f"找不到任务 {task_id} 已保存的结果")
+    return data
+
+
+def _handle_postprocess(payload):
+    """按已保存的识别结果重新做时间戳修正、句子关联并保存为指定格式（不重新识别）"""
+    from app.api.python.storage import ResultStorage
+    storage = ResultStorage(payload.get('results_dir', 'results'),
+                            id_strategy=payload.get('id_strategy', 'deterministic'))
+    data = _load_saved(storage, payload['task_id'])
+    # 保存的JSON中 words 已是处理后的格式，还原为接口返回的字段
+    data['words'] = [{'Word': w['word'], 'BeginTime': w['begin_time'], 'EndTime': w['end_time']}
+                     for w in data.get('words', [])]
+    storage.save(data, format=payload.get('format', 'json'))
+    return {'taskId': payload['task_id'], 'sentences': len(data.get('results', []))}
+
+
+def _handle_store(payload):
+    """把已处理的结果原样（保留ID）写入数据库、全文索引或词频索引，如 format=postgres"""
+    from app.api.python.storage import ResultStorage
+    storage = ResultStorage(payload.get('results_dir', 'results'))
+    saved = storage.save_processed(_load_saved(storage, payload['task_id']), format=payload['format'])
+    return {'taskId': payload['task_id'], 'saved': saved}
+
+
+def _handle_reprocess(payload):
+    from app.api.python.reprocess import _process_chunk
+    results_dir = payload.get('results_dir', 'results')
+    outcomes = _process_chunk(payload['action'], [payload['name']],
+                              payload.get('output_dir') or results_dir, results_dir)
+    name, error = outcomes[0]
+    if error:
+        raise RuntimeError(error)
+    return {'name': name}
+
+
+# 任务类型 -> 处理函数（payload -> 可JSON序列化的结果）
+# 识别、后处理和入库可拆成独立任务由不同的worker领取：例如 transcribe 只保存 json，
+# 再为同一 task_id 提交 store（format=postgres）交给能连数据库的worker
+HANDLERS = {
+    'transcribe': _handle_transcribe,
+    'postprocess': _handle_postprocess,
+    'store': _handle_store,
+    'reprocess': _handle_reprocess,
+}
+
+
+class Worker:
+    """循环领取并执行任务，处理期间由后台线程定时心跳续约"""
+
+    def __init__(self, queue, handlers=None, worker_id=None, kinds=None,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=2.0):
+        self.queue = queue
+        self.handlers = handlers or HANDLERS
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.kinds = list(kinds or self.handlers)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat(self, job_id, done):
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job_id, self.worker_id, self.lease_seconds):
+                break
+
+    def run_once(self):
+        """领取并执行一个任务，没有任务时返回False"""
+        job = self.queue.lease(self.worker_id, self.kinds, self.lease_seconds)
+        if job is None:
+            return False
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job['id'], done), daemon=True)
+        beat.start()
+        try:
+            result = self.handlers[job['kind']](job['payload'])
+        except Exception as e:
+            done.set()
+            self.queue.fail(job['id'], self.worker_id, e)
+        else:
+            done.set()
+            self.queue.complete(job['id'], self.worker_id, result)
+        beat.join()
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='转写任务队列')
+    parser.add_argument('--queue', default=os.getenv('SPEECH_QUEUE_URL', 'sqlite:///results/queue.db'),
+                        help='队列地址：sqlite:///path 或 postgresql://...')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    worker_parser = sub.add_parser('worker', help='启动worker')
+    worker_parser.add_argument('--kinds', help='只处理这些任务类型，逗号分隔')
+    worker_parser.add_argument('--lease_seconds', type=int, default=DEFAULT_LEASE_SECONDS)
+
+    enqueue_parser = sub.add_parser('enqueue', help='提交任务')
+    enqueue_parser.add_argument('kind', choices=sorted(HANDLERS))
+    enqueue_parser.add_argument('payload', help='任务参数JSON')
+
+    sub.add_parser('stats', help='查看队列统计')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue)
+    if args.command == 'worker':
+        kinds = args.kinds.split(',') if args.kinds else None
+        worker = Worker(queue, kinds=kinds, lease_seconds=args.lease_seconds)
+        print(f"worker {worker.worker_id} 已启动，任务类型：{', '.join(worker.kinds)}", file=sys.stderr)
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+    elif args.command == 'enqueue':
+        print(queue.enqueue(args.kind, json.loads(args.payload)))
+    else:
+        print(json.dumps(queue.stats(), ensure_ascii=False))
@@ -18,6 +18,15 @@ interface VoiceSelectorProps {
   onClose: () => void;
 }
 
+// 试听音频的OSS CDN地址
+const OSS_DOMAIN = 'https://assets.lingflow.cn';
+// 网页试听：voice_previews.py 把 voice_demos/ 转码并统一响度后输出到 voice_demos_web/，上传到该目录；
+// 文件名与原始试听相同，后缀统一为转码格式（默认 mp3）
+const PREVIEW_DIR = 'tts_voice_demos_web';
+const PREVIEW_EXT = '.mp3';
+// 原始试听文件（wav/mp3），网页试听不存在时回退
+const ORIGINAL_DEMO_DIR = 'tts_voice_demos';
+
 // 分类图标映射
 const categoryIcons: Record<string, React.ReactNode> = {
   '多情感': <Sparkles className="w-3.5 h-3.5" />,
@@ -197,7 +206,6 @@ export function VoiceSelector({ selectedVoice, onSelect, onClose }: VoiceSelecto
     }
     
     // 构建OSS CDN URL
-    const OSS_DOMAIN = 'https://assets.lingflow.cn';
     let demoUrl: string;
     let fileName: string;
     
@@ -228,7 +236,7 @@ export function VoiceSelector({ selectedVoice, onSelect, onClose }: VoiceSelecto
     // 处理文件名（移除特殊字符）
     fileName = fileName.replace(/[<>:"/\\|?*]/g, '_');
     
-    // 判断文件扩展名（日西语音色可能是wav，通过demoUrls判断）
+    // 判断原始文件的扩展名（日西语音色可能是wav，通过demoUrls判断）
     let ext = '.mp3';
     if (voiceInfo.demoUrls && voiceInfo.demoUrls[demoIndex]) {
       const demoInfo = voiceInfo.demoUrls[demoIndex];
@@ -244,8 +252,9 @@ export function VoiceSelector({ selectedVoice, onSelect, onClose }: VoiceSelecto
       ext = '.wav';
     }
     
-    // 构建完整URL
-    demoUrl = `${OSS_DOMAIN}/tts_voice_demos/${fileName}${ext}`;
+    // 构建完整URL：优先用转码后的网页试听，原始文件作为回退
+    demoUrl = `${OSS_DOMAIN}/${PREVIEW_DIR}/${fileName}${PREVIEW_EXT}`;
+    const originalUrl = `${OSS_DOMAIN}/${ORIGINAL_DEMO_DIR}/${fileName}${ext}`;
     
     // 设置新的播放状态和试听文本
     setPlayingVoice(playKey);
@@ -295,43 +304,55 @@ export function VoiceSelector({ selectedVoice, onSelect, onClose }: VoiceSelecto
       }
     }
     
-    try {
-      // 创建音频对象并播放
-      const audio = new Audio(demoUrl);
-      
-      audio.onended = () => {
-        setPlayingVoice('');
-        setCurrentAudio(null);
-        setDemoText('');
-        setAudioLevel(0);
-        setTooltipPosition(null);
-        stopAudioAnalysis();
-      };
-      
+    const resetPreview = () => {
+      setPlayingVoice('');
+      setCurrentAudio(null);
+      setDemoText('');
+      setAudioLevel(0);
+      setTooltipPosition(null);
+      stopAudioAnalysis();
+    };
+    
+    // 在 play() 之前登记为当前音频并挂好回调，加载中的试听也能被停止，不会两个同时播放
+    const createAudio = (src: string) => {
+      const audio = new Audio(src);
+      audio.onended = resetPreview;
       audio.onerror = () => {
-        console.warn(`音色 ${voiceInfo.name} 的试听音频无法播放: ${demoUrl}`);
-        setPlayingVoice('');
-        setCurrentAudio(null);
-        setDemoText('');
-        setAudioLevel(0);
-        setTooltipPosition(null);
-        stopAudioAnalysis();
+        // 加载失败由下面 play() 的异常处理（网页试听不可用时改放原始文件），这里只处理播放中途出错
+        if (audio.readyState === HTMLMediaElement.HAVE_NOTHING) {
+          return;
+        }
+        console.warn(`音色 ${voiceInfo.name} 的试听音频无法播放: ${audio.src}`);
+        resetPreview();
       };
-      
       setCurrentAudio(audio);
-      await audio.play();
+      return audio;
+    };
+    
+    try {
+      // 创建音频对象并播放；网页试听不存在（尚未上传或转码失败）时改放原始文件
+      let audio = createAudio(demoUrl);
+      try {
+        await audio.play();
+      } catch (error) {
+        if (!(error instanceof DOMException && error.name === 'NotSupportedError')) {
+          throw error;
+        }
+        console.warn(`音色 ${voiceInfo.name} 的网页试听不可用，改用原始文件: ${originalUrl}`);
+        audio = createAudio(originalUrl);
+        await audio.play();
+      }
       
       // 设置音频分析
       setupAudioAnalysis(audio);
       
     } catch (error) {
+      // 加载中被停止或切换到其他音色：播放状态已由停止的一方处理
+      if (error instanceof DOMException && error.name === 'AbortError') {
+        return;
+      }
       console.warn(`播放音色 ${voiceInfo.name} 试听失败:`, error);
-      setPlayingVoice('');
-      setCurrentAudio(null);
-      setDemoText('');
-      setAudioLevel(0);
-      setTooltipPosition(null);
-      stopAudioAnalysis();
+      resetPreview();
     }
   };
 